@@ -0,0 +1,186 @@
+import functools
+import os
+import struct
+from array import array
+import pygame
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+FONT_PATH = os.path.join(ROOT, "fonts", "8-bit-wonder.ttf")
+MEDIA_PATH = os.path.join(ROOT, "media")
+CACHE_PATH = os.path.join(MEDIA_PATH, ".cache")
+SPLASH_PATH = os.path.join(MEDIA_PATH, "splash.gif")
+MUSIC_PATH = os.path.join(MEDIA_PATH, "intro_music.mp3")
+ARENA_PATH = os.path.join(MEDIA_PATH, "arenas")
+TROPHY_SIZE = (30, 30)
+SPLASH_WIDTH = 300
+STRIKE_PEAK = 0.7  # Fraction of full scale every strike sound is normalized to
+SILENCE_THRESHOLD = 0.02  # Leading samples quieter than this part of the peak are cut
+
+# Magic, frame count, frame width, frame height, source mtime and source size
+SPLASH_HEADER = struct.Struct("<4sIIIdQ")
+SPLASH_MAGIC = b"PSPL"
+
+
+@functools.lru_cache(maxsize=None)
+def font(size):
+    """
+    Return the game font at the given size, shared by every caller.
+    """
+    return pygame.font.Font(FONT_PATH, size)
+
+
+@functools.lru_cache(maxsize=None)
+def strike_sounds():
+    return [
+        _prepared_sound(os.path.join(MEDIA_PATH, f"strike_{i}.wav"))
+        for i in range(1, 4)
+    ]
+
+
+def _prepared_sound(path):
+    """
+    Load a sound normalized to STRIKE_PEAK with its leading silence cut.
+
+    The strikes were recorded at very different levels, and strike_3 starts
+    with almost 40ms of silence that would add straight to the hit's latency.
+    """
+    sound = pygame.mixer.Sound(path)
+    _, size, channels = pygame.mixer.get_init()
+    if size != -16:
+        return sound
+    samples = array("h")
+    samples.frombytes(sound.get_raw())
+    peak = max(map(abs, samples), default=0)
+    if not peak:
+        return sound
+    threshold = peak * SILENCE_THRESHOLD
+    start = next(i for i, sample in enumerate(samples) if abs(sample) > threshold)
+    start -= start % channels
+    scale = STRIKE_PEAK * 32767 / peak
+    prepared = array("h", (int(sample * scale) for sample in samples[start:]))
+    return pygame.mixer.Sound(buffer=prepared.tobytes())
+
+
+@functools.lru_cache(maxsize=None)
+def trophy_image():
+    try:
+        image = pygame.image.load(os.path.join(MEDIA_PATH, "trophy.jpg"))
+        return pygame.transform.scale(image, TROPHY_SIZE)
+    except pygame.error:
+        image = pygame.Surface(TROPHY_SIZE)
+        image.fill((255, 215, 0))
+        return image
+
+
+def arena_names():
+    """
+    :return: Sorted names of the arenas shipped in media/arenas
+    """
+    return sorted(
+        os.path.splitext(name)[0]
+        for name in os.listdir(ARENA_PATH)
+        if name.endswith(".json")
+    )
+
+
+def arena_path(arena):
+    """
+    :param arena: Name of a shipped arena or path to an arena file
+    """
+    if os.path.isfile(arena):
+        return arena
+    return os.path.join(ARENA_PATH, arena + ".json")
+
+
+def play_music():
+    # Streamed from disk instead of decoding the whole file into a Sound
+    pygame.mixer.music.load(MUSIC_PATH)
+    pygame.mixer.music.play(-1)
+
+
+def stop_music():
+    pygame.mixer.music.stop()
+
+
+@functools.lru_cache(maxsize=None)
+def splash_frames(width=SPLASH_WIDTH):
+    """
+    Return the splash animation frames scaled to the given width.
+
+    Scaled frames are kept as raw RGBA in media/.cache so later starts read them
+    in one go instead of decoding the GIF. The cache is rebuilt whenever the GIF
+    changes.
+    """
+    source = os.stat(SPLASH_PATH)
+    cache_path = os.path.join(CACHE_PATH, f"splash_{width}.bin")
+    frames = _read_splash_cache(cache_path, source)
+    if frames is None:
+        frames = _decode_splash(width)
+        _write_splash_cache(cache_path, source, frames)
+    return [frame.convert_alpha() for frame in frames]
+
+
+def _read_splash_cache(cache_path, source):
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < SPLASH_HEADER.size:
+        return None
+    magic, count, width, height, mtime, size = SPLASH_HEADER.unpack_from(data)
+    frame_bytes = width * height * 4
+    if (
+        magic != SPLASH_MAGIC
+        or mtime != source.st_mtime
+        or size != source.st_size
+        or len(data) != SPLASH_HEADER.size + count * frame_bytes
+    ):
+        return None
+    view = memoryview(data)
+    return [
+        pygame.image.frombuffer(
+            view[offset : offset + frame_bytes], (width, height), "RGBA"
+        )
+        for offset in range(SPLASH_HEADER.size, len(data), frame_bytes)
+    ]
+
+
+def _decode_splash(width):
+    from PIL import Image, ImageSequence
+
+    gif = Image.open(SPLASH_PATH)
+    height = int(width / (gif.width / gif.height))
+    return [
+        pygame.transform.scale(
+            pygame.image.fromstring(
+                frame.convert("RGBA").tobytes(), frame.size, "RGBA"
+            ),
+            (width, height),
+        )
+        for frame in ImageSequence.Iterator(gif)
+    ]
+
+
+def _write_splash_cache(cache_path, source, frames):
+    width, height = frames[0].get_size()
+    temp_path = cache_path + ".tmp"
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        with open(temp_path, "wb") as f:
+            f.write(
+                SPLASH_HEADER.pack(
+                    SPLASH_MAGIC,
+                    len(frames),
+                    width,
+                    height,
+                    source.st_mtime,
+                    source.st_size,
+                )
+            )
+            for frame in frames:
+                f.write(pygame.image.tobytes(frame, "RGBA"))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # A read-only install just decodes the GIF every time
+        pass
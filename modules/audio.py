@@ -0,0 +1,86 @@
+import time
+import random
+from collections import deque
+import pygame
+from modules import assets
+
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER = 256  # Samples per mix; pygame's default of 512 adds about 6ms
+STRIKE_CHANNELS = 4
+LATENCY_SAMPLES = 256  # Strikes kept for the latency summary
+
+
+def pre_init(buffer_size=MIXER_BUFFER, frequency=MIXER_FREQUENCY):
+    """
+    Set up the mixer for low latency; must run before pygame.init().
+    """
+    pygame.mixer.pre_init(frequency, -16, 2, buffer_size)
+
+
+class AudioEngine:
+    """
+    Plays strike sounds on a pool of reserved mixer channels.
+
+    The strike channels are reserved, so nothing else can take them. When all
+    of them are busy, the one whose sound started earliest is cut off, so a new
+    hit is never dropped. Music streams through pygame.mixer.music and never
+    uses a channel.
+
+    Each play records an estimate of the event-to-playback latency: the time
+    since the game event plus one mixer buffer of output delay. It is not a
+    measurement; the driver's and device's own buffering, which pygame doesn't
+    report, comes on top.
+
+    :param buffer_size: Mixer buffer the mixer was opened with, in samples
+    :param strike_channels: Number of channels reserved for strikes
+    """
+
+    def __init__(self, buffer_size=MIXER_BUFFER, strike_channels=STRIKE_CHANNELS):
+        pygame.mixer.set_num_channels(
+            max(pygame.mixer.get_num_channels(), strike_channels)
+        )
+        pygame.mixer.set_reserved(strike_channels)
+        self.channels = [pygame.mixer.Channel(i) for i in range(strike_channels)]
+        self.started = [0.0] * strike_channels
+        frequency = pygame.mixer.get_init()[0]
+        self.output_ms = buffer_size / frequency * 1000
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.cut_off = 0
+
+    def play_strike(self, event_time=None):
+        """
+        :param event_time: time.perf_counter() when the hit happened, if known
+        """
+        index = next(
+            (i for i, channel in enumerate(self.channels) if not channel.get_busy()),
+            None,
+        )
+        if index is None:
+            index = self.started.index(min(self.started))
+            self.cut_off += 1
+        self.channels[index].play(random.choice(assets.strike_sounds()))
+        self.started[index] = time.perf_counter()
+        waited = (time.perf_counter() - event_time) * 1000 if event_time else 0
+        self.latencies.append(waited + self.output_ms)
+
+    def latency_summary(self):
+        """
+        :return: Dict with p50, p95 and max estimated latency in ms, or {}
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)],
+            "max": latencies[-1],
+        }
+
+    def overlay_lines(self):
+        summary = self.latency_summary()
+        if not summary:
+            return []
+        return [
+            f"audio est. p50 {summary['p50']:.1f}  p95 {summary['p95']:.1f} ms",
+            f"audio cut off {self.cut_off}",
+        ]
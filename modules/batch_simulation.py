@@ -0,0 +1,468 @@
+import time
+import numpy as np
+from modules.simulation import (
+    WIDTH,
+    HEIGHT,
+    BALL_RADIUS,
+    PADDLE_WIDTH,
+    INITIAL_PADDLE_HEIGHT,
+    PADDLE_SHRINK_RATE,
+    PADDLE_STEP,
+    FRAME_MS,
+    MAX_BOUNCES_PER_STEP,
+    CONTACT_OFFSET,
+    MAX_MATCH_FRAMES,
+)
+
+BALL_SIZE = BALL_RADIUS * 2
+PLAYER_PADDLE_X = WIDTH - 20
+COMPUTER_PADDLE_X = 10
+
+# Settings that may be given per match as arrays for parameter sweeps
+SWEEPABLE_SETTINGS = [
+    "WINNING_POINTS",
+    "BALL_SPEED",
+    "COMPUTER_SPEED",
+    "COMPUTER_RANDOMNESS",
+    "BALL_SPEED_TURNS",
+    "BALL_INCREMENT",
+]
+
+
+def computer_moves(ball_y, paddle_y, paddle_height, randomness, rng):
+    """
+    Vectorized calculate_computer_move for many paddles at once.
+
+    :param ball_y: Array of ball y-positions
+    :param paddle_y: Array of paddle y-positions (passed the same way pong.py does)
+    :param paddle_height: Array of paddle heights
+    :param randomness: AI randomness setting (0-100), scalar or array
+    :param rng: numpy Generator used for the per-frame jitter
+    :return: Array of movement directions (-1, 0 or 1)
+    """
+    paddle_center = paddle_y + paddle_height / 2
+    random_factor = (rng.random(ball_y.shape) - 0.5) * randomness / 50
+    target_y = ball_y + random_factor * paddle_height
+    return np.where(
+        target_y < paddle_center - 2, -1, np.where(target_y > paddle_center + 2, 1, 0)
+    )
+
+
+def predict_intercepts(ball_x, ball_y, ball_dx, ball_dy, target_x):
+    """
+    Vectorized computer_ai.predict_intercept without obstacles.
+
+    :return: Array of predicted y-positions, NaN where the ball is not heading
+        for target_x
+    """
+    heading = (ball_dx != 0) & ((target_x - ball_x) * ball_dx > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = ball_y + ball_dy * (target_x - ball_x) / ball_dx
+    low, span = BALL_RADIUS, HEIGHT - BALL_SIZE
+    offset = np.mod(y - low, 2 * span)
+    folded = low + np.where(offset <= span, offset, 2 * span - offset)
+    return np.where(heading, folded, np.nan)
+
+
+class BatchPredictor:
+    """
+    Vectorized PredictiveComputer for one side of every match.
+
+    Targets are only recomputed for matches whose ball velocity changed since
+    the previous frame.
+    """
+
+    def __init__(self, matches, paddle_x, randomness, reaction_delay):
+        self.paddle_x = paddle_x
+        self.randomness = randomness
+        self.reaction_delay = reaction_delay
+        self.velocity_x = np.full(matches, np.nan)
+        self.velocity_y = np.full(matches, np.nan)
+        self.target_y = np.full(matches, HEIGHT / 2)
+        self.pending_target_y = np.full(matches, HEIGHT / 2)
+        self.frames_until_reaction = np.zeros(matches, dtype=np.int32)
+
+    def moves(self, ball_x, ball_y, ball_dx, ball_dy, paddle_y, paddle_height, rng):
+        changed = np.flatnonzero(
+            (ball_dx != self.velocity_x) | (ball_dy != self.velocity_y)
+        )
+        if changed.size:
+            intercept = predict_intercepts(
+                ball_x[changed],
+                ball_y[changed],
+                ball_dx[changed],
+                ball_dy[changed],
+                self.paddle_x,
+            )
+            random_factor = (
+                (rng.random(changed.size) - 0.5) * self.randomness[changed] / 50
+            )
+            self.pending_target_y[changed] = np.where(
+                np.isnan(intercept),
+                HEIGHT / 2,
+                intercept + random_factor * paddle_height[changed],
+            )
+            self.velocity_x[changed] = ball_dx[changed]
+            self.velocity_y[changed] = ball_dy[changed]
+            self.frames_until_reaction[changed] = self.reaction_delay
+
+        waiting = self.frames_until_reaction > 0
+        self.frames_until_reaction -= waiting
+        self.target_y = np.where(waiting, self.target_y, self.pending_target_y)
+
+        paddle_center = paddle_y + paddle_height / 2
+        return np.where(
+            self.target_y < paddle_center - 2,
+            -1,
+            np.where(self.target_y > paddle_center + 2, 1, 0),
+        )
+
+
+def sweep_circle_rects(x, y, dx, dy, radius, left, top, width, height):
+    """
+    Vectorized collision.sweep_circle_rect against one rectangle per match.
+
+    :param left: Array or scalar of rectangle left edges, and likewise top,
+        width and height
+    :return: (t, normal_x, normal_y) arrays, with t infinite where there is no
+        hit in [0, 1]
+    """
+    left, right = left - radius, left + width + radius
+    top, bottom = top - radius, top + height + radius
+
+    # Already overlapping: push out through the nearest face, if moving further in
+    inside = (left < x) & (x < right) & (top < y) & (y < bottom)
+    depths = np.stack((x - left, right - x, y - top, bottom - y))
+    face = np.argmin(depths, axis=0)
+    inside_x = np.array([-1.0, 1.0, 0.0, 0.0])[face]
+    inside_y = np.array([0.0, 0.0, -1.0, 1.0])[face]
+    inside &= dx * inside_x + dy * inside_y < 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        near_x = np.where(dx > 0, (left - x) / dx, (right - x) / dx)
+        far_x = np.where(dx > 0, (right - x) / dx, (left - x) / dx)
+        near_y = np.where(dy > 0, (top - y) / dy, (bottom - y) / dy)
+        far_y = np.where(dy > 0, (bottom - y) / dy, (top - y) / dy)
+    outside_x = (x < left) | (x > right)
+    outside_y = (y < top) | (y > bottom)
+    near_x = np.where(dx == 0, -np.inf, near_x)
+    far_x = np.where(dx == 0, np.inf, far_x)
+    near_y = np.where(dy == 0, -np.inf, near_y)
+    far_y = np.where(dy == 0, np.inf, far_y)
+    y_face = near_y > near_x
+    t_near = np.where(y_face, near_y, near_x)
+    swept = (
+        ~((dx == 0) & outside_x)
+        & ~((dy == 0) & outside_y)
+        & (t_near <= np.minimum(far_x, far_y))
+        & (t_near >= 0)
+        & (t_near <= 1)
+    )
+    normal_x = np.where(y_face, 0.0, -np.sign(dx))
+    normal_y = np.where(y_face, -np.sign(dy), 0.0)
+
+    t = np.where(inside, 0.0, np.where(swept, t_near, np.inf))
+    return (
+        t,
+        np.where(inside, inside_x, np.where(swept, normal_x, 0.0)),
+        np.where(inside, inside_y, np.where(swept, normal_y, 0.0)),
+    )
+
+
+def _to_pixels(value):
+    # pygame.Rect rounds half away from zero when assigned a float
+    return np.sign(value) * np.floor(np.abs(value) + 0.5)
+
+
+class BatchSimulation:
+    """
+    Many computer-vs-computer matches of PongSimulation held as numpy arrays.
+
+    Every call to step() advances all unfinished matches by one frame with the
+    same wall bounce, paddle reflection, ball speed-up and AI rules as pong.py.
+    The ball is swept against the walls and paddles like in PongSimulation, so
+    both play the same matches apart from the random draws.
+    Obstacles are not simulated; OBSTACLE is ignored.
+    BALL_COUNT is ignored too; every match plays a single ball.
+    PREDICTIVE_AI switches the computer to the vectorized intercept predictor;
+    the player's autopilot stays reactive, as in PongSimulation.
+    HUMAN_AI is ignored; the player model is only consulted by PongSimulation.
+    """
+
+    def __init__(self, game_settings, matches, seed=None):
+        self.matches = matches
+        self.rng = np.random.default_rng(seed)
+        self.erosion = bool(game_settings["PADDLE_EROSION"])
+        self.predictive = bool(game_settings.get("PREDICTIVE_AI", False))
+        self.reaction_delay = game_settings.get("COMPUTER_REACTION", 0)
+        for name in SWEEPABLE_SETTINGS:
+            value = np.broadcast_to(
+                np.asarray(game_settings[name], dtype=np.float64), (matches,)
+            )
+            setattr(self, name.lower(), value)
+
+        self.ball_x = np.empty(matches)
+        self.ball_y = np.empty(matches)
+        self.ball_dx = np.zeros(matches)
+        self.ball_dy = np.zeros(matches)
+        self.player_y = np.empty(matches)
+        self.computer_y = np.empty(matches)
+        self.player_height = np.empty(matches)
+        self.computer_height = np.full(matches, float(INITIAL_PADDLE_HEIGHT))
+        self.player_score = np.zeros(matches, dtype=np.int32)
+        self.computer_score = np.zeros(matches, dtype=np.int32)
+        self.strike_count = np.zeros(matches, dtype=np.int32)
+        self.longest_rally = np.zeros(matches, dtype=np.int32)
+        self.frame = np.zeros(matches, dtype=np.int64)
+        self.rally_start_time = np.zeros(matches)
+        self.ball_moving = np.zeros(matches, dtype=bool)
+        self.game_over = np.zeros(matches, dtype=bool)
+        self.reset()
+
+    def reset(self):
+        if self.predictive:
+            self.computer_predictor = BatchPredictor(
+                self.matches,
+                COMPUTER_PADDLE_X + PADDLE_WIDTH + BALL_RADIUS,
+                self.computer_randomness,
+                self.reaction_delay,
+            )
+        self._center_balls(np.ones(self.matches, dtype=bool))
+        self.ball_dx[:] = self.ball_dy[:] = 0
+        self.player_height[:] = INITIAL_PADDLE_HEIGHT
+        self.computer_height[:] = INITIAL_PADDLE_HEIGHT
+        self.player_y[:] = self.computer_y[:] = HEIGHT // 2 - INITIAL_PADDLE_HEIGHT // 2
+        for array in (
+            self.player_score,
+            self.computer_score,
+            self.strike_count,
+            self.longest_rally,
+            self.frame,
+            self.rally_start_time,
+        ):
+            array[:] = 0
+        self.ball_moving[:] = False
+        self.game_over[:] = False
+
+    def _center_balls(self, mask):
+        self.ball_x[mask] = WIDTH / 2
+        self.ball_y[mask] = HEIGHT / 2
+
+    def step(self):
+        """
+        Advance every unfinished match by one frame, serving automatically.
+        """
+        active = ~self.game_over
+        self.frame += active
+        now = (self.frame * FRAME_MS).astype(np.int64)
+
+        if self.erosion:
+            shrink = (PADDLE_SHRINK_RATE * now // 1000).astype(np.int64)
+            self.player_height = np.maximum(
+                INITIAL_PADDLE_HEIGHT - shrink, INITIAL_PADDLE_HEIGHT // 2
+            ).astype(np.float64)
+
+        # The player's autopilot decides on the state before the frame
+        player_move = self._ai_moves(
+            None,
+            self.player_y,
+            self.player_height,
+        )
+
+        serve = active & ~self.ball_moving
+        moving = self.ball_moving & active
+        self._step_balls(moving, now)
+
+        computer_move = self._ai_moves(
+            self.computer_predictor if self.predictive else None,
+            self.computer_y,
+            self.computer_height,
+        )
+        self.computer_y = np.where(
+            moving,
+            np.clip(
+                _to_pixels(self.computer_y + computer_move * self.computer_speed / 10),
+                0,
+                HEIGHT - self.computer_height,
+            ),
+            self.computer_y,
+        )
+
+        up = active & (player_move < 0) & (self.player_y > 0)
+        down = (
+            active & (player_move > 0) & (self.player_y + self.player_height < HEIGHT)
+        )
+        self.player_y += PADDLE_STEP * (down.astype(np.int8) - up)
+
+        serve &= ~self.game_over
+        count = int(serve.sum())
+        if count:
+            self.ball_dx[serve] = self.rng.choice([-5.0, 5.0], count)
+            self.ball_dy[serve] = self.rng.choice([-5.0, 5.0], count)
+            self.rally_start_time[serve] = now[serve]
+            self.ball_moving |= serve
+
+    def _ai_moves(self, predictor, paddle_y, paddle_height):
+        if predictor is not None:
+            return predictor.moves(
+                self.ball_x,
+                self.ball_y,
+                self.ball_dx,
+                self.ball_dy,
+                paddle_y,
+                paddle_height,
+                self.rng,
+            )
+        return computer_moves(
+            np.round(self.ball_y),
+            paddle_y + paddle_height // 2,
+            paddle_height,
+            self.computer_randomness,
+            self.rng,
+        )
+
+    def _step_balls(self, moving, now):
+        rally_duration = ((now - self.rally_start_time) // 1000).astype(np.int32)
+        self.longest_rally = np.where(
+            moving, np.maximum(self.longest_rally, rally_duration), self.longest_rally
+        )
+
+        remaining = np.where(moving, 1.0, 0.0)
+        for _ in range(MAX_BOUNCES_PER_STEP):
+            dx, dy = self.ball_dx * remaining, self.ball_dy * remaining
+            t, normal_x, normal_y, surface = self._first_contacts(dx, dy)
+            hit = t <= 1
+            if not hit.any():
+                self.ball_x += dx
+                self.ball_y += dy
+                break
+            t = np.where(hit, t, 1.0)
+            self.ball_x += dx * t + normal_x * CONTACT_OFFSET
+            self.ball_y += dy * t + normal_y * CONTACT_OFFSET
+            remaining = np.where(hit, remaining * (1 - t), 0.0)
+            self._bounce(hit, surface, normal_x)
+
+        player_point = moving & (self.ball_x - BALL_RADIUS <= 0)
+        computer_point = moving & ~player_point & (self.ball_x + BALL_RADIUS >= WIDTH)
+        point = player_point | computer_point
+        self.player_score += player_point
+        self.computer_score += computer_point
+        self.ball_moving &= ~point
+        self._center_balls(point)
+        self.rally_start_time = np.where(point, now, self.rally_start_time)
+
+        self.game_over |= moving & (
+            (self.player_score >= self.winning_points)
+            | (self.computer_score >= self.winning_points)
+        )
+        self.ball_moving &= ~self.game_over
+
+    def _first_contacts(self, dx, dy):
+        """
+        Vectorized PongSimulation._first_contact without obstacles.
+
+        :return: (t, normal_x, normal_y, surface) arrays, where surface is 0 for
+            the walls, 1 for the player's paddle and 2 for the computer's
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            top = np.where(
+                (dy < 0) & (self.ball_y + dy < BALL_RADIUS),
+                np.maximum(0.0, (BALL_RADIUS - self.ball_y) / dy),
+                np.inf,
+            )
+            bottom = np.where(
+                (dy > 0) & (self.ball_y + dy > HEIGHT - BALL_RADIUS),
+                np.maximum(0.0, (HEIGHT - BALL_RADIUS - self.ball_y) / dy),
+                np.inf,
+            )
+        player = sweep_circle_rects(
+            self.ball_x,
+            self.ball_y,
+            dx,
+            dy,
+            BALL_RADIUS,
+            PLAYER_PADDLE_X,
+            self.player_y,
+            PADDLE_WIDTH,
+            self.player_height,
+        )
+        computer = sweep_circle_rects(
+            self.ball_x,
+            self.ball_y,
+            dx,
+            dy,
+            BALL_RADIUS,
+            COMPUTER_PADDLE_X,
+            self.computer_y,
+            PADDLE_WIDTH,
+            self.computer_height,
+        )
+        zeros = np.zeros(self.matches)
+        # Ties go to the first contact, in the order PongSimulation tests them
+        contacts = np.stack((top, bottom, player[0], computer[0]))
+        first = np.argmin(contacts, axis=0)
+        columns = np.arange(self.matches)
+        normal_x = np.stack((zeros, zeros, player[1], computer[1]))
+        normal_y = np.stack((zeros + 1, zeros - 1, player[2], computer[2]))
+        return (
+            contacts[first, columns],
+            normal_x[first, columns],
+            normal_y[first, columns],
+            np.maximum(first - 1, 0),
+        )
+
+    def _bounce(self, hit, surface, normal_x):
+        wall = hit & (surface == 0)
+        strike = hit & (surface > 0)
+        self.ball_dy = np.where(
+            wall | (strike & (normal_x == 0)), -self.ball_dy, self.ball_dy
+        )
+        self.ball_dx = np.where(strike & (normal_x != 0), -self.ball_dx, self.ball_dx)
+        self.strike_count += strike
+
+        # update_ball_speed
+        speed_up = strike & (self.strike_count % self.ball_speed_turns == 0)
+        speed_multiplier = 1 + np.minimum(
+            self.ball_speed / 50,
+            (self.strike_count // self.ball_speed_turns) * (self.ball_increment / 100),
+        )
+        self.ball_dx = np.where(
+            speed_up, np.sign(self.ball_dx) * 5 * speed_multiplier, self.ball_dx
+        )
+        self.ball_dy = np.where(
+            speed_up, np.sign(self.ball_dy) * 5 * speed_multiplier, self.ball_dy
+        )
+
+    @property
+    def current_ball_speed(self):
+        return (np.abs(self.ball_dx) + np.abs(self.ball_dy)) / 2
+
+    def run(self, max_frames=MAX_MATCH_FRAMES):
+        """
+        Step until every match is over or max_frames have been played.
+        """
+        for _ in range(max_frames):
+            if self.game_over.all():
+                break
+            self.step()
+
+
+def run_batch(game_settings, matches, seed=None):
+    """
+    Batch counterpart of simulation.run_headless.
+    """
+    start = time.perf_counter()
+    batch = BatchSimulation(game_settings, matches, seed)
+    batch.run()
+    elapsed = time.perf_counter() - start
+    frames = int(batch.frame.sum())
+    return {
+        "matches": matches,
+        "player_wins": int((batch.player_score > batch.computer_score).sum()),
+        "computer_wins": int((batch.computer_score > batch.player_score).sum()),
+        "mean_strikes": float(batch.strike_count.mean()) if matches else 0.0,
+        "longest_rally": int(batch.longest_rally.max(initial=0)),
+        "frames": frames,
+        "seconds": elapsed,
+        "frames_per_second": frames / elapsed if elapsed else 0,
+    }
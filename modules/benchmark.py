@@ -0,0 +1,444 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from modules.assets import ROOT
+
+BASELINE_PATH = os.path.join(ROOT, "benchmark_baseline.json")
+DEFAULT_THRESHOLD = 0.15  # Fail when a metric is more than 15% worse than baseline
+# Metrics that vary more than that between runs of the same code
+METRIC_THRESHOLDS = {
+    "predictive_computer_move": 0.25,
+    "draw_text": 0.25,
+    "settings_load": 0.3,
+    "settings_save_call": 0.3,
+    "settings_save_to_disk": 0.5,  # Bound by fsync
+    "startup_to_menu": 0.3,  # A whole interpreter start
+}
+# Latencies are never flagged for getting less than this much slower, however
+# large a fraction of a tiny baseline that is
+NOISE_FLOOR_MS = 0.25
+REPEATS = 9
+MIN_SECONDS = 0.2
+STARTUP_RUNS = 7
+CONFIRM_RUNS = 2  # Re-measurements a metric must stay regressed through
+# GAME_SETTINGS every benchmark runs with, whatever the options menu last saved,
+# so results only move when the code does. Baselines store them and are only
+# compared against runs with the same ones.
+BENCHMARK_SETTINGS = {
+    "PADDLE_EROSION": False,
+    "OBSTACLE": True,
+    "OBSTACLE_COUNT": 1,
+    "ARENA": "",
+    "WINNING_POINTS": 3,
+    "BALL_SPEED": 50,
+    "COMPUTER_SPEED": 75,
+    "COMPUTER_RANDOMNESS": 25,
+    "PREDICTIVE_AI": False,
+    "HUMAN_AI": False,
+    "COMPUTER_REACTION": 6,
+    "BALL_SPEED_TURNS": 5,
+    "BALL_INCREMENT": 20,
+    "BALL_COUNT": 1,
+    "MUSIC_ENABLED": False,
+}
+
+# Started in a fresh interpreter; exits as soon as the first menu frame is shown
+STARTUP_SCRIPT = """
+import json, os, sys, pygame
+pygame.display.flip = lambda: os._exit(0)
+import pong
+pong.SETTINGS["GAME_SETTINGS"].update(json.loads(sys.argv[1]))
+pong.load_assets()
+pong.show_menu()
+"""
+
+
+def median_rate(workload, repeats=REPEATS, min_seconds=MIN_SECONDS):
+    """
+    Median operations per second over several runs of a workload.
+
+    :param workload: Callable doing a batch of work and returning how many
+        operations it did; it is called repeatedly for at least min_seconds
+    """
+    rates = []
+    # The first run also pays for caches, allocations and the CPU clocking up
+    for _ in range(repeats + 1):
+        operations = 0
+        start = time.perf_counter()
+        while True:
+            operations += workload()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        rates.append(operations / elapsed)
+    return statistics.median(rates[1:])
+
+
+def median_latency_ms(function, repeats=REPEATS * 4):
+    """
+    Median time of several calls to function, in milliseconds.
+
+    :param function: Callable to time, or one returning the seconds to count
+        when it has work that shouldn't be timed
+    """
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        elapsed = function()
+        latencies.append(
+            elapsed if elapsed is not None else time.perf_counter() - start
+        )
+    return statistics.median(latencies) * 1000
+
+
+def bench_simulation(settings, options):
+    from modules.simulation import PongSimulation
+
+    simulation = PongSimulation(settings, seed=1)
+
+    def workload():
+        for _ in range(1000):
+            if simulation.game_over:
+                simulation.reset()
+            simulation.step(simulation.autopilot_input())
+        return 1000
+
+    return {"simulation_steps": (median_rate(workload, **options), "steps/s")}
+
+
+def bench_obstacles(settings, options):
+    import pygame
+    from modules.obstacle import Obstacle
+    from modules.simulation import WIDTH, HEIGHT, BALL_RADIUS
+
+    results = {}
+    for shape in ("hexagon", "triangle", "square"):
+        rng = random.Random(1)
+        obstacle = Obstacle(WIDTH, HEIGHT, BALL_RADIUS, rng=rng)
+        obstacle.shape = shape
+        obstacle.generate()
+        # Balls spread around the obstacle, so both the early-out and the exact
+        # edge tests are exercised
+        balls = [
+            pygame.Rect(
+                obstacle.center[0] + rng.uniform(-3, 3) * obstacle.bounding_radius,
+                obstacle.center[1] + rng.uniform(-3, 3) * obstacle.bounding_radius,
+                BALL_RADIUS * 2,
+                BALL_RADIUS * 2,
+            )
+            for _ in range(1000)
+        ]
+
+        def workload():
+            for ball in balls:
+                obstacle.check_collision(ball)
+            return len(balls)
+
+        results[f"check_collision_{shape}"] = (
+            median_rate(workload, **options),
+            "calls/s",
+        )
+    return results
+
+
+def bench_computer_ai(settings, options):
+    from modules.computer_ai import calculate_computer_move, PredictiveComputer
+
+    rng = random.Random(1)
+    states = [(rng.uniform(0, 600), rng.uniform(0, 500)) for _ in range(1000)]
+
+    def reactive():
+        for ball_y, paddle_y in states:
+            calculate_computer_move(ball_y, paddle_y, 100, 600, 75, 25, rng)
+        return len(states)
+
+    predictor = PredictiveComputer(20, 600, 10, randomness=25, rng=rng)
+    # A new velocity every tenth call, roughly one bounce per rally in a game
+    balls = [
+        (
+            rng.uniform(100, 700),
+            rng.uniform(10, 590),
+            -5 - i // 10 % 2,
+            rng.choice([-5, 5]),
+            rng.uniform(0, 500),
+        )
+        for i in range(1000)
+    ]
+
+    def predictive():
+        for ball_x, ball_y, ball_dx, ball_dy, paddle_y in balls:
+            predictor.calculate_move(ball_x, ball_y, ball_dx, ball_dy, paddle_y, 100)
+        return len(balls)
+
+    return {
+        "calculate_computer_move": (median_rate(reactive, **options), "calls/s"),
+        "predictive_computer_move": (median_rate(predictive, **options), "calls/s"),
+    }
+
+
+def bench_rendering(settings, options):
+    import pygame
+    import pong
+    from modules.simulation import PongSimulation
+
+    if pong.screen is None:
+        pong.load_assets()
+
+    def text_workload():
+        for i in range(100):
+            pong.draw_text("Press any key to serve", "instruction", pong.WHITE, 400, i)
+        return 100
+
+    simulation = PongSimulation(settings, seed=1)
+
+    def frame_workload():
+        for _ in range(10):
+            simulation.step(simulation.autopilot_input())
+            pong.draw_game(simulation)
+            pygame.display.flip()
+        return 10
+
+    return {
+        "draw_text": (median_rate(text_workload, **options), "calls/s"),
+        "render_frame": (median_rate(frame_workload, **options), "frames/s"),
+    }
+
+
+def bench_settings(settings, options):
+    from modules.settings_store import SettingsStore, SETTINGS_PATH
+
+    directory = tempfile.mkdtemp()
+    store = None
+    try:
+        settings_path = os.path.join(directory, "settings.db")
+        shutil.copy(SETTINGS_PATH, settings_path)
+        store = SettingsStore(settings_path, os.path.join(directory, "history"))
+        data = store.load()
+        data["GAME_SETTINGS"] = dict(settings)
+        store.save(data)
+        store.flush()
+
+        def save():
+            store.save(data)
+            store.flush()
+
+        def load():
+            # What startup pays; stopping the writer again isn't timed
+            start = time.perf_counter()
+            loaded = SettingsStore(settings_path)
+            loaded.load()
+            elapsed = time.perf_counter() - start
+            loaded.close()
+            return elapsed
+
+        return {
+            "settings_load": (median_latency_ms(load), "ms"),
+            "settings_save_call": (median_latency_ms(lambda: store.save(data)), "ms"),
+            "settings_save_to_disk": (median_latency_ms(save), "ms"),
+        }
+    finally:
+        if store is not None:
+            store.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_startup(settings, options):
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+
+    def start():
+        subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, json.dumps(settings)],
+            cwd=ROOT,
+            env=environment,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    return {"startup_to_menu": (median_latency_ms(start, STARTUP_RUNS), "ms")}
+
+
+BENCHMARKS = {
+    "simulation": bench_simulation,
+    "obstacles": bench_obstacles,
+    "computer_ai": bench_computer_ai,
+    "rendering": bench_rendering,
+    "settings": bench_settings,
+    "startup": bench_startup,
+}
+
+
+def higher_is_better(unit):
+    return unit.endswith("/s")
+
+
+def regression(value, baseline, unit):
+    """
+    How much worse value is than baseline, as a fraction; negative is better.
+    """
+    if higher_is_better(unit):
+        return (baseline - value) / baseline if baseline else 0
+    return (value - baseline) / baseline if baseline else 0
+
+
+def is_regression(metric, value, baseline, unit, threshold=None):
+    """
+    :param threshold: Fraction used for every metric instead of METRIC_THRESHOLDS
+    """
+    if threshold is None:
+        threshold = METRIC_THRESHOLDS.get(metric, DEFAULT_THRESHOLD)
+    if unit == "ms" and value - baseline < NOISE_FLOOR_MS:
+        return False
+    return regression(value, baseline, unit) > threshold
+
+
+def run_benchmarks(names, settings, quick=False):
+    """
+    :return: Dict mapping metric names to {"value", "unit", "benchmark"}
+    """
+    options = {"repeats": 3, "min_seconds": 0.05} if quick else {}
+    results = {}
+    for name in names:
+        for metric, (value, unit) in BENCHMARKS[name](settings, options).items():
+            results[metric] = {"value": value, "unit": unit, "benchmark": name}
+    return results
+
+
+def find_regressions(results, baseline, threshold=None):
+    return [
+        metric
+        for metric, result in results.items()
+        if metric in baseline
+        and is_regression(
+            metric,
+            result["value"],
+            baseline[metric]["value"],
+            result["unit"],
+            threshold,
+        )
+    ]
+
+
+def confirm_regressions(results, baseline, settings, quick=False, threshold=None):
+    """
+    Measure the benchmarks of apparently regressed metrics again, keeping each
+    metric's better value, so a slow moment of a busy machine isn't reported as
+    a regression while a real one shows up in every run.
+
+    :return: List of the metrics that stayed regressed
+    """
+    regressions = find_regressions(results, baseline, threshold)
+    for _ in range(CONFIRM_RUNS):
+        if not regressions:
+            break
+        names = {results[metric]["benchmark"] for metric in regressions}
+        again = run_benchmarks(
+            [name for name in BENCHMARKS if name in names], settings, quick
+        )
+        for metric in regressions:
+            value, unit = again[metric]["value"], again[metric]["unit"]
+            if regression(value, baseline[metric]["value"], unit) < regression(
+                results[metric]["value"], baseline[metric]["value"], unit
+            ):
+                results[metric]["value"] = value
+        regressions = find_regressions(results, baseline, threshold)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the game's hot paths and compare them to a baseline"
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        default=list(BENCHMARKS),
+        help=f"benchmarks to run, from {', '.join(BENCHMARKS)} (default: all)",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="baseline results file"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="fail when any metric is this fraction worse than the baseline "
+        f"(default: {DEFAULT_THRESHOLD} or the metric's own threshold)",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="shorter, noisier measurements"
+    )
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline.get("game_settings") != BENCHMARK_SETTINGS:
+        if not args.save_baseline and baseline:
+            parser.error(
+                f"{args.baseline} was measured with other game settings; "
+                "store a new one with --save-baseline"
+            )
+        # Results under other settings can't be mixed with these
+        baseline = {}
+
+    settings = dict(BENCHMARK_SETTINGS)
+    results = run_benchmarks(args.benchmarks, settings, args.quick)
+
+    if args.save_baseline:
+        baseline["game_settings"] = BENCHMARK_SETTINGS
+        baseline.update(
+            {
+                metric: {"value": result["value"], "unit": result["unit"]}
+                for metric, result in results.items()
+            }
+        )
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        for metric, result in results.items():
+            print(f"{metric:28} {result['value']:14.2f} {result['unit']}")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressions = confirm_regressions(
+        results, baseline, settings, args.quick, args.threshold
+    )
+    for metric, result in results.items():
+        line = f"{metric:28} {result['value']:14.2f} {result['unit']:8}"
+        if metric in baseline:
+            change = regression(
+                result["value"], baseline[metric]["value"], result["unit"]
+            )
+            line += f" {-change:+8.1%} vs {baseline[metric]['value']:.2f}"
+            if metric in regressions:
+                line += "  REGRESSION"
+        print(line)
+
+    if not baseline:
+        print("No baseline yet; run with --save-baseline to store one")
+    if regressions:
+        print(
+            f"{len(regressions)} metric(s) regressed past their threshold: "
+            f"{', '.join(regressions)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import time
+import pygame
+
+CAPTURE_FPS = 30
+CAPTURE_SCALE = 0.5
+QUEUE_FRAMES = 60  # Two seconds of backlog at CAPTURE_FPS
+CLIP_SECONDS = 15  # Length of the rolling window an animated capture keeps
+ENCODE_WORKERS = 2
+ANIMATED_EXTENSIONS = (".gif", ".webp", ".png")
+
+
+class FrameRecorder:
+    """
+    Records the rendered game as an animated image or a numbered PNG sequence.
+
+    capture() only scales the frame down and copies its pixels into a bounded
+    queue; Pillow converts and compresses it on worker threads, which release
+    the GIL while encoding. The game loop never waits on them: while the queue
+    is over half full frames are taken at half the rate, and a frame arriving
+    at a full queue is dropped. Both are counted.
+
+    Animated files (.gif, .webp or .png for APNG) can only be written in one go,
+    so their encoded frames are kept in memory until close(). They are meant
+    for highlight clips: only the last clip_seconds * fps frames are kept, a
+    rolling window that bounds the memory however long the game runs, and
+    older frames are counted as trimmed. Any other path is a directory that
+    every frame is written to as it is encoded.
+
+    :param path: Animated image file or directory for the PNG sequence
+    :param fps: Frames per second to capture at most
+    :param scale: Size of the recording relative to the screen
+    :param clip_seconds: How much of the end an animated file keeps
+    """
+
+    def __init__(
+        self,
+        path,
+        fps=CAPTURE_FPS,
+        scale=CAPTURE_SCALE,
+        queue_frames=QUEUE_FRAMES,
+        workers=ENCODE_WORKERS,
+        clip_seconds=CLIP_SECONDS,
+    ):
+        self.path = path
+        self.fps = fps
+        self.scale = scale
+        self.animated = path.lower().endswith(ANIMATED_EXTENSIONS)
+        if not self.animated:
+            os.makedirs(path, exist_ok=True)
+        self.size = None
+        self.interval = 1 / fps
+        self.next_capture = 0
+        self.queue = queue.Queue(queue_frames)
+        self.frames = {}
+        self.clip_frames = max(1, round(clip_seconds * fps))
+        self.captured = self.skipped = self.dropped = self.encoded = 0
+        self.trimmed = 0
+        self.lock = threading.Lock()
+        self.workers = [
+            threading.Thread(target=self._encode, daemon=True) for _ in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def capture(self, surface):
+        """
+        Offer the frame just drawn on surface; returns at once.
+        """
+        now = time.perf_counter()
+        if now < self.next_capture:
+            return
+        backlog = self.queue.qsize() * 2 >= self.queue.maxsize
+        if backlog:
+            self.skipped += 1
+        self.next_capture = max(
+            self.next_capture + self.interval * (2 if backlog else 1), now
+        )
+
+        if self.size is None:
+            width, height = surface.get_size()
+            self.size = (
+                max(1, round(width * self.scale)),
+                max(1, round(height * self.scale)),
+            )
+        if surface.get_size() != self.size:
+            surface = pygame.transform.scale(surface, self.size)
+        try:
+            self.queue.put_nowait((self.captured, pygame.image.tobytes(surface, "RGB")))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.captured += 1
+
+    def _encode(self):
+        from PIL import Image
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            index, pixels = item
+            image = Image.frombytes("RGB", self.size, pixels)
+            if self.animated:
+                if self.path.lower().endswith(".gif"):
+                    image = image.convert("P", palette=Image.Palette.ADAPTIVE)
+                with self.lock:
+                    self.frames[index] = image
+                    while len(self.frames) > self.clip_frames:
+                        del self.frames[min(self.frames)]
+                        self.trimmed += 1
+            else:
+                # Fast compression keeps the workers ahead of the game; frames are
+                # usually re-encoded by whatever edits them into a clip
+                image.save(
+                    os.path.join(self.path, f"frame_{index:06d}.png"), compress_level=1
+                )
+            with self.lock:
+                self.encoded += 1
+
+    def close(self):
+        """
+        Encode what is still queued, write the animated file and return stats().
+        """
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.animated and self.frames:
+            frames = [self.frames[index] for index in sorted(self.frames)]
+            # Keep the extension so Pillow still knows the format
+            root, extension = os.path.splitext(self.path)
+            temp_path = root + ".tmp" + extension
+            frames[0].save(
+                temp_path,
+                save_all=True,
+                append_images=frames[1:],
+                duration=round(1000 / self.fps),
+                loop=0,
+            )
+            os.replace(temp_path, self.path)
+            self.frames = {}
+        return self.stats()
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "encoded": self.encoded,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "trimmed": self.trimmed,
+        }
+
+    def overlay_lines(self):
+        return [
+            f"capture {self.captured} queued {self.queue.qsize()} "
+            f"skipped {self.skipped} dropped {self.dropped}"
+        ]
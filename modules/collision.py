@@ -0,0 +1,146 @@
+import math
+
+
+def sweep_circle_rect(x, y, dx, dy, radius, rect):
+    """
+    Find when a circle moving from (x, y) by (dx, dy) first touches a rectangle.
+
+    The rectangle is grown by the radius on every side, so its corners behave as
+    if they were square rather than rounded.
+
+    :param x: X-position of the circle's center
+    :param y: Y-position of the circle's center
+    :param dx: X-movement over the sweep
+    :param dy: Y-movement over the sweep
+    :param radius: Radius of the circle
+    :param rect: pygame.Rect to test against
+    :return: (t, normal_x, normal_y) with t in [0, 1], or None if there is no hit
+    """
+    left, right = rect.left - radius, rect.right + radius
+    top, bottom = rect.top - radius, rect.bottom + radius
+
+    if left < x < right and top < y < bottom:
+        # Already overlapping, e.g. a paddle moved onto the ball: push out through
+        # the nearest face, but only if the ball is moving further in
+        depth, normal_x, normal_y = min(
+            (x - left, -1, 0),
+            (right - x, 1, 0),
+            (y - top, 0, -1),
+            (bottom - y, 0, 1),
+        )
+        if dx * normal_x + dy * normal_y < 0:
+            return 0.0, normal_x, normal_y
+        return None
+
+    t_near, t_far = -math.inf, math.inf
+    normal_x = normal_y = 0
+    for position, delta, low, high, axis in (
+        (x, dx, left, right, 0),
+        (y, dy, top, bottom, 1),
+    ):
+        if delta == 0:
+            if position < low or position > high:
+                return None
+            continue
+        t1, t2 = (low - position) / delta, (high - position) / delta
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_near:
+            t_near = t1
+            normal = -math.copysign(1, delta)
+            normal_x, normal_y = (normal, 0) if axis == 0 else (0, normal)
+        t_far = min(t_far, t2)
+
+    if t_near > t_far or t_near < 0 or t_near > 1:
+        return None
+    return t_near, normal_x, normal_y
+
+
+def polygon_edges(points):
+    """
+    Precompute the per-edge data used by the polygon tests.
+
+    :param points: Convex polygon corners in order, either winding
+    :return: List of (x1, y1, edge_x, edge_y, inverse_length_squared, normal_x,
+        normal_y) tuples, with normals pointing out of the polygon
+    """
+    center_x = sum(point[0] for point in points) / len(points)
+    center_y = sum(point[1] for point in points) / len(points)
+    edges = []
+    for i in range(len(points)):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % len(points)]
+        edge_x, edge_y = x2 - x1, y2 - y1
+        length = math.hypot(edge_x, edge_y)
+        normal_x, normal_y = edge_y / length, -edge_x / length
+        if (x1 - center_x) * normal_x + (y1 - center_y) * normal_y < 0:
+            normal_x, normal_y = -normal_x, -normal_y
+        edges.append((x1, y1, edge_x, edge_y, 1 / length**2, normal_x, normal_y))
+    return edges
+
+
+def sweep_circle_polygon(x, y, dx, dy, radius, points, edges=None):
+    """
+    Find when a moving circle first touches a convex polygon.
+
+    Each edge is pushed outwards by the radius and each corner becomes a circle of
+    that radius, so the sweep is exact for any speed.
+
+    :param points: Polygon corners in order, either winding
+    :param edges: polygon_edges(points), if already computed
+    :return: (t, normal_x, normal_y) with t in [0, 1], or None if there is no hit
+    """
+    if edges is None:
+        edges = polygon_edges(points)
+    best = None
+
+    for x1, y1, edge_x, edge_y, inverse_length_squared, normal_x, normal_y in edges:
+        approach = dx * normal_x + dy * normal_y
+        if approach >= 0:
+            continue
+        distance = (x - x1) * normal_x + (y - y1) * normal_y - radius
+        if distance < -radius:
+            continue
+        t = max(0.0, -distance / approach)
+        if t > 1 or (best and t >= best[0]):
+            continue
+        along = (
+            (x + dx * t - x1) * edge_x + (y + dy * t - y1) * edge_y
+        ) * inverse_length_squared
+        if 0 <= along <= 1:
+            best = (t, normal_x, normal_y)
+
+    a = dx * dx + dy * dy
+    if a == 0:
+        return best
+    for corner_x, corner_y in points:
+        offset_x, offset_y = x - corner_x, y - corner_y
+        b = 2 * (offset_x * dx + offset_y * dy)
+        if b >= 0:
+            continue
+        c = offset_x * offset_x + offset_y * offset_y - radius * radius
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            continue
+        t = max(0.0, (-b - math.sqrt(discriminant)) / (2 * a))
+        if t > 1 or (best and t >= best[0]):
+            continue
+        hit_x, hit_y = offset_x + dx * t, offset_y + dy * t
+        distance = math.hypot(hit_x, hit_y) or 1
+        best = (t, hit_x / distance, hit_y / distance)
+
+    return best
+
+
+def segment_distance_squared(x, y, dx, dy, point_x, point_y):
+    """
+    Squared distance from a point to the segment from (x, y) to (x + dx, y + dy).
+    """
+    length_squared = dx * dx + dy * dy
+    t = 0.0
+    if length_squared:
+        t = max(
+            0.0, min(1.0, ((point_x - x) * dx + (point_y - y) * dy) / length_squared)
+        )
+    offset_x, offset_y = x + dx * t - point_x, y + dy * t - point_y
+    return offset_x * offset_x + offset_y * offset_y
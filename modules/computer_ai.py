@@ -1,8 +1,14 @@
+import functools
+import hashlib
+import mmap
+import os
 import random
+import struct
+from modules.assets import ROOT
 
 
 def calculate_computer_move(
-    ball_y, paddle_y, paddle_height, court_height, speed, randomness
+    ball_y, paddle_y, paddle_height, court_height, speed, randomness, rng=random
 ):
     """
     Calculate the computer paddle's movement direction based on the current game state and AI settings.
@@ -13,6 +19,7 @@ def calculate_computer_move(
     :param court_height: Height of the game court
     :param speed: AI speed setting (0-100)
     :param randomness: AI randomness setting (0-100)
+    :param rng: random.Random to draw from, for reproducible matches
     :return: Movement direction (-1 for up, 1 for down, 0 for no movement)
     """
 
@@ -20,7 +27,7 @@ def calculate_computer_move(
     paddle_center = paddle_y + paddle_height / 2
 
     # Add randomness to the target
-    random_factor = (random.random() - 0.5) * randomness / 50  # -1 to 1 range
+    random_factor = (rng.random() - 0.5) * randomness / 50  # -1 to 1 range
     target_y = ball_y + random_factor * paddle_height
 
     # Determine direction to move
@@ -34,4 +41,302 @@ def calculate_computer_move(
     # Note: We're not using the speed parameter here. It will be used in the main game loop.
 
 
-# You can add additional helper functions or constants here if needed in the future
+MAX_PREDICTED_BOUNCES = 8
+
+PLAYER_MODEL_PATH = os.path.join(ROOT, "player_model.bin")
+# Magic, format version, number of recorded moves, then the bins of MODEL_FEATURES
+PLAYER_MODEL_HEADER = struct.Struct("<4sHI6H")
+PLAYER_MODEL_MAGIC = b"PMDL"
+PLAYER_MODEL_VERSION = 1
+PLAYER_MODEL_DIGEST_SIZE = 8
+# (name, low, high, bins) of the state a player's move is looked up by. Every
+# feature is measured from the paddle's side, so one model drives either paddle.
+MODEL_FEATURES = (
+    ("ball_distance", 0, 800, 12),  # From the paddle's face, along x
+    ("ball_approach", -15, 15, 6),  # Horizontal speed towards the paddle
+    ("ball_dy", -15, 15, 6),
+    ("ball_offset", -300, 300, 16),  # Ball center relative to the paddle center
+    ("paddle_y", 0, 600, 8),  # Paddle center
+    ("previous_move", -1, 2, 3),  # Keys are held, so the last move matters most
+)
+
+
+def fold_into_court(y, low, high):
+    """
+    Mirror a y-position that ignored the walls back between low and high.
+    """
+    span = high - low
+    if span <= 0:
+        return low
+    offset = (y - low) % (2 * span)
+    return low + (offset if offset <= span else 2 * span - offset)
+
+
+def predict_intercept(
+    ball_x,
+    ball_y,
+    ball_dx,
+    ball_dy,
+    target_x,
+    court_height,
+    ball_radius,
+    obstacles=None,
+):
+    """
+    Predict where the ball's center will be when it reaches target_x.
+
+    :param ball_x: X-position of the ball's center
+    :param ball_y: Y-position of the ball's center
+    :param ball_dx: Horizontal ball speed
+    :param ball_dy: Vertical ball speed
+    :param target_x: X-position to predict the crossing for
+    :param court_height: Height of the game court
+    :param ball_radius: Radius of the ball
+    :param obstacles: Optional ObstacleField whose bounces are traced as well
+    :return: Predicted y-position, or None if the ball is not heading for target_x
+    """
+    if ball_dx == 0 or (target_x - ball_x) * ball_dx <= 0:
+        return None
+    low, high = ball_radius, court_height - ball_radius
+    if obstacles is None:
+        return fold_into_court(
+            ball_y + ball_dy * (target_x - ball_x) / ball_dx, low, high
+        )
+
+    x, y, dx, dy = ball_x, ball_y, ball_dx, ball_dy
+    for _ in range(MAX_PREDICTED_BOUNCES):
+        if (target_x - x) * dx <= 0:
+            return None
+        frames = (target_x - x) / dx
+        wall_frames = float("inf")
+        if dy:
+            wall_frames = max(0.0, ((low if dy < 0 else high) - y) / dy)
+        span = min(frames, wall_frames)
+        hit = obstacles.sweep_collision(x, y, dx * span, dy * span)
+        if hit:
+            t, normal, _ = hit
+            x += dx * span * t + normal.x * 0.01
+            y += dy * span * t + normal.y * 0.01
+            along_normal = dx * normal.x + dy * normal.y
+            dx, dy = dx - 2 * along_normal * normal.x, dy - 2 * along_normal * normal.y
+            continue
+        x, y = x + dx * span, y + dy * span
+        if frames <= wall_frames:
+            return y
+        dy = -dy
+    return None
+
+
+class PredictiveComputer:
+    """
+    Computer opponent that heads for where the ball will cross its paddle.
+
+    The intercept is only worked out when the ball's velocity changes, so the
+    per-frame cost is a comparison and the same -1/0/1 decision as
+    calculate_computer_move.
+
+    :param paddle_x: X-position of the ball's center when it meets the paddle
+    :param court_height: Height of the game court
+    :param ball_radius: Radius of the ball
+    :param randomness: Prediction error (0-100), in the same units as the
+        reactive AI's COMPUTER_RANDOMNESS
+    :param reaction_delay: Frames to keep chasing the old target after the ball
+        changes direction
+    :param rng: random.Random to draw the prediction error from
+    """
+
+    def __init__(
+        self,
+        paddle_x,
+        court_height,
+        ball_radius,
+        randomness=0,
+        reaction_delay=0,
+        rng=random,
+    ):
+        self.paddle_x = paddle_x
+        self.court_height = court_height
+        self.ball_radius = ball_radius
+        self.randomness = randomness
+        self.reaction_delay = reaction_delay
+        self.rng = rng
+        self.velocity = None
+        self.target_y = self.pending_target_y = court_height / 2
+        self.frames_until_reaction = 0
+
+    def calculate_move(
+        self, ball_x, ball_y, ball_dx, ball_dy, paddle_y, paddle_height, obstacles=None
+    ):
+        """
+        :param paddle_y: Y-position of the paddle's top edge
+        :return: Movement direction (-1 for up, 1 for down, 0 for no movement)
+        """
+        if (ball_dx, ball_dy) != self.velocity:
+            self.velocity = (ball_dx, ball_dy)
+            intercept = predict_intercept(
+                ball_x,
+                ball_y,
+                ball_dx,
+                ball_dy,
+                self.paddle_x,
+                self.court_height,
+                self.ball_radius,
+                obstacles,
+            )
+            if intercept is None:
+                # Drift back to the middle while the ball is heading away
+                self.pending_target_y = self.court_height / 2
+            else:
+                random_factor = (self.rng.random() - 0.5) * self.randomness / 50
+                self.pending_target_y = intercept + random_factor * paddle_height
+            self.frames_until_reaction = self.reaction_delay
+
+        if self.frames_until_reaction > 0:
+            self.frames_until_reaction -= 1
+        else:
+            self.target_y = self.pending_target_y
+
+        paddle_center = paddle_y + paddle_height / 2
+        if self.target_y < paddle_center - 2:
+            return -1
+        elif self.target_y > paddle_center + 2:
+            return 1
+        return 0
+
+
+class PlayerModel:
+    """
+    What recorded human players did in each game state, memory-mapped from a
+    file built by modules.player_model.
+
+    The state space of MODEL_FEATURES is cut into a grid, and every cell holds
+    how likely the players whose states fell nearest to it were to move up,
+    stay or move down, as two cumulative bytes. The nearest-neighbour search
+    happens when the model is built, so a lookup is a few multiplications and
+    two byte reads, and the operating system pages in only the cells a match
+    visits.
+
+    :param path: Model file
+    """
+
+    def __init__(self, path=PLAYER_MODEL_PATH):
+        with open(path, "rb") as f:
+            self.table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.samples, *bins = PLAYER_MODEL_HEADER.unpack_from(
+            self.table
+        )
+        if magic != PLAYER_MODEL_MAGIC:
+            raise ValueError(f"{path} is not a player model")
+        if version != PLAYER_MODEL_VERSION or tuple(bins) != model_bins():
+            raise ValueError(f"{path} was built for another model layout")
+        if len(self.table) != PLAYER_MODEL_HEADER.size + model_cells() * 2:
+            raise ValueError(f"{path} is truncated")
+        # Identifies the model in replays, which only replay against the same one
+        self.digest = hashlib.blake2b(
+            self.table, digest_size=PLAYER_MODEL_DIGEST_SIZE
+        ).digest()
+
+    def move(self, cell, rng=random):
+        """
+        Draw a move for a cell as a recorded player would have made it.
+
+        :param cell: Index from model_cell()
+        :return: Movement direction (-1 for up, 1 for down, 0 for no movement)
+        """
+        offset = PLAYER_MODEL_HEADER.size + cell * 2
+        draw = rng.random() * 255
+        if draw < self.table[offset]:
+            return -1
+        if draw < self.table[offset + 1]:
+            return 0
+        return 1
+
+
+def model_bins():
+    return tuple(bins for *_, bins in MODEL_FEATURES)
+
+
+def model_cells():
+    cells = 1
+    for bins in model_bins():
+        cells *= bins
+    return cells
+
+
+def model_cell(ball_x, ball_y, ball_dx, ball_dy, paddle_x, paddle_y, previous_move):
+    """
+    Grid cell of PlayerModel for a game state, seen from one paddle.
+
+    :param paddle_x: X-position of the ball's center when it meets the paddle
+    :param paddle_y: Y-position of the paddle's center
+    :param previous_move: The paddle's movement direction on the last frame
+    """
+    # 1 if the paddle is on the right, where the ball approaches with dx > 0
+    side = 1 if paddle_x > ball_x or (paddle_x == ball_x and ball_dx > 0) else -1
+    state = (
+        (paddle_x - ball_x) * side,
+        ball_dx * side,
+        ball_dy,
+        ball_y - paddle_y,
+        paddle_y,
+        previous_move,
+    )
+    cell = 0
+    for value, (_, low, high, bins) in zip(state, MODEL_FEATURES):
+        index = int((value - low) * bins / (high - low))
+        cell = cell * bins + (0 if index < 0 else bins - 1 if index >= bins else index)
+    return cell
+
+
+@functools.lru_cache(maxsize=None)
+def _player_model(path, modified):
+    return PlayerModel(path)
+
+
+def load_player_model(path=PLAYER_MODEL_PATH):
+    """
+    :return: The PlayerModel at path, shared by every caller until the file is
+        rebuilt, or None if no model has been built
+    """
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _player_model(path, modified)
+
+
+class HumanLikeComputer:
+    """
+    Computer opponent that moves the way recorded human players did.
+
+    Each frame draws a move from the PlayerModel cell of the current state, so
+    the paddle hesitates, overshoots and holds its keys the way people do
+    instead of jittering around the ball like calculate_computer_move.
+
+    :param model: PlayerModel to draw moves from
+    :param paddle_x: X-position of the ball's center when it meets the paddle
+    :param rng: random.Random to draw the moves from
+    """
+
+    def __init__(self, model, paddle_x, rng=random):
+        self.model = model
+        self.paddle_x = paddle_x
+        self.rng = rng
+        self.previous_move = 0
+
+    def calculate_move(self, ball_x, ball_y, ball_dx, ball_dy, paddle_y, paddle_height):
+        """
+        :param paddle_y: Y-position of the paddle's top edge
+        :return: Movement direction (-1 for up, 1 for down, 0 for no movement)
+        """
+        cell = model_cell(
+            ball_x,
+            ball_y,
+            ball_dx,
+            ball_dy,
+            self.paddle_x,
+            paddle_y + paddle_height / 2,
+            self.previous_move,
+        )
+        self.previous_move = self.model.move(cell, self.rng)
+        return self.previous_move
@@ -0,0 +1,52 @@
+import pygame
+
+
+def push_to_display(rects=None):
+    if rects is None:
+        pygame.display.flip()
+    else:
+        pygame.display.update(rects)
+
+
+class DirtyRectRenderer:
+    """
+    Clears and pushes only the regions that changed between two frames.
+
+    Each frame, clear() erases what was drawn in the previous frame, the caller
+    draws and reports the bounds of the moving parts with add(), and update()
+    sends both the old and new bounds to the display. Static artwork such as the
+    obstacle is redrawn by the caller but never reported; call invalidate() when
+    it changes so the next frame is pushed in full.
+
+    :param present: Callable pushing a list of rects to the screen, or everything
+        when given None; defaults to pygame.display
+    """
+
+    def __init__(self, surface, background, present=None):
+        self.surface = surface
+        self.background = background
+        self.present = present or push_to_display
+        self.previous = []
+        self.current = []
+        self.full_update = True
+
+    def invalidate(self):
+        self.full_update = True
+
+    def clear(self):
+        if self.full_update:
+            self.surface.fill(self.background)
+        else:
+            for rect in self.previous:
+                self.surface.fill(self.background, rect)
+
+    def add(self, *rects):
+        self.current.extend(rect.copy() for rect in rects if rect)
+
+    def update(self):
+        if self.full_update:
+            self.present(None)
+            self.full_update = False
+        else:
+            self.present(self.previous + self.current)
+        self.previous, self.current = self.current, []
@@ -0,0 +1,103 @@
+import pygame
+
+# Target frames per second, from smoothest to cheapest
+FRAME_RATES = (60, 45, 30)
+GOVERNOR_WINDOW = 60  # Frames measured before each decision
+BUSY_PERCENTILE = 0.9  # Decide on the slowest tenth of frames, not the average
+STEP_DOWN_LOAD = 0.85  # Step down once busy time reaches this part of the budget
+STEP_UP_LOAD = 0.5  # Step up only if the faster rate would stay under this
+STEP_UP_WINDOWS = 3  # Calm windows in a row needed before stepping up
+
+
+class Display:
+    """
+    The game window and the canvas everything is drawn on.
+
+    The window is opened once with pygame.SCALED, so SDL stretches the logical
+    resolution to the window or screen instead of the game drawing more pixels
+    on a bigger display. The logical resolution never changes, so neither does
+    the window's size.
+
+    :param width: Logical width the game draws at
+    :param height: Logical height the game draws at
+    :param fullscreen: Fill the screen instead of opening a window
+    """
+
+    def __init__(self, width, height, fullscreen=False):
+        self.size = (width, height)
+        flags = pygame.SCALED | (pygame.FULLSCREEN if fullscreen else 0)
+        self.canvas = pygame.display.set_mode(self.size, flags)
+
+    def present(self, rects=None):
+        """
+        Show the canvas, only the given canvas rects if possible.
+        """
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+
+class FrameGovernor:
+    """
+    Walks FRAME_RATES to keep the time spent on each frame within budget.
+
+    Physics runs at a fixed rate whatever the frame rate, so trading frames for
+    time only changes how smooth the game looks, not how fast it plays. Busy
+    time is the frame time without the clock's idle wait.
+
+    Only the frame rate is stepped. Drawing at a lower resolution still drew the
+    whole canvas and then cost a scale and a full flip on top, so it made every
+    frame dearer rather than cheaper.
+
+    :param max_fps: Upper limit for every frame rate
+    """
+
+    def __init__(self, rates=FRAME_RATES, max_fps=None, window=GOVERNOR_WINDOW):
+        self.rates = rates
+        self.max_fps = max_fps
+        self.window = window
+        self.level = 0
+        self.busy_times = []
+        self.calm_windows = 0
+
+    @property
+    def fps(self):
+        return self._fps_of(self.level)
+
+    def _fps_of(self, level):
+        return min(self.rates[level], self.max_fps or self.rates[0])
+
+    def record(self, busy_ms):
+        """
+        Add a frame's busy time.
+
+        :return: True if the frame rate changed
+        """
+        self.busy_times.append(busy_ms)
+        if len(self.busy_times) < self.window:
+            return False
+        busy_times = sorted(self.busy_times)
+        busy = busy_times[int(len(busy_times) * BUSY_PERCENTILE)]
+        self.busy_times = []
+
+        if busy > STEP_DOWN_LOAD * 1000 / self.fps:
+            self.calm_windows = 0
+            if self.level < len(self.rates) - 1:
+                self.level += 1
+                return True
+            return False
+
+        if self.level == 0:
+            return False
+        # A frame costs the same at any rate, there is just less time for it
+        better = self.level - 1
+        if busy < STEP_UP_LOAD * 1000 / self._fps_of(better):
+            self.calm_windows += 1
+            if self.calm_windows >= STEP_UP_WINDOWS:
+                self.calm_windows = 0
+                self.level = better
+                return True
+        else:
+            self.calm_windows = 0
+        return False
@@ -0,0 +1,391 @@
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
+import pygame
+from multiprocessing import shared_memory
+from modules.simulation import (
+    PongSimulation,
+    PlayerInput,
+    MAX_MATCH_FRAMES,
+    WIDTH,
+    HEIGHT,
+)
+
+WHITE, BLACK = (255, 255, 255), (0, 0, 0)
+STAY, UP, DOWN = 0, 1, 2
+ACTIONS = (PlayerInput(), PlayerInput(up=True), PlayerInput(down=True))
+STATE_FIELDS = (
+    "ball_x",
+    "ball_y",
+    "ball_dx",
+    "ball_dy",
+    "paddle_y",
+    "paddle_height",
+    "opponent_y",
+    "ball_moving",
+)
+VELOCITY_SCALE = 10  # Ball speeds stay within about +-2 after dividing by this
+SHARED_ALIGNMENT = 8
+
+
+def observation_spec(observation="state", pixel_size=None, court_size=None):
+    """
+    Shape and dtype of a single PongEnv observation.
+
+    :param observation: "state" for STATE_FIELDS as float32, "pixels" for the
+        rendered court as height x width x RGB bytes
+    :param pixel_size: (width, height) of pixel observations, the court size
+        by default
+    """
+    if observation == "state":
+        return (len(STATE_FIELDS),), np.float32
+    if observation == "pixels":
+        width, height = pixel_size or court_size
+        return (height, width, 3), np.uint8
+    raise ValueError(f"unknown observation type {observation!r}")
+
+
+class PongEnv:
+    """
+    The game rules of PongSimulation as a reset()/step() training environment.
+
+    The agent plays the computer paddle on the left, the paddle a learned
+    opponent would drive in place of calculate_computer_move; the player paddle
+    is driven by the computer AI. Actions are STAY, UP and DOWN, the ball is
+    served automatically, and every point scores +1 for the agent or -1 for
+    the other side. An episode ends with the match or after max_frames steps.
+
+    Observations are written in place into one array, which is returned by
+    every call. For pixel observations the court is drawn on a pygame surface
+    created over that array with pygame.image.frombuffer, so the pixels are
+    never copied out of the surface. Pass observation_buffer to have them
+    written into memory owned by the caller, e.g. shared memory.
+
+    :param game_settings: GAME_SETTINGS for the match
+    :param observation: "state" or "pixels", see observation_spec()
+    :param observation_buffer: Array of observation_spec()'s shape and dtype
+    """
+
+    def __init__(
+        self,
+        game_settings,
+        observation="state",
+        pixel_size=None,
+        max_frames=MAX_MATCH_FRAMES,
+        seed=None,
+        observation_buffer=None,
+    ):
+        self.game_settings = game_settings
+        self.observation_type = observation
+        self.max_frames = max_frames
+        self.simulation = PongSimulation(game_settings, seed=seed)
+        court_size = (self.simulation.width, self.simulation.height)
+        shape, dtype = observation_spec(observation, pixel_size, court_size)
+        if observation_buffer is None:
+            observation_buffer = np.zeros(shape, dtype)
+        elif observation_buffer.shape != shape or observation_buffer.dtype != dtype:
+            raise ValueError(f"observation_buffer must be {shape} {np.dtype(dtype)}")
+        self.observation = observation_buffer
+
+        if observation == "pixels":
+            self.surface = pygame.image.frombuffer(
+                self.observation, (shape[1], shape[0]), "RGB"
+            )
+            # Drawn at court size and shrunk in one go when the sizes differ
+            self.court_surface = (
+                self.surface
+                if self.surface.get_size() == court_size
+                else pygame.Surface(court_size, 0, self.surface)
+            )
+
+    def reset(self, seed=None):
+        """
+        Start a new match, from a new random generator if seed is given.
+
+        :return: (observation, info)
+        """
+        if seed is not None:
+            self.simulation = PongSimulation(self.game_settings, seed=seed)
+        else:
+            self.simulation.reset()
+        self._observe()
+        return self.observation, self._info()
+
+    def step(self, action):
+        """
+        Advance the match by one frame with the agent's paddle moved by action.
+
+        :return: (observation, reward, terminated, truncated, info)
+        """
+        simulation = self.simulation
+        scores = simulation.computer_score - simulation.player_score
+        simulation.step(simulation.autopilot_input(), ACTIONS[action])
+        reward = simulation.computer_score - simulation.player_score - scores
+        terminated = simulation.game_over
+        truncated = not terminated and simulation.frame >= self.max_frames
+        self._observe()
+        return self.observation, float(reward), terminated, truncated, self._info()
+
+    def _info(self):
+        return {
+            "frame": self.simulation.frame,
+            "agent_score": self.simulation.computer_score,
+            "opponent_score": self.simulation.player_score,
+        }
+
+    def _observe(self):
+        if self.observation_type == "pixels":
+            self._render()
+            return
+        simulation = self.simulation
+        paddle = simulation.computer_paddle
+        self.observation[:] = (
+            simulation.ball_x / simulation.width,
+            simulation.ball_y / simulation.height,
+            simulation.ball_dx / VELOCITY_SCALE,
+            simulation.ball_dy / VELOCITY_SCALE,
+            paddle.centery / simulation.height,
+            paddle.height / simulation.height,
+            simulation.player_paddle.centery / simulation.height,
+            simulation.ball_moving,
+        )
+
+    def _render(self):
+        simulation = self.simulation
+        surface = self.court_surface
+        surface.fill(BLACK)
+        if simulation.obstacles is not None:
+            simulation.obstacles.draw(surface, WHITE)
+        pygame.draw.rect(surface, WHITE, simulation.player_paddle)
+        pygame.draw.rect(surface, WHITE, simulation.computer_paddle)
+        pygame.draw.ellipse(surface, WHITE, simulation.ball)
+        if simulation.swarm is not None:
+            simulation.swarm.draw(surface, WHITE)
+        if surface is not self.surface:
+            pygame.transform.scale(surface, self.surface.get_size(), self.surface)
+
+
+def _shared_layout(count, observation_shape, observation_dtype):
+    """
+    :return: List of (name, shape, dtype, offset) for the arrays a
+        VectorPongEnv shares with its workers, and the bytes they need
+    """
+    fields = (
+        ("observations", (count, *observation_shape), observation_dtype),
+        ("actions", (count,), np.int8),
+        ("rewards", (count,), np.float32),
+        ("terminated", (count,), np.bool_),
+        ("truncated", (count,), np.bool_),
+    )
+    layout = []
+    offset = 0
+    for name, shape, dtype in fields:
+        offset = -(-offset // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+        layout.append((name, shape, dtype, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+
+def _shared_arrays(buffer, layout):
+    return {
+        name: np.ndarray(shape, dtype, buffer, offset)
+        for name, shape, dtype, offset in layout
+    }
+
+
+def _worker(connection, memory_name, layout, indices, env_options, seed):
+    memory = shared_memory.SharedMemory(memory_name)
+    arrays = _shared_arrays(memory.buf, layout)
+    envs = {
+        i: PongEnv(
+            **env_options,
+            seed=None if seed is None else seed + i,
+            observation_buffer=arrays["observations"][i],
+        )
+        for i in indices
+    }
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "close":
+                break
+            try:
+                for i, env in envs.items():
+                    if command == "reset":
+                        env.reset(None if argument is None else argument + i)
+                        continue
+                    _, reward, terminated, truncated, _ = env.step(arrays["actions"][i])
+                    arrays["rewards"][i] = reward
+                    arrays["terminated"][i] = terminated
+                    arrays["truncated"][i] = truncated
+                    if terminated or truncated:
+                        env.reset()
+            except Exception as error:
+                connection.send(error)
+            else:
+                connection.send(None)
+    finally:
+        # The views have to go before the shared memory can be closed
+        envs.clear()
+        arrays.clear()
+        memory.close()
+
+
+class VectorPongEnv:
+    """
+    Many PongEnvs stepped together by worker processes.
+
+    Observations, actions, rewards and end flags live in one block of shared
+    memory that every worker writes its environments' results into, so only
+    a short command crosses a pipe per step and frames are never pickled. The
+    arrays returned by reset() and step() are views of that block and are
+    overwritten by the next call; copy them to keep them. An environment whose
+    episode ended is reset right away, so its observation is already the first
+    one of the next episode.
+
+    :param count: Number of environments
+    :param workers: Worker processes, the number of CPUs by default
+    :param seed: Environment i is seeded with seed + i
+    """
+
+    def __init__(
+        self,
+        count,
+        game_settings,
+        observation="state",
+        pixel_size=None,
+        max_frames=MAX_MATCH_FRAMES,
+        workers=None,
+        seed=None,
+    ):
+        self.count = count
+        shape, dtype = observation_spec(observation, pixel_size, (WIDTH, HEIGHT))
+        layout, size = _shared_layout(count, shape, dtype)
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = _shared_arrays(self.memory.buf, layout)
+        env_options = {
+            "game_settings": game_settings,
+            "observation": observation,
+            "pixel_size": pixel_size,
+            "max_frames": max_frames,
+        }
+
+        self.connections = []
+        self.processes = []
+        workers = min(count, workers or os.cpu_count())
+        for indices in np.array_split(np.arange(count), workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(
+                    worker_connection,
+                    self.memory.name,
+                    layout,
+                    indices.tolist(),
+                    env_options,
+                    seed,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self, command, argument=None):
+        for connection in self.connections:
+            connection.send((command, argument))
+        errors = [connection.recv() for connection in self.connections]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def reset(self, seed=None):
+        """
+        :return: Observations of all environments
+        """
+        self._run("reset", seed)
+        return self.arrays["observations"]
+
+    def step(self, actions):
+        """
+        :param actions: One action per environment
+        :return: (observations, rewards, terminated, truncated)
+        """
+        self.arrays["actions"][:] = actions
+        self._run("step")
+        return (
+            self.arrays["observations"],
+            self.arrays["rewards"],
+            self.arrays["terminated"],
+            self.arrays["truncated"],
+        )
+
+    def close(self):
+        if self.memory is None:
+            return
+        for connection in self.connections:
+            connection.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.arrays = None
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Step Pong training environments with random actions"
+    )
+    parser.add_argument("--envs", type=int, default=16, help="environments")
+    parser.add_argument("--steps", type=int, default=1000, help="steps per env")
+    parser.add_argument("--workers", type=int, help="worker processes")
+    parser.add_argument("--observation", choices=("state", "pixels"), default="state")
+    parser.add_argument(
+        "--pixel-size",
+        type=int,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="size of pixel observations",
+    )
+    args = parser.parse_args()
+
+    from modules import game_options
+
+    settings = game_options.load_settings()["GAME_SETTINGS"]
+    rng = np.random.default_rng(0)
+    with VectorPongEnv(
+        args.envs,
+        settings,
+        args.observation,
+        args.pixel_size,
+        workers=args.workers,
+        seed=0,
+    ) as env:
+        env.reset()
+        points = episodes = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            _, rewards, terminated, truncated = env.step(
+                rng.integers(0, len(ACTIONS), args.envs)
+            )
+            points += int(np.count_nonzero(rewards))
+            episodes += int(np.count_nonzero(terminated | truncated))
+        elapsed = time.perf_counter() - start
+    steps = args.envs * args.steps
+    print(
+        f"{steps} steps in {elapsed:.2f}s, {steps / elapsed:.0f} steps/s, "
+        f"{points} points, {episodes} episodes finished"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,116 +1,154 @@
 import pygame
-import json
-import os
-
-# Initialize Pygame
-pygame.init()
+from modules import assets
+from modules.scene import Scene
+from modules.settings_store import get_store
+from modules.text_cache import text_cache
 
 # Constants
 WIDTH, HEIGHT = 800, 600
 WHITE, BLACK, CYAN = (255, 255, 255), (0, 0, 0), (0, 255, 255)
 FONT_SIZE = 14
 INSTRUCTION_FONT_SIZE = 12
-
-# Load fonts
-font = pygame.font.Font("fonts/8-bit-wonder.ttf", FONT_SIZE)
-instruction_font = pygame.font.Font("fonts/8-bit-wonder.ttf", INSTRUCTION_FONT_SIZE)
+OPTIONS_TOP = 120
+OPTION_ROW_HEIGHT = 40
+MAX_BALL_COUNT = 500
 
 
 def draw_text(surface, text, font, color, x, y):
-    text_surface = font.render(text, True, color)
+    text_surface = text_cache.render(font, text, color)
     text_rect = text_surface.get_rect(center=(x, y))
     surface.blit(text_surface, text_rect)
 
 
 def load_settings():
-    settings_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)), "settings.db"
-    )
-    with open(settings_path, "r") as f:
-        return json.load(f)
+    """
+    Return a copy of the cached settings; settings.db is only read once.
+    """
+    return get_store().load()
 
 
 def save_settings(settings):
-    settings_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)), "settings.db"
-    )
-    with open(settings_path, "w") as f:
-        json.dump(settings, f, indent=2)
-
-
-def show_options_menu(screen):
-    settings = load_settings()
-    options = list(settings["GAME_SETTINGS"].keys())
-    selected = 0
-
-    while True:
+    """
+    Update the cached settings and write settings.db in the background.
+    """
+    get_store().save(settings)
+
+
+class OptionsMenu(Scene):
+    """
+    Lists GAME_SETTINGS for editing; redrawn only when a key changes something.
+    """
+
+    def __init__(self, settings):
+        super().__init__()
+        self.settings = settings
+        self.options = list(settings["GAME_SETTINGS"].keys())
+        self.font = assets.font(FONT_SIZE)
+        self.instruction_font = assets.font(INSTRUCTION_FONT_SIZE)
+        self.selected = 0
+
+    def draw(self, screen):
         screen.fill(BLACK)
 
         # Draw instructions
-        instructions = settings["LANGUAGE_COPY"]["OPTIONS_INSTRUCTIONS"]
+        instructions = self.settings["LANGUAGE_COPY"]["OPTIONS_INSTRUCTIONS"]
         for i, instruction in enumerate(instructions):
             draw_text(
-                screen, instruction, instruction_font, CYAN, WIDTH // 2, 30 + i * 20
+                screen,
+                instruction,
+                self.instruction_font,
+                CYAN,
+                WIDTH // 2,
+                30 + i * 20,
             )
 
-        # Draw options
-        for i, option in enumerate(options):
-            color = WHITE if i != selected else BLACK
-            bg_color = BLACK if i != selected else WHITE
-            value = settings["GAME_SETTINGS"][option]
+        # Draw options, closer together once they no longer fit
+        row_height = min(OPTION_ROW_HEIGHT, (HEIGHT - OPTIONS_TOP) // len(self.options))
+        for i, option in enumerate(self.options):
+            color = WHITE if i != self.selected else BLACK
+            bg_color = BLACK if i != self.selected else WHITE
+            value = self.settings["GAME_SETTINGS"][option]
             if isinstance(value, bool):
                 value = "On" if value else "Off"
-            text = f"{settings['LANGUAGE_COPY'][option + '_SETTING']}: {value}"
+            elif option == "ARENA":
+                value = value or "Random"
+            text = f"{self.settings['LANGUAGE_COPY'][option + '_SETTING']}: {value}"
+
+            top = OPTIONS_TOP + i * row_height
+            pygame.draw.rect(screen, bg_color, (WIDTH // 4, top, WIDTH // 2, 30))
+            draw_text(screen, text, self.font, color, WIDTH // 2, top + 15)
+
+    def handle_event(self, event):
+        settings, options = self.settings, self.options
+        if event.type == pygame.QUIT:
+            self.finish(None)
+        elif event.type == pygame.KEYDOWN:
+            self.dirty = True
+            if event.key == pygame.K_UP:
+                self.selected = (self.selected - 1) % len(options)
+            elif event.key == pygame.K_DOWN:
+                self.selected = (self.selected + 1) % len(options)
+            elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                option = options[self.selected]
+                value = settings["GAME_SETTINGS"][option]
+                if isinstance(value, bool):
+                    settings["GAME_SETTINGS"][option] = not value
+                elif option == "ARENA":
+                    # Cycle through the shipped arenas, "" being random obstacles
+                    arenas = ["", *assets.arena_names()]
+                    change = -1 if event.key == pygame.K_LEFT else 1
+                    index = arenas.index(value) if value in arenas else 0
+                    settings["GAME_SETTINGS"][option] = arenas[
+                        (index + change) % len(arenas)
+                    ]
+                elif isinstance(value, int):
+                    change = -1 if event.key == pygame.K_LEFT else 1
+                    if option in ["WINNING_POINTS", "BALL_SPEED_TURNS"]:
+                        settings["GAME_SETTINGS"][option] = max(
+                            1, min(10, value + change)
+                        )
+                    elif option == "BALL_INCREMENT":
+                        settings["GAME_SETTINGS"][option] = max(
+                            1, min(20, value + change)
+                        )
+                    elif option == "COMPUTER_REACTION":
+                        settings["GAME_SETTINGS"][option] = max(
+                            0, min(30, value + change)
+                        )
+                    elif option == "BALL_COUNT":
+                        # Step by ten past ten, party counts are in the hundreds
+                        if value > 10 or (value == 10 and change > 0):
+                            change *= 10
+                        settings["GAME_SETTINGS"][option] = max(
+                            1, min(MAX_BALL_COUNT, value + change)
+                        )
+                    elif option == "OBSTACLE_COUNT":
+                        settings["GAME_SETTINGS"][option] = max(
+                            1, min(50, value + change)
+                        )
+                    else:
+                        settings["GAME_SETTINGS"][option] = max(
+                            0, min(100, value + change)
+                        )
+            elif event.key == pygame.K_RETURN:
+                save_settings(settings)
+                self.finish(settings)
+            elif event.key == pygame.K_ESCAPE:
+                self.finish(None)
+            else:
+                self.dirty = False
 
-            pygame.draw.rect(
-                screen, bg_color, (WIDTH // 4, 120 + i * 40, WIDTH // 2, 30)
-            )
-            draw_text(screen, text, font, color, WIDTH // 2, 135 + i * 40)
-
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return None
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
-                    selected = (selected - 1) % len(options)
-                elif event.key == pygame.K_DOWN:
-                    selected = (selected + 1) % len(options)
-                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
-                    option = options[selected]
-                    value = settings["GAME_SETTINGS"][option]
-                    if isinstance(value, bool):
-                        settings["GAME_SETTINGS"][option] = not value
-                    elif isinstance(value, int):
-                        change = -1 if event.key == pygame.K_LEFT else 1
-                        if option in ["WINNING_POINTS", "BALL_SPEED_TURNS"]:
-                            settings["GAME_SETTINGS"][option] = max(
-                                1, min(10, value + change)
-                            )
-                        elif option == "BALL_INCREMENT":
-                            settings["GAME_SETTINGS"][option] = max(
-                                1, min(20, value + change)
-                            )
-                        else:
-                            settings["GAME_SETTINGS"][option] = max(
-                                0, min(100, value + change)
-                            )
-                elif event.key == pygame.K_RETURN:
-                    save_settings(settings)
-                    return settings
-                elif event.key == pygame.K_ESCAPE:
-                    return None
+
+def show_options_menu(screen):
+    return OptionsMenu(load_settings()).run(screen)
 
 
 def update_game_stats(stat_name, value):
-    settings = load_settings()
-    if value > settings["GAME_STATS"].get(stat_name, 0):
-        settings["GAME_STATS"][stat_name] = value
-        save_settings(settings)
+    return get_store().update_stat(stat_name, value)
 
 
 if __name__ == "__main__":
+    pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("Pong Options")
     show_options_menu(screen)
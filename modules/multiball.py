@@ -0,0 +1,208 @@
+import math
+import numpy as np
+import pygame
+
+MAX_LAUNCH_ANGLE = math.pi / 3  # Keep extra balls from bouncing straight up and down
+OBSTACLE_PUSH = 1.01  # Same extra clearance as Obstacle.resolve_collision
+
+
+class BallSwarm:
+    """
+    The extra balls of the multi-ball mode, held as a struct of numpy arrays.
+
+    Every ball's position and velocity live in parallel float arrays, so a step
+    moves, bounces and tests all balls against the walls, paddles and each
+    obstacle with a handful of array operations instead of Python code per
+    ball. Collisions are per-step overlap tests, which are exact as long as a
+    ball moves less than a paddle's width plus its diameter per step. Balls
+    don't collide with each other.
+
+    A ball that gets past a paddle is out of play for the rest of the rally: it
+    stops just outside the court until the next launch.
+
+    :param count: Number of balls
+    :param radius: Radius of every ball
+    """
+
+    def __init__(self, count, radius):
+        self.radius = radius
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.dx = np.zeros(count)
+        self.dy = np.zeros(count)
+        self.previous_x = np.zeros(count)
+        self.previous_y = np.zeros(count)
+        self.in_play = np.ones(count, bool)
+        self.sprites = {}
+
+    def __len__(self):
+        return len(self.x)
+
+    def center(self, x, y):
+        """
+        Park every ball at (x, y) without moving it.
+        """
+        for array, value in (
+            (self.x, x),
+            (self.y, y),
+            (self.previous_x, x),
+            (self.previous_y, y),
+            (self.dx, 0),
+            (self.dy, 0),
+        ):
+            array.fill(value)
+
+    def launch(self, speed, rng):
+        """
+        Send every ball off from where it is in its own random direction.
+
+        :param rng: random.Random, so the launch replays with the match's seed
+        """
+        for i in range(len(self)):
+            angle = rng.uniform(-MAX_LAUNCH_ANGLE, MAX_LAUNCH_ANGLE)
+            if rng.random() < 0.5:
+                angle += math.pi
+            self.dx[i] = speed * math.cos(angle)
+            self.dy[i] = speed * math.sin(angle)
+        self.in_play.fill(True)
+
+    def step(self, width, height, paddles, obstacles, events):
+        """
+        Move every ball by one step and bounce it off whatever it touches.
+
+        :param paddles: pygame.Rects the balls bounce off horizontally
+        :param obstacles: ObstacleField or None
+        :param events: List "strike" and "obstacle" are appended to, once per
+            step however many balls hit
+        :return: List with "player" or "computer" for every ball that got past
+            a paddle in this step, the earliest first
+        """
+        radius = self.radius
+        self.previous_x[:] = self.x
+        self.previous_y[:] = self.y
+        self.x += self.dx
+        self.y += self.dy
+
+        top = self.y < radius
+        self.y[top] = 2 * radius - self.y[top]
+        self.dy[top] = np.abs(self.dy[top])
+        bottom = self.y > height - radius
+        self.y[bottom] = 2 * (height - radius) - self.y[bottom]
+        self.dy[bottom] = -np.abs(self.dy[bottom])
+
+        struck = False
+        for paddle in paddles:
+            facing_right = paddle.centerx < width / 2
+            closest_x = np.clip(self.x, paddle.left, paddle.right)
+            closest_y = np.clip(self.y, paddle.top, paddle.bottom)
+            hit = (self.x - closest_x) ** 2 + (self.y - closest_y) ** 2 < radius**2
+            hit &= self.dx < 0 if facing_right else self.dx > 0
+            if hit.any():
+                struck = True
+                self.dx[hit] = -self.dx[hit]
+                self.x[hit] = (
+                    paddle.right + radius if facing_right else paddle.left - radius
+                )
+        if struck:
+            events.append("strike")
+
+        if obstacles is not None and any(
+            [self._bounce_off(obstacle) for obstacle in obstacles]
+        ):
+            events.append("obstacle")
+
+        left = self.x - radius <= 0
+        out = np.flatnonzero(self.in_play & (left | (self.x + radius >= width)))
+        if not len(out):
+            return []
+        # The ball that got out furthest got out earliest
+        overshoot = np.where(
+            left[out], radius - self.x[out], self.x[out] + radius - width
+        ) / np.abs(self.dx[out])
+        out = out[np.argsort(-overshoot, kind="stable")]
+        passed = ["player" if passed_left else "computer" for passed_left in left[out]]
+        self.in_play[out] = False
+        self.x[out] = np.where(left[out], -radius, width + radius)
+        self.dx[out] = self.dy[out] = 0
+        return passed
+
+    def _bounce_off(self, obstacle):
+        """
+        :return: True if any ball hit the obstacle
+        """
+        reach = obstacle.bounding_radius + self.radius
+        near = np.flatnonzero(
+            (self.x - obstacle.center[0]) ** 2 + (self.y - obstacle.center[1]) ** 2
+            <= reach * reach
+        )
+        if not len(near):
+            return False
+
+        best_distance, normal_x, normal_y = obstacle.nearest_surface(
+            self.x[near], self.y[near]
+        )
+        hit = best_distance <= self.radius
+        if not hit.any():
+            return False
+        near, normal_x, normal_y = near[hit], normal_x[hit], normal_y[hit]
+        push = (self.radius - best_distance[hit]) * OBSTACLE_PUSH
+        self.x[near] += normal_x * push
+        self.y[near] += normal_y * push
+        # Reflect only balls still heading in, so a ball that was pushed out
+        # isn't turned back into the obstacle
+        along_normal = self.dx[near] * normal_x + self.dy[near] * normal_y
+        along_normal = np.minimum(along_normal, 0)
+        self.dx[near] -= 2 * along_normal * normal_x
+        self.dy[near] -= 2 * along_normal * normal_y
+        return True
+
+    def most_threatening(self, paddle_x, ball):
+        """
+        The ball that will reach paddle_x first, counting the main ball too.
+
+        :param ball: (x, y, dx, dy) of the main ball
+        :return: (x, y, dx, dy) of the ball to play
+        """
+        if not len(self):
+            return ball
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frames = (paddle_x - self.x) / self.dx
+        frames[~(frames > 0)] = np.inf
+        i = int(np.argmin(frames))
+        x, y, dx, dy = ball
+        ball_frames = (paddle_x - x) / dx if dx else math.inf
+        if frames[i] < (ball_frames if ball_frames > 0 else math.inf):
+            return (
+                float(self.x[i]),
+                float(self.y[i]),
+                float(self.dx[i]),
+                float(self.dy[i]),
+            )
+        return ball
+
+    def _sprite(self, color):
+        sprite = self.sprites.get(color)
+        if sprite is None:
+            sprite = pygame.Surface((self.radius * 2, self.radius * 2))
+            sprite.set_colorkey((0, 0, 0) if color != (0, 0, 0) else (255, 0, 255))
+            sprite.fill(sprite.get_colorkey())
+            pygame.draw.ellipse(sprite, color, sprite.get_rect())
+            self.sprites[color] = sprite
+        return sprite
+
+    def draw(self, surface, color, alpha=1.0):
+        """
+        Draw every ball, blended between the last two steps, by blitting one
+        prerendered ball with a single Surface.blits call.
+
+        :return: List of the rects drawn
+        """
+        sprite = self._sprite(color)
+        x = self.previous_x + (self.x - self.previous_x) * alpha - self.radius
+        y = self.previous_y + (self.y - self.previous_y) * alpha - self.radius
+        return surface.blits(
+            [
+                (sprite, position)
+                for position in zip(x.round().tolist(), y.round().tolist())
+            ]
+        )
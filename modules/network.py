@@ -0,0 +1,563 @@
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+from collections import deque
+from modules.simulation import (
+    PongSimulation,
+    PlayerInput,
+    NO_INPUT,
+    FRAME_MS,
+    MAX_MATCH_FRAMES,
+)
+
+DEFAULT_PORT = 50007
+PROTOCOL_VERSION = 1
+HELLO_INTERVAL = 0.25  # Seconds between connection attempts
+TIMEOUT = 5.0  # Seconds of silence before the other side counts as gone
+REDUNDANT_INPUTS = 8  # Unacknowledged inputs repeated in every input packet
+MAX_QUEUED_INPUTS = 4  # Inputs the host buffers before dropping the oldest
+STATE_HISTORY = 64  # Sent or received states kept as delta baselines
+OUTAGE_START_FRAME = 120  # When run_loopback's simulated outage begins
+FINAL_STATE_SECONDS = 2.0  # How long the host repeats the final state at most
+
+# Packet layouts; every packet starts with a one byte type
+HELLO = struct.Struct("<cB")
+WELCOME = struct.Struct("<cQ")
+INPUT = struct.Struct("<cIIB")  # Acked state frame, newest input sequence, count
+STATE = struct.Struct("<cIIIBH")  # Frame, baseline, last input, events, field mask
+
+# Quantized state fields, in packet order: name, struct format and scale
+STATE_FIELDS = (
+    ("ball_x", "h", 8),
+    ("ball_y", "h", 8),
+    ("ball_dx", "h", 64),
+    ("ball_dy", "h", 64),
+    ("player_y", "h", 1),
+    ("computer_y", "h", 1),
+    ("player_height", "B", 1),
+    ("computer_height", "B", 1),
+    ("player_score", "B", 1),
+    ("computer_score", "B", 1),
+    ("strike_count", "H", 1),
+    ("ball_speed", "H", 10),
+    ("flags", "B", 1),
+)
+FIELD_STRUCTS = [struct.Struct("<" + fmt) for _, fmt, _ in STATE_FIELDS]
+EMPTY_STATE = (0,) * len(STATE_FIELDS)
+BALL_MOVING, GAME_OVER = 1, 2
+EVENT_BITS = {"strike": 1, "obstacle": 2, "point": 4, "game_over": 8, "serve": 16}
+UP, DOWN, SERVE = 1, 2, 4
+
+
+def input_flags(player_input):
+    return (
+        (UP if player_input.up else 0)
+        | (DOWN if player_input.down else 0)
+        | (SERVE if player_input.serve else 0)
+    )
+
+
+def flags_input(flags):
+    return PlayerInput(
+        up=bool(flags & UP), down=bool(flags & DOWN), serve=bool(flags & SERVE)
+    )
+
+
+def snapshot(simulation):
+    """
+    Quantize the parts of a simulation a remote player needs to see.
+    """
+    values = (
+        simulation.ball_x,
+        simulation.ball_y,
+        simulation.ball_dx,
+        simulation.ball_dy,
+        simulation.player_paddle.y,
+        simulation.computer_paddle.y,
+        simulation.player_paddle.height,
+        simulation.computer_paddle.height,
+        simulation.player_score,
+        simulation.computer_score,
+        simulation.strike_count,
+        simulation.current_ball_speed,
+        (BALL_MOVING if simulation.ball_moving else 0)
+        | (GAME_OVER if simulation.game_over else 0),
+    )
+    return tuple(
+        round(value * scale) for value, (_, _, scale) in zip(values, STATE_FIELDS)
+    )
+
+
+def apply_snapshot(simulation, state):
+    """
+    Copy a snapshot into a simulation that is only used for display.
+    """
+    values = {
+        name: value / scale for value, (name, _, scale) in zip(state, STATE_FIELDS)
+    }
+    simulation._store_previous()
+    simulation.ball_x, simulation.ball_y = values["ball_x"], values["ball_y"]
+    simulation.ball.center = (round(simulation.ball_x), round(simulation.ball_y))
+    simulation.ball_dx, simulation.ball_dy = values["ball_dx"], values["ball_dy"]
+    simulation.player_paddle.height = int(values["player_height"])
+    simulation.computer_paddle.height = int(values["computer_height"])
+    simulation.player_paddle.y = int(values["player_y"])
+    simulation.computer_paddle.y = int(values["computer_y"])
+    simulation.player_score = int(values["player_score"])
+    simulation.computer_score = int(values["computer_score"])
+    simulation.strike_count = int(values["strike_count"])
+    simulation.current_ball_speed = values["ball_speed"]
+    simulation.ball_moving = bool(state[-1] & BALL_MOVING)
+    simulation.game_over = bool(state[-1] & GAME_OVER)
+
+
+def encode_delta(state, baseline):
+    """
+    :return: (mask, payload) with only the fields that differ from baseline
+    """
+    mask, parts = 0, []
+    for i, (value, previous) in enumerate(zip(state, baseline)):
+        if value != previous:
+            mask |= 1 << i
+            parts.append(FIELD_STRUCTS[i].pack(value))
+    return mask, b"".join(parts)
+
+
+def decode_delta(mask, payload, baseline):
+    state, offset = list(baseline), 0
+    for i, field in enumerate(FIELD_STRUCTS):
+        if mask & (1 << i):
+            (state[i],) = field.unpack_from(payload, offset)
+            offset += field.size
+    return tuple(state)
+
+
+class NetworkConditions:
+    """
+    Simulated latency, jitter and packet loss applied to everything sent.
+
+    :param latency_ms: One-way delay added to every packet
+    :param jitter_ms: Extra random delay of up to this much per packet
+    :param loss: Fraction of packets silently dropped
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, loss=0.0, rng=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.rng = rng or random.Random()
+
+    def send(self, transport, data, address):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        delay = (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000
+        if delay:
+            asyncio.get_running_loop().call_later(
+                delay, self._send_now, transport, data, address
+            )
+        else:
+            transport.sendto(data, address)
+
+    @staticmethod
+    def _send_now(transport, data, address):
+        if not transport.is_closing():
+            transport.sendto(data, address)
+
+
+class NetworkSession(asyncio.DatagramProtocol):
+    """
+    What the host and the client share: a UDP endpoint, traffic counters and
+    connection state.
+
+    Both sides step at the same fixed FRAME_MS rate as the local game. The
+    session's simulation is what should be drawn; step() advances it with this
+    machine's controls and returns the events to play sounds for.
+
+    A packet that can't be handled for any other reason than being malformed,
+    such as settings naming an arena this machine doesn't have, fails the
+    session: failed holds the error, and a connect still waiting raises it.
+    """
+
+    def __init__(self, conditions=None):
+        self.conditions = conditions or NetworkConditions()
+        self.transport = None
+        self.address = None
+        self.simulation = None
+        self.connected = asyncio.get_running_loop().create_future()
+        self.last_heard = time.monotonic()
+        self.failed = None
+        self.bytes_sent = self.bytes_received = 0
+        self.packets_sent = self.packets_received = 0
+
+    @property
+    def timed_out(self):
+        return time.monotonic() - self.last_heard > TIMEOUT
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        self.conditions.send(self.transport, data, self.address)
+
+    def datagram_received(self, data, address):
+        self.bytes_received += len(data)
+        self.packets_received += 1
+        try:
+            self.handle(data, address)
+        except (struct.error, ValueError, KeyError):
+            # Stray or corrupt datagrams are ignored like lost ones
+            return
+        except Exception as e:
+            # Raised from a protocol callback it would only reach asyncio's log
+            self.fail(e)
+
+    def fail(self, error):
+        if self.failed is None:
+            print(f"Network session failed: {error!r}")
+            self.failed = error
+        if not self.connected.done():
+            self.connected.set_exception(ConnectionError(str(error)))
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+
+class HostSession(NetworkSession):
+    """
+    The authoritative side: runs the real simulation with the host on the
+    player paddle and the remote player on the computer paddle.
+
+    Remote inputs are applied one per step in sequence order. Every step the
+    host sends the new state, delta-encoded against the newest state the client
+    has acknowledged, together with the last input it applied so the client can
+    reconcile its prediction. Once that state is older than STATE_HISTORY the
+    delta is taken against EMPTY_STATE, which both sides always keep.
+
+    The state only carries the one ball, so networked matches are always
+    played with BALL_COUNT 1, whatever the host's settings say.
+    """
+
+    def __init__(self, game_settings, port=DEFAULT_PORT, conditions=None, seed=None):
+        super().__init__(conditions)
+        self.port = port
+        self.game_settings = dict(game_settings, BALL_COUNT=1)
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.simulation = PongSimulation(self.game_settings, seed=self.seed)
+        self.inputs = deque()
+        self.newest_input = 0
+        self.applied_input = 0
+        self.acked_frame = 0
+        self.sent_states = {0: EMPTY_STATE}
+        self.last_packet = None
+
+    async def listen(self, bind="0.0.0.0"):
+        """
+        Open the host's port and return its number, which matters for port 0.
+        """
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=(bind, self.port)
+        )
+        self.port = transport.get_extra_info("sockname")[1]
+        return self.port
+
+    async def start(self, bind="0.0.0.0"):
+        """
+        Wait for a client to join.
+        """
+        await self.listen(bind)
+        await self.connected
+
+    def handle(self, data, address):
+        kind = data[:1]
+        if kind == b"H":
+            _, version = HELLO.unpack_from(data)
+            if version != PROTOCOL_VERSION or (
+                self.address and address != self.address
+            ):
+                return
+            self.address = address
+            self.last_heard = time.monotonic()
+            self.send(
+                WELCOME.pack(b"W", self.seed) + json.dumps(self.game_settings).encode()
+            )
+            if not self.connected.done():
+                self.connected.set_result(True)
+        elif kind == b"I" and address == self.address:
+            self.last_heard = time.monotonic()
+            _, acked_frame, newest, count = INPUT.unpack_from(data)
+            if acked_frame in self.sent_states and acked_frame > self.acked_frame:
+                self.acked_frame = acked_frame
+            flags = data[INPUT.size : INPUT.size + count]
+            for sequence, value in zip(range(newest - count + 1, newest + 1), flags):
+                if sequence > self.newest_input:
+                    self.inputs.append((sequence, value))
+                    self.newest_input = sequence
+            while len(self.inputs) > MAX_QUEUED_INPUTS:
+                self.applied_input = self.inputs.popleft()[0]
+
+    def step(self, local_input=NO_INPUT):
+        remote_input = NO_INPUT
+        if self.inputs:
+            self.applied_input, flags = self.inputs.popleft()
+            remote_input = flags_input(flags)
+        events = self.simulation.step(local_input, opponent_inputs=remote_input)
+        if self.address:
+            self._send_state(events)
+        return events
+
+    def _send_state(self, events):
+        frame = self.simulation.frame
+        state = snapshot(self.simulation)
+        baseline = self.acked_frame
+        if frame - baseline > STATE_HISTORY:
+            # The client may no longer have the baseline, e.g. after its acks
+            # were lost for a while, so send a full state it can always decode
+            baseline = 0
+        mask, payload = encode_delta(state, self.sent_states[baseline])
+        event_bits = 0
+        for event in events:
+            event_bits |= EVENT_BITS[event]
+        self.last_packet = (
+            STATE.pack(b"S", frame, baseline, self.applied_input, event_bits, mask)
+            + payload
+        )
+        self.send(self.last_packet)
+        self.sent_states[frame] = state
+        for old_frame in [
+            old_frame
+            for old_frame in self.sent_states
+            if old_frame < frame - STATE_HISTORY and old_frame not in (0, baseline)
+        ]:
+            del self.sent_states[old_frame]
+
+    async def finish(self, seconds=FINAL_STATE_SECONDS):
+        """
+        Repeat the final state once the match is over until the client
+        acknowledges it, or for at most the given seconds.
+
+        No later state follows that would make up for losing it, and without
+        it the client would wait for the match to go on until it timed out.
+        """
+        deadline = time.monotonic() + seconds
+        while (
+            self.last_packet
+            and self.acked_frame < self.simulation.frame
+            and time.monotonic() < deadline
+        ):
+            self.send(self.last_packet)
+            await asyncio.sleep(FRAME_MS / 1000)
+
+
+class ClientSession(NetworkSession):
+    """
+    The remote side: sends its controls to the host and shows the host's state.
+
+    The client's own paddle is predicted: every input moves it immediately, and
+    when a state arrives the paddle is put where the host had it and the inputs
+    the host hasn't applied yet are replayed on top. Everything else is drawn as
+    the host last reported it.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, conditions=None):
+        super().__init__(conditions)
+        self.address = (host, port)
+        self.sequence = 0
+        self.pending_inputs = deque()
+        self.received_states = {0: EMPTY_STATE}
+        self.newest_frame = 0
+        self.events = []
+        self.corrections = 0
+
+    async def start(self):
+        await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, remote_addr=self.address
+        )
+        while not self.connected.done():
+            self.send(HELLO.pack(b"H", PROTOCOL_VERSION))
+            try:
+                await asyncio.wait_for(asyncio.shield(self.connected), HELLO_INTERVAL)
+            except asyncio.TimeoutError:
+                if self.timed_out:
+                    raise ConnectionError(f"No answer from {self.address[0]}")
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        # The endpoint is connected, so the address is implied
+        self.conditions.send(self.transport, data, None)
+
+    def handle(self, data, address):
+        self.last_heard = time.monotonic()
+        kind = data[:1]
+        if kind == b"W" and self.simulation is None:
+            _, seed = WELCOME.unpack_from(data)
+            settings = json.loads(data[WELCOME.size :])
+            # Same settings and seed, so the obstacles match the host's
+            try:
+                self.simulation = PongSimulation(settings, seed=seed)
+            except Exception as e:
+                # Not a corrupt packet, so fail rather than wait for another
+                self.fail(e)
+                return
+            self.connected.set_result(True)
+        elif kind == b"S" and self.simulation is not None:
+            frame, baseline, applied_input, event_bits, mask = STATE.unpack_from(data)[
+                1:
+            ]
+            if frame <= self.newest_frame or baseline not in self.received_states:
+                if self.simulation.game_over:
+                    # The host repeats the final state until it hears this
+                    self._acknowledge()
+                return
+            state = decode_delta(
+                mask, data[STATE.size :], self.received_states[baseline]
+            )
+            self.received_states[frame] = state
+            for old_frame in [
+                old_frame
+                for old_frame in self.received_states
+                if 0 < old_frame < frame - STATE_HISTORY * 2
+            ]:
+                del self.received_states[old_frame]
+            self.newest_frame = frame
+            self.events += [
+                event for event, bit in EVENT_BITS.items() if event_bits & bit
+            ]
+            self._reconcile(state, applied_input)
+            if self.simulation.game_over:
+                self._acknowledge()
+
+    def _acknowledge(self):
+        # No inputs follow the end of a match, so the ack goes out on its own
+        self.send(INPUT.pack(b"I", self.newest_frame, self.sequence, 0))
+
+    def _reconcile(self, state, applied_input):
+        paddle = self.simulation.computer_paddle
+        predicted_y = paddle.y
+        apply_snapshot(self.simulation, state)
+        while self.pending_inputs and self.pending_inputs[0][0] <= applied_input:
+            self.pending_inputs.popleft()
+        for _, flags in self.pending_inputs:
+            self.simulation.move_paddle(paddle, flags_input(flags))
+        if paddle.y != predicted_y:
+            self.corrections += 1
+
+    def step(self, local_input=NO_INPUT):
+        if self.simulation.game_over:
+            return []
+        self.sequence += 1
+        flags = input_flags(local_input)
+        self.pending_inputs.append((self.sequence, flags))
+        self.simulation.move_paddle(self.simulation.computer_paddle, local_input)
+
+        recent = [flags for _, flags in self.pending_inputs][-REDUNDANT_INPUTS:]
+        self.send(
+            INPUT.pack(b"I", self.newest_frame, self.sequence, len(recent))
+            + bytes(recent)
+        )
+        events, self.events = self.events, []
+        return events
+
+
+async def run_loopback(frames, conditions, seed=0, outage=0):
+    """
+    Play host and client against each other over the loopback interface.
+
+    Both sides are driven by scripted controls so the run can check that the
+    client ends up seeing what the host simulated.
+
+    :param outage: Seconds, starting OUTAGE_START_FRAME, during which every
+        packet from the client is lost while the host's still arrive
+
+    :return: Dict with traffic and prediction statistics
+    """
+    from modules import game_options
+
+    settings = game_options.load_settings()["GAME_SETTINGS"]
+    host = HostSession(settings, port=0, conditions=conditions, seed=seed)
+    port = await host.listen("127.0.0.1")
+    client_conditions = NetworkConditions(
+        conditions.latency_ms, conditions.jitter_ms, conditions.loss
+    )
+    client = ClientSession("127.0.0.1", port, client_conditions)
+    await client.start()
+
+    rng = random.Random(seed)
+    round_trip = (conditions.latency_ms + conditions.jitter_ms) * 2
+    # Finish with idle controls for a round trip, so every real input arrives
+    idle_frames = int(round_trip / FRAME_MS) + REDUNDANT_INPUTS
+    outage_frames = range(
+        OUTAGE_START_FRAME, OUTAGE_START_FRAME + int(outage * 1000 / FRAME_MS)
+    )
+    client_input = NO_INPUT
+    start = time.perf_counter()
+    for frame in range(frames + idle_frames):
+        if host.simulation.game_over:
+            break
+        host.step(host.simulation.autopilot_input())
+        client_conditions.loss = 1.0 if frame in outage_frames else conditions.loss
+        if frame >= frames:
+            client_input = NO_INPUT
+        elif frame % 15 == 0:
+            client_input = PlayerInput(
+                up=rng.random() < 0.4, down=rng.random() < 0.4, serve=True
+            )
+        client.step(client_input)
+        # Stay on the game's clock so latency is measured in real frames
+        next_frame = start + (frame + 1) * FRAME_MS / 1000
+        await asyncio.sleep(max(0, next_frame - time.perf_counter()))
+    seconds = time.perf_counter() - start
+    if host.simulation.game_over:
+        await host.finish()
+    await asyncio.sleep(round_trip / 1000 + 0.1)
+
+    # Any remaining predicted inputs are idle, so the client's view must equal
+    # the newest host state it received
+    in_sync = snapshot(client.simulation) == host.sent_states.get(client.newest_frame)
+    host.close()
+    client.close()
+    return {
+        "frames": host.simulation.frame,
+        "host_bytes_per_second": host.bytes_sent / seconds,
+        "client_bytes_per_second": client.bytes_sent / seconds,
+        "mean_state_packet_bytes": host.bytes_sent / max(host.packets_sent, 1),
+        "states_received": client.packets_received,
+        "client_frames_behind": host.simulation.frame - client.newest_frame,
+        "prediction_corrections": client.corrections,
+        "client_in_sync": in_sync,
+        "game_over_delivered": client.simulation.game_over == host.simulation.game_over,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play a networked match between two local sessions"
+    )
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=50, help="one-way ms")
+    parser.add_argument("--jitter", type=float, default=10, help="extra ms")
+    parser.add_argument("--loss", type=float, default=0.05, help="fraction lost")
+    parser.add_argument(
+        "--outage",
+        type=float,
+        default=0,
+        help="seconds the client's packets are all lost, from 2s in",
+    )
+    args = parser.parse_args()
+
+    conditions = NetworkConditions(args.latency, args.jitter, args.loss)
+    summary = asyncio.run(
+        run_loopback(min(args.frames, MAX_MATCH_FRAMES), conditions, outage=args.outage)
+    )
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
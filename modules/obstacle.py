@@ -1,27 +1,42 @@
 import pygame
 import random
 import math
+from modules.collision import (
+    polygon_edges,
+    sweep_circle_polygon,
+    segment_distance_squared,
+)
+
+GRID_CELL_SIZE = 64
 
 
 class Obstacle:
-    def __init__(self, screen_width, screen_height, ball_radius):
+    def __init__(self, screen_width, screen_height, ball_radius, area=None, rng=random):
+        self.rng = rng
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.ball_radius = ball_radius
-        self.shape = random.choice(["hexagon", "triangle", "square"])
+        # (min_x, max_x, min_y, max_y) for the center, the middle third by default
+        self.area = area or (
+            screen_width // 3,
+            2 * screen_width // 3,
+            screen_height // 3,
+            2 * screen_height // 3,
+        )
+        self.shape = self.rng.choice(["hexagon", "triangle", "square"])
         self.generate()
 
     def generate(self):
         # Determine size
         min_size = self.ball_radius * 2
         max_size = self.ball_radius * 10
-        size_factor = random.uniform(0, 1)
+        size_factor = self.rng.uniform(0, 1)
         self.size = min_size + (max_size - min_size) * size_factor
 
         # Determine position
         self.center = (
-            random.randint(self.screen_width // 3, 2 * self.screen_width // 3),
-            random.randint(self.screen_height // 3, 2 * self.screen_height // 3),
+            self.rng.randint(self.area[0], self.area[1]),
+            self.rng.randint(self.area[2], self.area[3]),
         )
 
         # Generate points based on shape
@@ -54,56 +69,232 @@ class Obstacle:
                 (self.center[0] - half_size, self.center[1] + half_size),
             ]
 
+        # Everything the collision tests need that never changes after generate()
+        self.edges = polygon_edges(self.points)
+        self.bounding_radius = max(
+            math.hypot(x - self.center[0], y - self.center[1]) for x, y in self.points
+        )
+        self.bounds = pygame.Rect(
+            self.center[0] - self.bounding_radius,
+            self.center[1] - self.bounding_radius,
+            self.bounding_radius * 2,
+            self.bounding_radius * 2,
+        ).inflate(self.ball_radius * 2 + 2, self.ball_radius * 2 + 2)
+
     def draw(self, screen, color):
-        pygame.draw.polygon(screen, color, self.points)
+        return pygame.draw.polygon(screen, color, self.points)
 
     def check_collision(self, ball):
-        # Check collision with each side of the obstacle
-        for i in range(len(self.points)):
-            p1 = self.points[i]
-            p2 = self.points[(i + 1) % len(self.points)]
+        x, y = ball.centerx, ball.centery
+        offset_x, offset_y = x - self.center[0], y - self.center[1]
+        reach = self.bounding_radius + self.ball_radius
+        if offset_x * offset_x + offset_y * offset_y > reach * reach:
+            return None, 0
 
+        # Check collision with each side of the obstacle
+        radius_squared = self.ball_radius * self.ball_radius
+        for x1, y1, edge_x, edge_y, inverse_length_squared, *normal in self.edges:
             # Calculate the closest point on the line segment to the ball center
-            line_vec = pygame.math.Vector2(p2[0] - p1[0], p2[1] - p1[1])
-            ball_to_p1 = pygame.math.Vector2(ball.centerx - p1[0], ball.centery - p1[1])
-
-            projection = ball_to_p1.dot(line_vec) / line_vec.length_squared()
+            projection = (
+                (x - x1) * edge_x + (y - y1) * edge_y
+            ) * inverse_length_squared
             projection = max(0, min(1, projection))  # Clamp between 0 and 1
-
-            closest_point = (
-                p1[0] + projection * line_vec.x,
-                p1[1] + projection * line_vec.y,
-            )
+            offset_x = x - (x1 + projection * edge_x)
+            offset_y = y - (y1 + projection * edge_y)
 
             # Check if the ball is colliding with this side
-            distance = pygame.math.Vector2(
-                ball.centerx - closest_point[0], ball.centery - closest_point[1]
-            ).length()
-            if distance <= self.ball_radius:
-                normal = pygame.math.Vector2(
-                    ball.centerx - closest_point[0], ball.centery - closest_point[1]
-                ).normalize()
-                return normal, self.ball_radius - distance
+            distance_squared = offset_x * offset_x + offset_y * offset_y
+            if distance_squared <= radius_squared:
+                distance = math.sqrt(distance_squared)
+                if distance == 0:
+                    return pygame.math.Vector2(normal), self.ball_radius
+                return (
+                    pygame.math.Vector2(offset_x / distance, offset_y / distance),
+                    self.ball_radius - distance,
+                )
 
         return None, 0
 
-    def resolve_collision(self, ball, ball_dx, ball_dy):
-        normal, overlap = self.check_collision(ball)
-        if normal:
-            velocity = pygame.math.Vector2(ball_dx, ball_dy)
-            reflection = velocity.reflect(normal)
+    def resolve_collision(self, ball, ball_dx, ball_dy, collision=None):
+        """
+        Push the ball out of the obstacle and reflect its velocity.
 
+        :param collision: Result of check_collision(ball), to avoid running it twice
+        """
+        normal, overlap = collision or self.check_collision(ball)
+        if normal:
             # Move the ball out of the obstacle with a small extra buffer
             buffer = 1.01  # 1% extra to ensure it's clear of the obstacle
             ball.x += normal.x * overlap * buffer
             ball.y += normal.y * overlap * buffer
 
-            # Adjust the reflection slightly to prevent sticking
+            return self.reflect(ball_dx, ball_dy, normal)
+        return ball_dx, ball_dy
+
+    def sweep_collision(self, x, y, dx, dy):
+        """
+        Find when a ball centered at (x, y) moving by (dx, dy) first touches the obstacle.
+
+        :return: (t, normal) with t in [0, 1] along the movement, or None
+        """
+        reach = self.bounding_radius + self.ball_radius
+        if segment_distance_squared(x, y, dx, dy, *self.center) > reach * reach:
+            return None
+        hit = sweep_circle_polygon(
+            x, y, dx, dy, self.ball_radius, self.points, self.edges
+        )
+        if hit:
+            t, normal_x, normal_y = hit
+            return t, pygame.math.Vector2(normal_x, normal_y)
+        return None
+
+    def reflect(self, ball_dx, ball_dy, normal):
+        reflection = pygame.math.Vector2(ball_dx, ball_dy).reflect(normal)
+
+        # Adjust the reflection slightly to prevent sticking
+        reflection_angle = math.atan2(reflection.y, reflection.x)
+        reflection_angle += self.rng.uniform(-0.1, 0.1)  # Add a small random angle
+        speed = reflection.length()
+
+        # Never let the random angle turn the ball back into the obstacle
+        if (
+            math.cos(reflection_angle) * normal.x
+            + math.sin(reflection_angle) * normal.y
+            <= 0
+        ):
             reflection_angle = math.atan2(reflection.y, reflection.x)
-            reflection_angle += random.uniform(-0.1, 0.1)  # Add a small random angle
-            speed = reflection.length()
 
-            return speed * math.cos(reflection_angle), speed * math.sin(
-                reflection_angle
+        return speed * math.cos(reflection_angle), speed * math.sin(reflection_angle)
+
+    def nearest_surface(self, x, y):
+        """
+        Distance from many ball centers to the obstacle's outline at once.
+
+        :param x: numpy array of x-positions
+        :param y: numpy array of y-positions
+        :return: Arrays of distances and of the outward normal's x and y parts
+        """
+        import numpy as np
+
+        best_distance = np.full(len(x), np.inf)
+        normal_x = np.zeros(len(x))
+        normal_y = np.zeros(len(x))
+        for x1, y1, edge_x, edge_y, inverse_length_squared, *normal in self.edges:
+            projection = np.clip(
+                ((x - x1) * edge_x + (y - y1) * edge_y) * inverse_length_squared, 0, 1
             )
-        return ball_dx, ball_dy
+            offset_x = x - (x1 + projection * edge_x)
+            offset_y = y - (y1 + projection * edge_y)
+            distance = np.hypot(offset_x, offset_y)
+            closer = distance < best_distance
+            best_distance[closer] = distance[closer]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                normal_x[closer] = np.where(
+                    distance[closer] > 0, offset_x[closer] / distance[closer], normal[0]
+                )
+                normal_y[closer] = np.where(
+                    distance[closer] > 0, offset_y[closer] / distance[closer], normal[1]
+                )
+        return best_distance, normal_x, normal_y
+
+
+class ObstacleField:
+    """
+    Any number of obstacles behind a uniform grid broadphase.
+
+    Each obstacle is registered in every grid cell its bounds overlap, so a
+    collision query only runs the exact tests for obstacles in the cells the
+    ball's path crosses. A field of one obstacle behaves exactly like the
+    single Obstacle of the original game.
+
+    :param obstacles: Ready-made obstacles, e.g. an arena's, instead of count
+        randomly generated ones
+    """
+
+    def __init__(
+        self,
+        screen_width,
+        screen_height,
+        ball_radius,
+        count=1,
+        cell_size=GRID_CELL_SIZE,
+        rng=random,
+        obstacles=None,
+    ):
+        self.ball_radius = ball_radius
+        self.cell_size = cell_size
+        area = None
+        if count > 1:
+            # Spread a field over the court, keeping clear of the paddles
+            area = (
+                screen_width // 6,
+                5 * screen_width // 6,
+                ball_radius * 4,
+                screen_height - ball_radius * 4,
+            )
+        self.obstacles = obstacles or [
+            Obstacle(screen_width, screen_height, ball_radius, area, rng)
+            for _ in range(count)
+        ]
+        self.cells = {}
+        for obstacle in self.obstacles:
+            for cell in self._cells(obstacle.bounds):
+                self.cells.setdefault(cell, []).append(obstacle)
+
+    def __iter__(self):
+        return iter(self.obstacles)
+
+    def __len__(self):
+        return len(self.obstacles)
+
+    def _cells(self, rect):
+        for cell_x in range(
+            rect.left // self.cell_size, rect.right // self.cell_size + 1
+        ):
+            for cell_y in range(
+                rect.top // self.cell_size, rect.bottom // self.cell_size + 1
+            ):
+                yield cell_x, cell_y
+
+    def nearby(self, rect):
+        """
+        Obstacles registered in any cell the rect overlaps, without duplicates.
+        """
+        found = {}
+        for cell in self._cells(rect):
+            for obstacle in self.cells.get(cell, ()):
+                found[id(obstacle)] = obstacle
+        return found.values()
+
+    def draw(self, screen, color):
+        rects = [obstacle.draw(screen, color) for obstacle in self.obstacles]
+        return rects[0].unionall(rects[1:]) if rects else None
+
+    def check_collision(self, ball):
+        """
+        :return: (obstacle, normal, overlap) for the first obstacle touching the
+            ball, or (None, None, 0)
+        """
+        for obstacle in self.nearby(ball):
+            normal, overlap = obstacle.check_collision(ball)
+            if normal:
+                return obstacle, normal, overlap
+        return None, None, 0
+
+    def sweep_collision(self, x, y, dx, dy):
+        """
+        :return: (t, normal, obstacle) for the first obstacle the moving ball
+            touches, or None
+        """
+        path = pygame.Rect(
+            min(x, x + dx) - self.ball_radius,
+            min(y, y + dy) - self.ball_radius,
+            abs(dx) + self.ball_radius * 2 + 1,
+            abs(dy) + self.ball_radius * 2 + 1,
+        )
+        best = None
+        for obstacle in self.nearby(path):
+            hit = obstacle.sweep_collision(x, y, dx, dy)
+            if hit and (best is None or hit[0] < best[0]):
+                best = (*hit, obstacle)
+        return best
@@ -0,0 +1,170 @@
+import argparse
+import os
+import random
+import time
+import numpy as np
+from modules.computer_ai import (
+    MODEL_FEATURES,
+    PLAYER_MODEL_HEADER,
+    PLAYER_MODEL_MAGIC,
+    PLAYER_MODEL_PATH,
+    PLAYER_MODEL_VERSION,
+    HumanLikeComputer,
+    PlayerModel,
+    model_bins,
+    model_cell,
+    model_cells,
+)
+from modules.replay import Replay, REPLAY_EXTENSION, UP, DOWN, RESTART
+
+MIN_NEIGHBOURS = 8  # Recorded moves every cell's answer is drawn from at least
+MAX_WIDENINGS = 24
+TIMED_LOOKUPS = 10000
+
+
+def recorded_moves(replay):
+    """
+    Play a replay back and collect what the player did in every rally frame.
+
+    :return: (cells, moves), a model_cell() and a -1/0/1 move per frame
+    """
+    simulation = replay.simulation()
+    paddle = simulation.player_paddle
+    paddle_x = simulation.contact_x(paddle)
+    cells, moves = [], []
+    previous_move = 0
+    for step, flags in enumerate(replay.inputs):
+        move = (1 if flags & DOWN else 0) - (1 if flags & UP else 0)
+        if flags & RESTART or not simulation.ball_moving:
+            previous_move = 0
+        else:
+            ball_x, ball_y, ball_dx, ball_dy = simulation.target_ball(paddle)
+            cells.append(
+                model_cell(
+                    ball_x,
+                    ball_y,
+                    ball_dx,
+                    ball_dy,
+                    paddle_x,
+                    paddle.centery,
+                    previous_move,
+                )
+            )
+            moves.append(move)
+            previous_move = move
+        replay.play_step(simulation, step)
+    return cells, moves
+
+
+def nearest_counts(cells, moves):
+    """
+    Count the up/stay/down moves recorded nearest to every cell of the grid.
+
+    Cells with fewer than MIN_NEIGHBOURS moves of their own take in their
+    neighbours' counts along every feature, one cell further out each round,
+    until they have enough. That is a k-nearest-neighbours search on the grid,
+    done once for the whole state space.
+
+    :return: numpy array of model_cells() x 3 counts, and the rounds it took
+    """
+    counts = np.zeros((model_cells(), 3))
+    np.add.at(counts, (np.asarray(cells), np.asarray(moves) + 1), 1)
+    counts = counts.reshape(*model_bins(), 3)
+    found = counts.copy()
+    for rounds in range(MAX_WIDENINGS):
+        sparse = found.sum(axis=-1) < MIN_NEIGHBOURS
+        if not sparse.any():
+            break
+        widened = found.copy()
+        for axis in range(len(MODEL_FEATURES)):
+            low = [slice(None)] * found.ndim
+            high = [slice(None)] * found.ndim
+            low[axis], high[axis] = slice(None, -1), slice(1, None)
+            widened[tuple(high)] += found[tuple(low)]
+            widened[tuple(low)] += found[tuple(high)]
+        found[sparse] = widened[sparse]
+    else:
+        rounds = MAX_WIDENINGS
+    return found.reshape(model_cells(), 3), rounds
+
+
+def save_model(counts, samples, path=PLAYER_MODEL_PATH):
+    """
+    Write counts as the cumulative up and up-or-stay bytes PlayerModel reads.
+    """
+    totals = counts.sum(axis=1, keepdims=True)
+    # A cell nobody came near keeps the paddle still
+    shares = np.where(totals > 0, counts / np.maximum(totals, 1), (0, 1, 0))
+    thresholds = np.rint(np.cumsum(shares, axis=1)[:, :2] * 255).astype(np.uint8)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(
+            PLAYER_MODEL_HEADER.pack(
+                PLAYER_MODEL_MAGIC, PLAYER_MODEL_VERSION, samples, *model_bins()
+            )
+        )
+        f.write(thresholds.tobytes())
+    os.replace(temp_path, path)
+
+
+def replay_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(REPLAY_EXTENSION):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the human-like computer's player model from replays"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="replay files or directories recorded with --record"
+    )
+    parser.add_argument(
+        "--output", default=PLAYER_MODEL_PATH, help="model file to write"
+    )
+    args = parser.parse_args()
+
+    cells, moves = [], []
+    replays = 0
+    for path in replay_paths(args.paths):
+        try:
+            replay_cells, replay_moves = recorded_moves(Replay.load(path))
+        except ValueError as error:
+            # Such as a match against an earlier model, which no longer replays
+            print(f"skipping {path}: {error}")
+            continue
+        cells += replay_cells
+        moves += replay_moves
+        replays += 1
+    if not cells:
+        parser.error("the replays contain no rallies to learn from")
+
+    counts, rounds = nearest_counts(cells, moves)
+    save_model(counts, len(cells), args.output)
+    print(
+        f"{len(cells)} moves from {replays} replays, {len(set(cells))} of "
+        f"{model_cells()} cells visited, every cell within {rounds} cells of "
+        f"{MIN_NEIGHBOURS} moves; wrote {os.path.getsize(args.output)} bytes "
+        f"to {args.output}"
+    )
+
+    rng = random.Random(0)
+    computer = HumanLikeComputer(PlayerModel(args.output), 20, rng)
+    states = [
+        [rng.uniform(0, 800), rng.uniform(0, 600), rng.uniform(-15, 15)]
+        for _ in range(TIMED_LOOKUPS)
+    ]
+    start = time.perf_counter()
+    for ball_x, ball_y, ball_speed in states:
+        computer.calculate_move(ball_x, ball_y, ball_speed, ball_speed, ball_x / 2, 100)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed / TIMED_LOOKUPS * 1e6:.1f} us per move")
+
+
+if __name__ == "__main__":
+    main()
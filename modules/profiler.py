@@ -0,0 +1,222 @@
+import csv
+import json
+import time
+from array import array
+from modules.simulation import FRAME_MS
+
+PHASES = (
+    "events",
+    "computer",
+    "physics",
+    "collision",
+    "shapes",
+    "text",
+    "overlay",
+    "flip",
+    "idle",
+)
+OVERLAY_WINDOW = 600  # Frames summarized by the overlay, ten seconds at 60 FPS
+DROPPED_FRAME_FACTOR = 1.5  # A frame this many times over budget missed a refresh
+EXPORT_BATCH_FRAMES = 600  # Frames buffered before they are written to the export file
+
+
+class NullProfiler:
+    """
+    Stand-in used when profiling is off, so callers never need to check.
+    """
+
+    def switch(self, phase):
+        return phase
+
+    def instrument(self, simulation):
+        pass
+
+    def discard_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameProfiler:
+    """
+    Splits every frame into the time spent in each of PHASES.
+
+    The caller marks where each phase starts with switch(); time is charged to
+    the phase that was active until then, so phases never overlap and always add
+    up to the whole frame. Simulation methods are timed by wrapping them with
+    instrument() rather than by timing code inside the simulation, which keeps
+    it free of any cost when profiling is off.
+
+    Only the last window frames are kept in memory, in a ring the overlay
+    summarizes. With an export path every frame is also written there, in
+    batches of EXPORT_BATCH_FRAMES, so a long session never grows the game's
+    memory; close() writes the rest and finishes the file.
+
+    :param frame_budget_ms: Time one frame should take at the target frame rate
+    :param path: .json file, or CSV for any other name, to write every frame to
+    :param window: Number of recent frames kept for the overlay
+    """
+
+    def __init__(self, frame_budget_ms=FRAME_MS, path=None, window=OVERLAY_WINDOW):
+        self.frame_budget_ms = frame_budget_ms
+        self.phase_index = {phase: i for i, phase in enumerate(PHASES)}
+        self.current = [0.0] * len(PHASES)
+        self.phase = "events"
+        self.last_switch = time.perf_counter()
+        # One row per frame: frame time, then every phase, in milliseconds
+        self.row_size = len(PHASES) + 1
+        self.window = window
+        self.samples = array("d", bytes(8 * self.row_size * window))
+        self.frames = 0
+        self.dropped_frames = 0
+        self.pending = array("d")
+        self.exported = 0
+        self.output = None
+        self.json = path is not None and path.endswith(".json")
+        if path is not None:
+            self._open(path)
+
+    def __len__(self):
+        return self.frames
+
+    def switch(self, phase):
+        """
+        Start timing phase and return the phase that was active before.
+        """
+        now = time.perf_counter()
+        self.current[self.phase_index[self.phase]] += now - self.last_switch
+        self.last_switch = now
+        previous, self.phase = self.phase, phase
+        return previous
+
+    def timed(self, phase, function):
+        """
+        Wrap function so the time spent inside it is charged to phase.
+        """
+
+        def wrapper(*args, **kwargs):
+            previous = self.switch(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.switch(previous)
+
+        return wrapper
+
+    def instrument(self, simulation):
+        """
+        Time the computer paddle, ball physics and collision tests of a simulation.
+        """
+        simulation.move_computer_paddle = self.timed(
+            "computer", simulation.move_computer_paddle
+        )
+        simulation.step = self.timed("physics", simulation.step)
+        simulation._first_contact = self.timed("collision", simulation._first_contact)
+
+    def discard_frame(self):
+        """
+        Drop the time measured so far, e.g. after a blocking menu.
+        """
+        self.current = [0.0] * len(PHASES)
+        self.phase = "events"
+        self.last_switch = time.perf_counter()
+
+    def end_frame(self):
+        """
+        Close the current frame and start the next one in the events phase.
+        """
+        self.switch("events")
+        frame_ms = sum(self.current) * 1000
+        start = self.frames % self.window * self.row_size
+        self.samples[start] = frame_ms
+        for i, seconds in enumerate(self.current, start + 1):
+            self.samples[i] = seconds * 1000
+        self.frames += 1
+        if frame_ms > self.frame_budget_ms * DROPPED_FRAME_FACTOR:
+            self.dropped_frames += 1
+        self.current = [0.0] * len(PHASES)
+        if self.output is not None:
+            self.pending.extend(self.samples[start : start + self.row_size])
+            if len(self.pending) >= EXPORT_BATCH_FRAMES * self.row_size:
+                self._write_pending()
+
+    def column(self, index):
+        # Row order doesn't matter to percentiles and means
+        stored = min(self.frames, self.window) * self.row_size
+        return self.samples[index : stored : self.row_size]
+
+    def summary(self):
+        """
+        :return: Dict with frame time percentiles and mean milliseconds per phase
+            over the last window frames
+        """
+        frame_times = sorted(self.column(0))
+        if not frame_times:
+            return {}
+        summary = {
+            f"p{percentile}": frame_times[
+                min(len(frame_times) - 1, len(frame_times) * percentile // 100)
+            ]
+            for percentile in (50, 95, 99)
+        }
+        for i, phase in enumerate(PHASES):
+            phase_times = self.column(i + 1)
+            summary[phase] = sum(phase_times) / len(phase_times)
+        return summary
+
+    def _open(self, path):
+        columns = ("frame", "frame_ms") + tuple(f"{phase}_ms" for phase in PHASES)
+        self.output = open(path, "w", newline="")
+        if self.json:
+            self.output.write(f'{{"columns": {json.dumps(columns)}, "samples": [')
+        else:
+            self.writer = csv.writer(self.output)
+            self.writer.writerow(columns)
+
+    def _write_pending(self):
+        if not self.pending:
+            return
+        rows = [
+            [self.exported + i, *self.pending[start : start + self.row_size]]
+            for i, start in enumerate(range(0, len(self.pending), self.row_size))
+        ]
+        if self.json:
+            self.output.write(
+                ("," if self.exported else "")
+                + ",".join(json.dumps(row) for row in rows)
+            )
+        else:
+            self.writer.writerows(
+                [frame, *(f"{value:.4f}" for value in row)] for frame, *row in rows
+            )
+        self.exported += len(rows)
+        del self.pending[:]
+
+    def close(self):
+        """
+        Write the frames still buffered and finish the export file, if any.
+        """
+        if self.output is None:
+            return
+        self._write_pending()
+        if self.json:
+            self.output.write(
+                f'], "frame_budget_ms": {json.dumps(self.frame_budget_ms)}, '
+                f'"dropped_frames": {self.dropped_frames}}}'
+            )
+        self.output.close()
+        self.output = None
+
+    def overlay_lines(self):
+        summary = self.summary()
+        if not summary:
+            return []
+        return [
+            f"p50 {summary['p50']:.1f}  p95 {summary['p95']:.1f}  "
+            f"p99 {summary['p99']:.1f} ms",
+            f"dropped {self.dropped_frames} of {len(self)}",
+        ] + [f"{phase} {summary[phase]:.2f}" for phase in PHASES]
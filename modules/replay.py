@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import random
+import struct
+import time
+from array import array
+from modules.computer_ai import PLAYER_MODEL_DIGEST_SIZE, load_player_model
+from modules.simulation import PongSimulation, PlayerInput, FPS
+
+# Magic, format version, seed, length of the JSON game settings and step count
+REPLAY_HEADER = struct.Struct("<4sHQII")
+# Since version 2 the header is followed by the digest of the PlayerModel the
+# computer played with, or NO_MODEL
+REPLAY_MODEL = struct.Struct(f"<{PLAYER_MODEL_DIGEST_SIZE}s")
+NO_MODEL = bytes(PLAYER_MODEL_DIGEST_SIZE)
+REPLAY_MAGIC = b"PREP"
+REPLAY_VERSION = 2
+REPLAY_EXTENSION = ".pongreplay"
+
+# Each simulation step is stored as one byte of these flags
+UP, DOWN, SERVE, RESTART = 1, 2, 4, 8
+
+
+class Replay:
+    """
+    A match recorded as its seed, its settings and the player's controls.
+
+    PongSimulation draws every random number from a generator seeded with
+    self.seed and never reads the clock, so stepping a fresh simulation through
+    the same inputs plays the same match again, frame for frame. Inputs are kept
+    as one byte per step in an array, about 3.5 KB per minute of play.
+
+    With HUMAN_AI the computer's moves also depend on the player model, so a
+    replay only plays back against the model it was recorded with.
+
+    :param game_settings: GAME_SETTINGS the match is played with
+    :param seed: Seed for the simulation's random generator
+    :param inputs: array("B") of step flags, empty for a new recording
+    :param model_digest: PlayerModel.digest of the computer's model, NO_MODEL
+        if it played without one, or None if unknown
+    """
+
+    def __init__(self, game_settings, seed, inputs=None, model_digest=NO_MODEL):
+        self.game_settings = dict(game_settings)
+        self.seed = seed
+        self.inputs = inputs if inputs is not None else array("B")
+        self.model_digest = model_digest
+        self.pending_restart = False
+
+    @classmethod
+    def new(cls, game_settings):
+        model = load_player_model() if game_settings.get("HUMAN_AI") else None
+        return cls(
+            game_settings, random.getrandbits(63), model_digest=model_digest(model)
+        )
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def simulation(self):
+        """
+        Return a simulation in the state the recorded match started from.
+
+        :raise ValueError: If the computer played with another player model
+            than the one it would play with now
+        """
+        simulation = PongSimulation(self.game_settings, seed=self.seed)
+        if (
+            self.game_settings.get("HUMAN_AI")
+            and model_digest(simulation.player_model) != self.model_digest
+        ):
+            raise ValueError("the replay was recorded against another player model")
+        return simulation
+
+    def record(self, player_input):
+        """
+        Store the controls passed to the next PongSimulation.step().
+        """
+        flags = (
+            (UP if player_input.up else 0)
+            | (DOWN if player_input.down else 0)
+            | (SERVE if player_input.serve else 0)
+        )
+        if self.pending_restart:
+            flags |= RESTART
+            self.pending_restart = False
+        self.inputs.append(flags)
+
+    def restart(self):
+        """
+        Note that the simulation was reset() before the next recorded step.
+        """
+        self.pending_restart = True
+
+    def play_step(self, simulation, step):
+        """
+        Apply a recorded step to a simulation created by self.simulation().
+
+        :return: The step's events, starting with "restart" if the match was
+            restarted first
+        """
+        flags = self.inputs[step]
+        events = []
+        if flags & RESTART:
+            simulation.reset()
+            events.append("restart")
+        return events + simulation.step(
+            PlayerInput(
+                up=bool(flags & UP), down=bool(flags & DOWN), serve=bool(flags & SERVE)
+            )
+        )
+
+    def save(self, path):
+        settings = json.dumps(self.game_settings, sort_keys=True).encode()
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(
+                REPLAY_HEADER.pack(
+                    REPLAY_MAGIC,
+                    REPLAY_VERSION,
+                    self.seed,
+                    len(settings),
+                    len(self.inputs),
+                )
+            )
+            f.write(REPLAY_MODEL.pack(self.model_digest or NO_MODEL))
+            f.write(settings)
+            f.write(self.inputs.tobytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < REPLAY_HEADER.size:
+            raise ValueError(f"{path} is not a replay")
+        magic, version, seed, settings_length, steps = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a replay")
+        if version not in (1, REPLAY_VERSION):
+            raise ValueError(f"{path} is a version {version} replay")
+        start = REPLAY_HEADER.size
+        # Version 1 didn't note the player model
+        digest = None
+        if version > 1:
+            if len(data) < start + REPLAY_MODEL.size:
+                raise ValueError(f"{path} is truncated")
+            (digest,) = REPLAY_MODEL.unpack_from(data, start)
+            start += REPLAY_MODEL.size
+        if len(data) != start + settings_length + steps:
+            raise ValueError(f"{path} is truncated")
+        offset = start + settings_length
+        game_settings = json.loads(data[start:offset])
+        inputs = array("B")
+        inputs.frombytes(data[offset:])
+        return cls(game_settings, seed, inputs, digest)
+
+
+def model_digest(model):
+    return NO_MODEL if model is None else model.digest
+
+
+def save_replay(replay, directory):
+    """
+    Save a recording under a timestamped name and return its path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, time.strftime("match-%Y%m%d-%H%M%S") + REPLAY_EXTENSION
+    )
+    replay.save(path)
+    return path
+
+
+def fast_forward(replay):
+    """
+    Play a replay without a display as fast as the CPU allows.
+
+    :return: Dict with the final scores, strikes, frame count and speed
+    """
+    simulation = replay.simulation()
+    start = time.perf_counter()
+    for step in range(len(replay)):
+        replay.play_step(simulation, step)
+    elapsed = time.perf_counter() - start
+    return {
+        "player_score": simulation.player_score,
+        "computer_score": simulation.computer_score,
+        "strikes": simulation.strike_count,
+        "longest_rally": simulation.longest_rally,
+        "frames": simulation.frame,
+        "game_over": simulation.game_over,
+        "seconds": elapsed,
+        "times_real_time": simulation.frame / FPS / elapsed if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Pong replays headless")
+    parser.add_argument("paths", nargs="+", help="replay files")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        summary = fast_forward(Replay.load(path))
+        print(
+            f"{path}: {summary['player_score']}-{summary['computer_score']}, "
+            f"{summary['strikes']} strikes, {summary['frames']} frames, "
+            f"{summary['times_real_time']:.0f}x real time"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import pygame
+
+SPLASH_FRAME_MS = 100  # The splash GIF's frame interval
+REDRAW_EVENTS = (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.VIDEOEXPOSE)
+
+
+class Scene:
+    """
+    A screen that sleeps in pygame.event.wait() until there is something to do.
+
+    Menus only change when a key is pressed or an animation frame is due, so
+    instead of redrawing as fast as possible the scene blocks until the next
+    event or the next frame of its animation, whichever comes first, and only
+    redraws when handle_event() or animate() marked it dirty. Without an
+    animation it blocks until the next event.
+
+    Subclasses implement draw() and handle_event(), and call finish() with the
+    value run() should return.
+
+    :param frame_ms: Animation frame interval, or None for a still screen
+    """
+
+    def __init__(self, frame_ms=None):
+        self.frame_ms = frame_ms
+        self.dirty = True
+        self.done = False
+        self.result = None
+
+    def finish(self, result=None):
+        self.done = True
+        self.result = result
+
+    def draw(self, surface):
+        raise NotImplementedError
+
+    def handle_event(self, event):
+        """
+        React to an event; set self.dirty if the screen has to change.
+        """
+        raise NotImplementedError
+
+    def animate(self):
+        """
+        Advance the animation by one frame.
+        """
+        self.dirty = True
+
+    def resume(self):
+        """
+        Pick up again after another scene used the screen.
+        """
+        self.dirty = True
+        self.next_frame = self._after_frame()
+
+    def _after_frame(self):
+        return pygame.time.get_ticks() + self.frame_ms if self.frame_ms else None
+
+    def run(self, surface, present=None):
+        """
+        Show the scene until finish() is called and return its result.
+
+        :param present: Callable showing the drawn surface, pygame.display.flip
+            by default
+        """
+        present = present or pygame.display.flip
+        self.next_frame = self._after_frame()
+        while not self.done:
+            if self.dirty:
+                self.draw(surface)
+                present()
+                self.dirty = False
+
+            if self.next_frame is None:
+                events = [pygame.event.wait()]
+            else:
+                # A timeout of 0 would wait forever
+                timeout = max(1, self.next_frame - pygame.time.get_ticks())
+                events = [pygame.event.wait(timeout)]
+            events += pygame.event.get()
+
+            for event in events:
+                if event.type == pygame.NOEVENT:
+                    continue
+                if event.type in REDRAW_EVENTS:
+                    self.dirty = True
+                else:
+                    self.handle_event(event)
+                if self.done:
+                    return self.result
+
+            if self.next_frame is not None:
+                now = pygame.time.get_ticks()
+                if now >= self.next_frame:
+                    self.animate()
+                    # Skip frames missed while busy rather than rushing through
+                    self.next_frame = max(self.next_frame + self.frame_ms, now + 1)
+        return self.result
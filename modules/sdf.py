@@ -0,0 +1,321 @@
+import functools
+import json
+import math
+import os
+import random
+import numpy as np
+import pygame
+from modules.collision import segment_distance_squared
+from modules.obstacle import Obstacle
+
+SDF_CELL_SIZE = 1  # Pixels per grid cell
+MASK_CHUNK_CELLS = 4096  # Cells compared against the outline at once
+MAX_MARCH_STEPS = 32
+CONTACT_DISTANCE = 0.05  # Closer than this to the surface counts as touching
+
+
+class DistanceField:
+    """
+    Signed distance to a shape, sampled on a grid: negative inside, positive
+    outside, with the normalized gradient stored next to it.
+
+    Looking up a distance or normal is a bilinear blend of four grid values,
+    so it costs the same whatever the shape's outline is made of. Anything
+    off the grid is at least the grid's margin away from the shape.
+
+    :param distances: numpy array of rows x columns distances at cell centers
+    :param left: X-position of the grid's left edge
+    :param top: Y-position of the grid's top edge
+    :param margin: Space kept between the shape and the grid's edges
+    """
+
+    def __init__(self, distances, left, top, margin, cell_size=SDF_CELL_SIZE):
+        self.distances = distances
+        self.left = left
+        self.top = top
+        self.margin = margin
+        self.cell_size = cell_size
+        self.rows, self.columns = distances.shape
+        gradient_y, gradient_x = np.gradient(distances, cell_size)
+        length = np.hypot(gradient_x, gradient_y)
+        length[length == 0] = 1
+        self.normal_x = gradient_x / length
+        self.normal_y = gradient_y / length
+        # Plain lists are much faster than numpy for single lookups
+        self._distances = distances.ravel().tolist()
+        self._normal_x = self.normal_x.ravel().tolist()
+        self._normal_y = self.normal_y.ravel().tolist()
+
+        inside_rows, inside_columns = np.nonzero(distances <= 0)
+        inside_x = left + (inside_columns + 0.5) * cell_size
+        inside_y = top + (inside_rows + 0.5) * cell_size
+        self.center = (float(inside_x.mean()), float(inside_y.mean()))
+        self.bounding_radius = float(
+            np.hypot(inside_x - self.center[0], inside_y - self.center[1]).max()
+            + cell_size
+        )
+
+    @classmethod
+    def from_polygon(cls, points, margin, cell_size=SDF_CELL_SIZE):
+        """
+        :param points: Corners of any simple polygon, convex or not, in order
+        """
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        left = math.floor(min(xs) - margin)
+        top = math.floor(min(ys) - margin)
+        columns = math.ceil((max(xs) + margin - left) / cell_size)
+        rows = math.ceil((max(ys) + margin - top) / cell_size)
+        x, y = np.meshgrid(
+            left + (np.arange(columns) + 0.5) * cell_size,
+            top + (np.arange(rows) + 0.5) * cell_size,
+        )
+
+        distances = np.full((rows, columns), np.inf)
+        inside = np.zeros((rows, columns), bool)
+        for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+            edge_x, edge_y = x2 - x1, y2 - y1
+            projection = np.clip(
+                ((x - x1) * edge_x + (y - y1) * edge_y)
+                / (edge_x * edge_x + edge_y * edge_y),
+                0,
+                1,
+            )
+            distances = np.minimum(
+                distances,
+                np.hypot(
+                    x - (x1 + projection * edge_x), y - (y1 + projection * edge_y)
+                ),
+            )
+            # Even-odd rule: count the edges a ray to the right crosses
+            if y1 != y2:
+                straddles = (y1 > y) != (y2 > y)
+                inside ^= straddles & (x < x1 + (y - y1) * edge_x / edge_y)
+        distances[inside] *= -1
+        return cls(distances, left, top, margin, cell_size)
+
+    @classmethod
+    def from_mask(cls, solid, left, top, margin):
+        """
+        :param solid: numpy bool array, rows x columns, one cell per pixel
+        :param left: X-position of the mask's left edge
+        :param top: Y-position of the mask's top edge
+        """
+        pad = math.ceil(margin)
+        solid = np.pad(solid, pad)
+        # Pixels on the outline: solid ones next to empty ones and vice versa
+        neighbour_differs = np.zeros_like(solid)
+        for axis in (0, 1):
+            for shift in (1, -1):
+                neighbour_differs |= solid != np.roll(solid, shift, axis)
+        outline_rows, outline_columns = np.nonzero(neighbour_differs)
+        outline_solid = solid[outline_rows, outline_columns]
+
+        rows, columns = solid.shape
+        cell_rows, cell_columns = np.divmod(np.arange(rows * columns), columns)
+        distances = np.empty(rows * columns)
+        flat_solid = solid.ravel()
+        for start in range(0, len(distances), MASK_CHUNK_CELLS):
+            chunk = slice(start, start + MASK_CHUNK_CELLS)
+            squared = (cell_rows[chunk, None] - outline_rows) ** 2 + (
+                cell_columns[chunk, None] - outline_columns
+            ) ** 2
+            # The surface runs halfway between a solid and an empty pixel
+            opposite = outline_solid != flat_solid[chunk, None]
+            squared = np.where(opposite, squared, np.inf)
+            distances[chunk] = np.sqrt(squared.min(axis=1)) - 0.5
+        distances[flat_solid] *= -1
+        return cls(distances.reshape(rows, columns), left - pad, top - pad, margin)
+
+    def sample(self, x, y):
+        """
+        :return: (distance, normal_x, normal_y) at one point
+        """
+        grid_x = (x - self.left) / self.cell_size - 0.5
+        grid_y = (y - self.top) / self.cell_size - 0.5
+        if not (0 <= grid_x < self.columns - 1 and 0 <= grid_y < self.rows - 1):
+            # Off the grid the shape is at least the margin away
+            away_x = max(
+                self.left - x, 0, x - self.left - self.columns * self.cell_size
+            )
+            away_y = max(self.top - y, 0, y - self.top - self.rows * self.cell_size)
+            offset_x, offset_y = x - self.center[0], y - self.center[1]
+            length = math.hypot(offset_x, offset_y) or 1
+            return (
+                math.hypot(away_x, away_y) + self.margin,
+                offset_x / length,
+                offset_y / length,
+            )
+
+        column, row = int(grid_x), int(grid_y)
+        fraction_x, fraction_y = grid_x - column, grid_y - row
+        i = row * self.columns + column
+        j = i + self.columns
+        weights = (
+            (1 - fraction_x) * (1 - fraction_y),
+            fraction_x * (1 - fraction_y),
+            (1 - fraction_x) * fraction_y,
+            fraction_x * fraction_y,
+        )
+        values = []
+        for grid in (self._distances, self._normal_x, self._normal_y):
+            values.append(
+                grid[i] * weights[0]
+                + grid[i + 1] * weights[1]
+                + grid[j] * weights[2]
+                + grid[j + 1] * weights[3]
+            )
+        distance, normal_x, normal_y = values
+        length = math.hypot(normal_x, normal_y) or 1
+        return distance, normal_x / length, normal_y / length
+
+    def sample_many(self, x, y):
+        """
+        sample() for numpy arrays of points, using the nearest grid cell.
+        """
+        column = ((x - self.left) / self.cell_size).astype(int)
+        row = ((y - self.top) / self.cell_size).astype(int)
+        on_grid = (
+            (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+        )
+        column = np.clip(column, 0, self.columns - 1)
+        row = np.clip(row, 0, self.rows - 1)
+        distance = np.where(
+            on_grid, self.distances[row, column], self.margin + self.cell_size
+        )
+        return distance, self.normal_x[row, column], self.normal_y[row, column]
+
+    def render(self, color):
+        """
+        Draw the shape once, with edges antialiased from the distances.
+        """
+        surface = pygame.Surface((self.columns, self.rows), pygame.SRCALPHA)
+        surface.fill(color)
+        coverage = np.clip(0.5 - self.distances / self.cell_size, 0, 1)
+        pygame.surfarray.pixels_alpha(surface)[:] = (coverage.T * 255).astype(np.uint8)
+        if self.cell_size != 1:
+            surface = pygame.transform.smoothscale(
+                surface,
+                (self.columns * self.cell_size, self.rows * self.cell_size),
+            )
+        return surface
+
+
+class SDFObstacle(Obstacle):
+    """
+    An obstacle of any shape whose collisions are looked up in a DistanceField.
+
+    check_collision() is a single field lookup and sweep_collision() marches
+    along the ball's path by the free distance the field reports, so neither
+    depends on how many edges the shape has. The shape is rendered once and
+    blitted from then on.
+    """
+
+    def __init__(self, field, ball_radius, rng=random):
+        self.field = field
+        self.ball_radius = ball_radius
+        self.rng = rng
+        self.shape = "sdf"
+        self.center = field.center
+        self.bounding_radius = field.bounding_radius
+        self.bounds = pygame.Rect(
+            self.center[0] - self.bounding_radius,
+            self.center[1] - self.bounding_radius,
+            self.bounding_radius * 2,
+            self.bounding_radius * 2,
+        ).inflate(ball_radius * 2 + 2, ball_radius * 2 + 2)
+        self.sprites = {}
+
+    def generate(self):
+        raise TypeError("SDF obstacles have a fixed shape")
+
+    def draw(self, screen, color):
+        sprite = self.sprites.get(color)
+        if sprite is None:
+            sprite = self.sprites[color] = self.field.render(color)
+        return screen.blit(sprite, (self.field.left, self.field.top))
+
+    def check_collision(self, ball):
+        distance, normal_x, normal_y = self.field.sample(ball.centerx, ball.centery)
+        if distance > self.ball_radius:
+            return None, 0
+        return pygame.math.Vector2(normal_x, normal_y), self.ball_radius - distance
+
+    def sweep_collision(self, x, y, dx, dy):
+        """
+        Find when a ball centered at (x, y) moving by (dx, dy) first touches the obstacle.
+
+        :return: (t, normal) with t in [0, 1] along the movement, or None
+        """
+        reach = self.bounding_radius + self.ball_radius
+        if segment_distance_squared(x, y, dx, dy, *self.center) > reach * reach:
+            return None
+        length = math.hypot(dx, dy)
+        t = 0.0
+        for _ in range(MAX_MARCH_STEPS):
+            distance, normal_x, normal_y = self.field.sample(x + dx * t, y + dy * t)
+            free = distance - self.ball_radius
+            if free <= CONTACT_DISTANCE:
+                # Only a hit when heading into the surface, so a ball that
+                # starts on it can leave
+                if dx * normal_x + dy * normal_y < 0:
+                    return t, pygame.math.Vector2(normal_x, normal_y)
+                free = CONTACT_DISTANCE
+            if not length:
+                return None
+            t += free / length
+            if t > 1:
+                return None
+        return None
+
+    def nearest_surface(self, x, y):
+        return self.field.sample_many(x, y)
+
+
+def _load_mask(path):
+    """
+    Solid pixels of an image: opaque ones if it has alpha, else bright ones.
+    """
+    image = pygame.image.load(path)
+    if image.get_flags() & pygame.SRCALPHA:
+        solid = pygame.surfarray.array_alpha(image) > 127
+    else:
+        solid = pygame.surfarray.array3d(image).max(axis=2) > 127
+    return solid.T
+
+
+@functools.lru_cache(maxsize=None)
+def _arena_fields(path, margin, modified):
+    with open(path) as f:
+        arena = json.load(f)
+    directory = os.path.dirname(path)
+    fields = []
+    for shape in arena["obstacles"]:
+        if "polygon" in shape:
+            points = [tuple(point) for point in shape["polygon"]]
+            fields.append(DistanceField.from_polygon(points, margin))
+        else:
+            solid = _load_mask(os.path.join(directory, shape["mask"]))
+            rows, columns = solid.shape
+            center_x, center_y = shape["center"]
+            fields.append(
+                DistanceField.from_mask(
+                    solid, center_x - columns // 2, center_y - rows // 2, margin
+                )
+            )
+    return fields
+
+
+def load_arena(path, ball_radius, rng=random):
+    """
+    Build the obstacles listed in an arena file.
+
+    The file is JSON with an "obstacles" list whose entries are either
+    {"polygon": [[x, y], ...]} or {"mask": "image.png", "center": [x, y]}, mask
+    paths being relative to the arena file. Distance fields are computed once
+    per file and shared by every match played on it.
+
+    :return: List of SDFObstacles
+    """
+    fields = _arena_fields(path, ball_radius * 2, os.path.getmtime(path))
+    return [SDFObstacle(field, ball_radius, rng) for field in fields]
@@ -0,0 +1,220 @@
+import atexit
+import copy
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+SETTINGS_PATH = os.path.join(ROOT, "settings.db")
+HISTORY_PATH = os.path.join(ROOT, "match_history.sqlite3")
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,
+    player_score INTEGER NOT NULL,
+    computer_score INTEGER NOT NULL,
+    strikes INTEGER NOT NULL,
+    longest_rally INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    settings TEXT NOT NULL
+)
+"""
+MATCH_FIELDS = (
+    "finished_at",
+    "player_score",
+    "computer_score",
+    "strikes",
+    "longest_rally",
+    "duration",
+    "settings",
+)
+
+
+class SettingsStore:
+    """
+    Settings and stats kept in memory, written to disk on a background thread.
+
+    settings.db stays a JSON file so it can still be edited by hand, but it is
+    replaced atomically (write a temporary file, fsync, rename), so a crash
+    leaves either the old or the new file and never a half-written one. Queued
+    saves are coalesced: only the newest snapshot is written. Finished matches
+    are appended to a SQLite database in WAL mode.
+
+    :param settings_path: JSON settings file
+    :param history_path: SQLite file for per-match history
+    """
+
+    def __init__(self, settings_path=SETTINGS_PATH, history_path=HISTORY_PATH):
+        self.settings_path = settings_path
+        self.history_path = history_path
+        with open(settings_path, "r") as f:
+            self.data = json.load(f)
+        self.lock = threading.Lock()
+        self.pending_snapshot = None
+        self.pending_matches = []
+        self.work = queue.Queue()
+        self.writer = threading.Thread(
+            target=self._write_loop, name="settings-writer", daemon=True
+        )
+        self.writer.start()
+
+    def load(self):
+        """
+        Return a copy of the settings that the caller is free to modify.
+        """
+        with self.lock:
+            return copy.deepcopy(self.data)
+
+    def save(self, settings):
+        """
+        Replace the settings in memory and queue them for writing.
+        """
+        with self.lock:
+            self.data = copy.deepcopy(settings)
+            self.pending_snapshot = json.dumps(self.data, indent=2)
+        self.work.put("settings")
+
+    def update_stat(self, stat_name, value):
+        """
+        Raise a GAME_STATS record if value beats it.
+
+        :return: True if the record was beaten
+        """
+        with self.lock:
+            if value <= self.data["GAME_STATS"].get(stat_name, 0):
+                return False
+            self.data["GAME_STATS"][stat_name] = value
+            self.pending_snapshot = json.dumps(self.data, indent=2)
+        self.work.put("settings")
+        return True
+
+    def record_match(
+        self,
+        player_score,
+        computer_score,
+        strikes,
+        longest_rally,
+        duration,
+        game_settings,
+    ):
+        """
+        Queue a finished match for the history database.
+
+        :param duration: Match length in seconds of game time
+        :param game_settings: GAME_SETTINGS the match was played with
+        """
+        record = (
+            time.time(),
+            player_score,
+            computer_score,
+            strikes,
+            longest_rally,
+            duration,
+            json.dumps(game_settings, sort_keys=True),
+        )
+        with self.lock:
+            self.pending_matches.append(record)
+        self.work.put("matches")
+
+    def history(self, limit=20):
+        """
+        Most recent matches first, as dicts. Waits for queued matches to be written.
+        """
+        self.flush()
+        if not os.path.exists(self.history_path):
+            return []
+        connection = sqlite3.connect(self.history_path)
+        try:
+            connection.execute(HISTORY_SCHEMA)
+            rows = connection.execute(
+                f"SELECT {', '.join(MATCH_FIELDS)} FROM matches "
+                "ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [dict(zip(MATCH_FIELDS, row)) for row in rows]
+
+    def flush(self):
+        """
+        Block until everything queued so far is on disk.
+        """
+        self.work.join()
+
+    def close(self):
+        """
+        Write everything queued and stop the writer thread.
+        """
+        self.work.put(None)
+        self.writer.join()
+
+    def _write_loop(self):
+        connection = None
+        while True:
+            kind = self.work.get()
+            if kind is None:
+                self.work.task_done()
+                if connection is not None:
+                    connection.close()
+                break
+            try:
+                if kind == "settings":
+                    self._write_settings()
+                else:
+                    connection = connection or self._open_history()
+                    self._write_matches(connection)
+            except (OSError, sqlite3.Error) as e:
+                # Losing a stats update must never take the game down
+                print(f"Could not save {kind}: {e}")
+            finally:
+                self.work.task_done()
+
+    def _write_settings(self):
+        with self.lock:
+            snapshot, self.pending_snapshot = self.pending_snapshot, None
+        if snapshot is None:
+            # Already written by an earlier, coalesced request
+            return
+        temp_path = self.settings_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.settings_path)
+
+    def _open_history(self):
+        connection = sqlite3.connect(self.history_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(HISTORY_SCHEMA)
+        return connection
+
+    def _write_matches(self, connection):
+        with self.lock:
+            records, self.pending_matches = self.pending_matches, []
+        if not records:
+            return
+        with connection:
+            connection.executemany(
+                f"INSERT INTO matches ({', '.join(MATCH_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(MATCH_FIELDS))})",
+                records,
+            )
+
+
+_store = None
+
+
+def get_store():
+    """
+    Return the store shared by the whole process, creating it on first use.
+    """
+    global _store
+    if _store is None:
+        _store = SettingsStore()
+        atexit.register(_store.flush)
+    return _store
@@ -0,0 +1,524 @@
+import math
+import pygame
+import random
+import time
+from collections import namedtuple
+from modules import assets
+from modules.collision import sweep_circle_rect
+from modules.computer_ai import (
+    calculate_computer_move,
+    load_player_model,
+    HumanLikeComputer,
+    PredictiveComputer,
+)
+from modules.obstacle import ObstacleField
+
+# Constants
+WIDTH, HEIGHT = 800, 600
+BALL_RADIUS, PADDLE_WIDTH, INITIAL_PADDLE_HEIGHT = 10, 10, 100
+PADDLE_SHRINK_RATE = INITIAL_PADDLE_HEIGHT / 60  # Halve in 30 seconds
+PADDLE_STEP = 5
+FPS = 60
+FRAME_MS = 1000 / FPS
+MAX_BOUNCES_PER_STEP = 4
+CONTACT_OFFSET = 0.01  # Keeps the ball from starting the next sweep inside a surface
+MAX_MATCH_FRAMES = FPS * 60 * 30  # Give up on a headless match after 30 minutes
+LAST_BALLS_FRAMES = FPS * 10  # Time left for the other balls once one is out
+
+# Player controls for a single frame
+PlayerInput = namedtuple("PlayerInput", ["up", "down", "serve"], defaults=[False] * 3)
+NO_INPUT = PlayerInput()
+
+
+class PongSimulation:
+    """
+    Game rules of pong.py without any display, sound or wall-clock dependency.
+
+    Time advances by a fixed FRAME_MS per step, independent of how often the game
+    is drawn. step() returns the list of events that happened during the step
+    ("serve", "obstacle", "strike", "point", "game_over") so callers can play sounds or
+    record stats.
+
+    The ball keeps a floating point center and is swept against the walls,
+    paddles and obstacle, so it bounces at the exact point of contact at any
+    speed instead of tunnelling through a paddle between two steps.
+
+    HUMAN_AI has the computer play like the recorded players of the PlayerModel
+    built by modules.player_model, and falls back to the other AIs until one
+    has been built. The model is loaded with the simulation and kept through
+    reset(), so a model rebuilt meanwhile only plays from the next simulation.
+
+    When player_settings is given, the player paddle is driven by the computer AI
+    with that configuration's COMPUTER_SPEED and COMPUTER_RANDOMNESS, in addition
+    to any inputs passed to step().
+
+    Every random decision (serve direction, computer error, obstacle layout and
+    bounces) is drawn from self.rng, so the same seed and inputs always play the
+    same match.
+
+    With BALL_COUNT above one, the extra balls are served with the ball and kept
+    in a BallSwarm (which needs numpy). A ball that gets past a paddle leaves
+    play, and the rally goes on until the last ball is out. The point then goes
+    to the side that got more balls past the other, or on a tie to the side that
+    got the last one through. Balls still in play LAST_BALLS_FRAMES after the
+    first one got out no longer count, so a ball caught bouncing between
+    obstacles can't hold up the match. The AI paddles play whichever ball
+    reaches them first.
+    """
+
+    def __init__(
+        self,
+        game_settings,
+        width=WIDTH,
+        height=HEIGHT,
+        player_settings=None,
+        seed=None,
+    ):
+        self.settings = game_settings
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.player_settings = player_settings
+        self.width = width
+        self.height = height
+        self.court = pygame.Rect(0, 0, width, height)
+        self.ball = pygame.Rect(
+            width // 2, height // 2, BALL_RADIUS * 2, BALL_RADIUS * 2
+        )
+        self.player_paddle = pygame.Rect(
+            width - 20,
+            height // 2 - INITIAL_PADDLE_HEIGHT // 2,
+            PADDLE_WIDTH,
+            INITIAL_PADDLE_HEIGHT,
+        )
+        self.computer_paddle = pygame.Rect(
+            10,
+            height // 2 - INITIAL_PADDLE_HEIGHT // 2,
+            PADDLE_WIDTH,
+            INITIAL_PADDLE_HEIGHT,
+        )
+        self.obstacles = None
+        self.player_model = None
+        if game_settings.get("HUMAN_AI") or (player_settings or {}).get("HUMAN_AI"):
+            self.player_model = load_player_model()
+        self.swarm = None
+        ball_count = game_settings.get("BALL_COUNT", 1)
+        if ball_count > 1:
+            from modules.multiball import BallSwarm
+
+            self.swarm = BallSwarm(ball_count - 1, BALL_RADIUS)
+        self.reset()
+
+    def reset(self):
+        self._center_ball()
+        self.ball_dx = self.ball_dy = 0
+        self.strike_count = self.current_ball_speed = 0
+        self.player_score = self.computer_score = self.longest_rally = 0
+        self.player_paddle.height = self.computer_paddle.height = INITIAL_PADDLE_HEIGHT
+        self.player_paddle.centery = self.computer_paddle.centery = self.height // 2
+        self.frame = 0
+        self.time = 0
+        self.game_start_time = self.rally_start_time = 0
+        self.ball_moving = False
+        self.ball_in_play = True
+        self.balls_through = {"player": 0, "computer": 0}
+        self.first_out_frame = self.last_through = None
+        self.game_over = False
+        self.predictors = {}
+        if self.settings["OBSTACLE"]:
+            arena = None
+            if self.settings.get("ARENA"):
+                from modules.sdf import load_arena
+
+                arena = load_arena(
+                    assets.arena_path(self.settings["ARENA"]), BALL_RADIUS, self.rng
+                )
+            self.obstacles = ObstacleField(
+                self.width,
+                self.height,
+                BALL_RADIUS,
+                self.settings.get("OBSTACLE_COUNT", 1),
+                rng=self.rng,
+                obstacles=arena,
+            )
+        self._store_previous()
+
+    def _center_ball(self):
+        self.ball_x, self.ball_y = self.width / 2, self.height / 2
+        self.ball.center = (self.width // 2, self.height // 2)
+        if self.swarm is not None:
+            self.swarm.center(self.ball_x, self.ball_y)
+
+    def _store_previous(self):
+        self.previous_positions = (
+            self.ball_x,
+            self.ball_y,
+            self.player_paddle.y,
+            self.computer_paddle.y,
+        )
+
+    def interpolated_rects(self, alpha):
+        """
+        Ball and paddle rects blended between the last two steps.
+
+        :param alpha: How far the display is between the previous step (0) and the
+            current one (1)
+        :return: Tuple of ball, player paddle and computer paddle rects
+        """
+        ball_x, ball_y, player_y, computer_y = self.previous_positions
+        ball = self.ball.copy()
+        ball.center = (
+            round(ball_x + (self.ball_x - ball_x) * alpha),
+            round(ball_y + (self.ball_y - ball_y) * alpha),
+        )
+        player_paddle = self.player_paddle.copy()
+        player_paddle.y = round(player_y + (self.player_paddle.y - player_y) * alpha)
+        computer_paddle = self.computer_paddle.copy()
+        computer_paddle.y = round(
+            computer_y + (self.computer_paddle.y - computer_y) * alpha
+        )
+        return ball, player_paddle, computer_paddle
+
+    def start_ball_movement(self):
+        self.ball_dx = self.rng.choice([-1, 1]) * 5
+        self.ball_dy = self.rng.choice([-1, 1]) * 5
+        if self.swarm is not None:
+            self.swarm.launch(math.hypot(self.ball_dx, self.ball_dy), self.rng)
+        self.ball_in_play = True
+        self.balls_through = {"player": 0, "computer": 0}
+        self.first_out_frame = self.last_through = None
+        self.rally_start_time = self.time
+        self.ball_moving = True
+
+    def target_ball(self, paddle):
+        """
+        The ball a paddle should play, the one that reaches it first.
+
+        :return: (x, y, dx, dy) of that ball
+        """
+        ball = (self.ball_x, self.ball_y, self.ball_dx, self.ball_dy)
+        if self.swarm is None:
+            return ball
+        return self.swarm.most_threatening(paddle.centerx, ball)
+
+    def move_ai_paddle(self, paddle, settings):
+        ball_x, ball_y, ball_dx, ball_dy = self.target_ball(paddle)
+        model = self.player_model if settings.get("HUMAN_AI") else None
+        if model is not None:
+            move = self._human_player(paddle, model).calculate_move(
+                ball_x, ball_y, ball_dx, ball_dy, paddle.y, paddle.height
+            )
+        elif settings.get("PREDICTIVE_AI"):
+            move = self._predictor(paddle, settings).calculate_move(
+                ball_x,
+                ball_y,
+                ball_dx,
+                ball_dy,
+                paddle.y,
+                paddle.height,
+                self.obstacles,
+            )
+        else:
+            move = calculate_computer_move(
+                round(ball_y),
+                paddle.centery,
+                paddle.height,
+                self.height,
+                settings["COMPUTER_SPEED"],
+                settings["COMPUTER_RANDOMNESS"],
+                self.rng,
+            )
+        paddle.y += move * (settings["COMPUTER_SPEED"] / 10)
+        paddle.clamp_ip(self.court)
+
+    def contact_x(self, paddle):
+        """
+        X-position of the ball's center when it meets the paddle's face.
+        """
+        if paddle.centerx < self.width // 2:
+            return paddle.right + BALL_RADIUS
+        return paddle.left - BALL_RADIUS
+
+    def _human_player(self, paddle, model):
+        key = ("human", id(paddle))
+        player = self.predictors.get(key)
+        if player is None:
+            player = HumanLikeComputer(model, self.contact_x(paddle), self.rng)
+            self.predictors[key] = player
+        return player
+
+    def _predictor(self, paddle, settings):
+        predictor = self.predictors.get(id(paddle))
+        if predictor is None:
+            predictor = PredictiveComputer(
+                self.contact_x(paddle),
+                self.height,
+                BALL_RADIUS,
+                settings["COMPUTER_RANDOMNESS"],
+                settings.get("COMPUTER_REACTION", 0),
+                self.rng,
+            )
+            self.predictors[id(paddle)] = predictor
+        return predictor
+
+    def move_computer_paddle(self):
+        self.move_ai_paddle(self.computer_paddle, self.settings)
+
+    def update_ball_speed(self):
+        if self.strike_count % self.settings["BALL_SPEED_TURNS"] == 0:
+            speed_multiplier = 1 + min(
+                self.settings["BALL_SPEED"] / 50,
+                (self.strike_count // self.settings["BALL_SPEED_TURNS"])
+                * (self.settings["BALL_INCREMENT"] / 100),
+            )
+            self.ball_dx = abs(self.ball_dx) / self.ball_dx * 5 * speed_multiplier
+            self.ball_dy = abs(self.ball_dy) / self.ball_dy * 5 * speed_multiplier
+            self.current_ball_speed = (abs(self.ball_dx) + abs(self.ball_dy)) / 2
+
+    def autopilot_input(self):
+        """
+        Drive the player paddle with the computer AI so matches can run unattended.
+        """
+        move = calculate_computer_move(
+            round(self.target_ball(self.player_paddle)[1]),
+            self.player_paddle.centery,
+            self.player_paddle.height,
+            self.height,
+            self.settings["COMPUTER_SPEED"],
+            self.settings["COMPUTER_RANDOMNESS"],
+            self.rng,
+        )
+        return PlayerInput(up=move < 0, down=move > 0, serve=not self.ball_moving)
+
+    def move_paddle(self, paddle, inputs):
+        """
+        Move a paddle by a player's up and down controls.
+        """
+        if inputs.up and paddle.top > 0:
+            paddle.y -= PADDLE_STEP
+        if inputs.down and paddle.bottom < self.height:
+            paddle.y += PADDLE_STEP
+
+    def step(self, inputs=NO_INPUT, opponent_inputs=None):
+        """
+        Advance the game by one frame.
+
+        :param inputs: PlayerInput with the player's controls for this frame
+        :param opponent_inputs: PlayerInput for a second player on the computer
+            paddle, which then isn't moved by the computer AI
+        :return: List of event names that happened during the frame
+        """
+        events = []
+        if self.game_over:
+            return events
+
+        self._store_previous()
+        self.frame += 1
+        self.time = int(self.frame * FRAME_MS)
+
+        if self.settings["PADDLE_EROSION"]:
+            self.player_paddle.height = max(
+                INITIAL_PADDLE_HEIGHT
+                - int(PADDLE_SHRINK_RATE * (self.time - self.game_start_time) // 1000),
+                INITIAL_PADDLE_HEIGHT // 2,
+            )
+
+        if self.ball_moving:
+            self._step_ball(events)
+            if opponent_inputs is None:
+                self.move_computer_paddle()
+            if self.player_settings:
+                self.move_ai_paddle(self.player_paddle, self.player_settings)
+
+        self.move_paddle(self.player_paddle, inputs)
+        serve = inputs.serve
+        if opponent_inputs is not None:
+            self.move_paddle(self.computer_paddle, opponent_inputs)
+            serve = serve or opponent_inputs.serve
+
+        if serve and not self.ball_moving and not self.game_over:
+            self.start_ball_movement()
+            events.append("serve")
+
+        return events
+
+    def _step_ball(self, events):
+        rally_duration = (self.time - self.rally_start_time) // 1000
+        self.longest_rally = max(self.longest_rally, rally_duration)
+
+        passed = []
+        if self.ball_in_play:
+            self._move_ball(events)
+            if self.ball_x - BALL_RADIUS <= 0:
+                passed.append("player")
+            elif self.ball_x + BALL_RADIUS >= self.width:
+                passed.append("computer")
+
+        if self.swarm is None:
+            scorer = passed[0] if passed else None
+        else:
+            if passed:
+                # Off the court until the next serve
+                self.ball_in_play = False
+                self.ball_x = (
+                    -BALL_RADIUS if passed[0] == "player" else self.width + BALL_RADIUS
+                )
+                self.ball_dx = self.ball_dy = 0
+                self.ball.center = (round(self.ball_x), round(self.ball_y))
+            passed += self.swarm.step(
+                self.width,
+                self.height,
+                (self.player_paddle, self.computer_paddle),
+                self.obstacles,
+                events,
+            )
+            scorer = self._rally_scorer(passed)
+        if scorer:
+            if scorer == "player":
+                self.player_score += 1
+            else:
+                self.computer_score += 1
+            events.append("point")
+            self.ball_moving = False
+            self._center_ball()
+            self._store_previous()
+            self.rally_start_time = self.time
+
+        if (
+            self.player_score >= self.settings["WINNING_POINTS"]
+            or self.computer_score >= self.settings["WINNING_POINTS"]
+        ):
+            events.append("game_over")
+            self.game_over = True
+            self.ball_moving = False
+
+    def _move_ball(self, events):
+        remaining = 1.0
+        for _ in range(MAX_BOUNCES_PER_STEP):
+            dx, dy = self.ball_dx * remaining, self.ball_dy * remaining
+            contact = self._first_contact(dx, dy)
+            if contact is None:
+                self.ball_x += dx
+                self.ball_y += dy
+                break
+            t, normal_x, normal_y, surface = contact
+            self.ball_x += dx * t + normal_x * CONTACT_OFFSET
+            self.ball_y += dy * t + normal_y * CONTACT_OFFSET
+            remaining *= 1 - t
+            self._bounce(surface, normal_x, normal_y, events)
+        self.ball.center = (round(self.ball_x), round(self.ball_y))
+
+    def _rally_scorer(self, passed):
+        """
+        Count the balls that just got past a paddle towards the rally.
+
+        :param passed: "player" or "computer" for each ball, the earliest first
+        :return: Who wins the point once the rally is over, else None
+        """
+        for side in passed:
+            self.balls_through[side] += 1
+            self.last_through = side
+        if passed and self.first_out_frame is None:
+            self.first_out_frame = self.frame
+        if self.ball_in_play or self.swarm.in_play.any():
+            if (
+                self.first_out_frame is None
+                or self.frame - self.first_out_frame < LAST_BALLS_FRAMES
+            ):
+                return None
+        player, computer = self.balls_through["player"], self.balls_through["computer"]
+        if player != computer:
+            return "player" if player > computer else "computer"
+        return self.last_through
+
+    def _first_contact(self, dx, dy):
+        """
+        Find the first surface the ball touches while moving by (dx, dy).
+
+        :return: (t, normal_x, normal_y, surface) or None, where surface is "wall",
+            "paddle" or the Obstacle that was hit
+        """
+        contacts = []
+        if dy < 0 and self.ball_y + dy < BALL_RADIUS:
+            contacts.append((max(0.0, (BALL_RADIUS - self.ball_y) / dy), 0, 1, "wall"))
+        if dy > 0 and self.ball_y + dy > self.height - BALL_RADIUS:
+            contacts.append(
+                (
+                    max(0.0, (self.height - BALL_RADIUS - self.ball_y) / dy),
+                    0,
+                    -1,
+                    "wall",
+                )
+            )
+        for paddle in (self.player_paddle, self.computer_paddle):
+            hit = sweep_circle_rect(
+                self.ball_x, self.ball_y, dx, dy, BALL_RADIUS, paddle
+            )
+            if hit:
+                contacts.append((*hit, "paddle"))
+        if self.settings["OBSTACLE"]:
+            hit = self.obstacles.sweep_collision(self.ball_x, self.ball_y, dx, dy)
+            if hit:
+                t, normal, obstacle = hit
+                contacts.append((t, normal.x, normal.y, obstacle))
+        return min(contacts, key=lambda contact: contact[0], default=None)
+
+    def _bounce(self, surface, normal_x, normal_y, events):
+        if surface == "wall":
+            self.ball_dy = -self.ball_dy
+        elif surface == "paddle":
+            if normal_x:
+                self.ball_dx = -self.ball_dx
+            else:
+                self.ball_dy = -self.ball_dy
+            self.strike_count += 1
+            events.append("strike")
+            self.update_ball_speed()
+        else:
+            self.ball_dx, self.ball_dy = surface.reflect(
+                self.ball_dx, self.ball_dy, pygame.math.Vector2(normal_x, normal_y)
+            )
+            events.append("obstacle")
+
+
+def run_match(game_settings, max_frames=MAX_MATCH_FRAMES):
+    """
+    Play one match with both paddles driven by the computer AI.
+
+    :return: Dict with the final scores, strikes, longest rally and frame count
+    """
+    simulation = PongSimulation(game_settings)
+    while not simulation.game_over and simulation.frame < max_frames:
+        simulation.step(simulation.autopilot_input())
+    return {
+        "player_score": simulation.player_score,
+        "computer_score": simulation.computer_score,
+        "strikes": simulation.strike_count,
+        "longest_rally": simulation.longest_rally,
+        "frames": simulation.frame,
+    }
+
+
+def run_headless(game_settings, matches):
+    """
+    Play a number of matches as fast as the CPU allows and summarize them.
+    """
+    start = time.perf_counter()
+    results = [run_match(game_settings) for _ in range(matches)]
+    elapsed = time.perf_counter() - start
+    frames = sum(result["frames"] for result in results)
+    return {
+        "matches": matches,
+        "player_wins": sum(
+            result["player_score"] > result["computer_score"] for result in results
+        ),
+        "computer_wins": sum(
+            result["computer_score"] > result["player_score"] for result in results
+        ),
+        "mean_strikes": sum(result["strikes"] for result in results) / max(matches, 1),
+        "longest_rally": max(
+            (result["longest_rally"] for result in results), default=0
+        ),
+        "frames": frames,
+        "seconds": elapsed,
+        "frames_per_second": frames / elapsed if elapsed else 0,
+    }
@@ -0,0 +1,246 @@
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from modules.assets import ROOT
+from modules.simulation import FPS
+
+TELEMETRY_PATH = os.path.join(ROOT, "telemetry.ndjson")
+BUFFER_EVENTS = 4096  # Ring buffer size; the oldest events go first if it fills
+FLUSH_SECONDS = 1.0
+HISTOGRAM_BINS = 10
+HISTOGRAM_WIDTH = 40
+
+# Columns of every buffered event, in the order record() stores them
+EVENT_FIELDS = (
+    "match",
+    "frame",
+    "event",
+    "speed",
+    "strikes",
+    "player_score",
+    "computer_score",
+)
+
+
+class Telemetry:
+    """
+    Match events streamed to an append-only newline-delimited JSON file.
+
+    record() only appends a tuple to an in-memory ring buffer (a deque, whose
+    appends are atomic), so an event costs the game loop a few microseconds and
+    steps without events cost nothing. A background thread drains the buffer
+    every FLUSH_SECONDS, or sooner once it is half full, turns the batch into
+    JSON and appends it with a single write. If the writer can't keep up the
+    oldest events are overwritten and counted in dropped() rather than the game
+    ever waiting. Batches that can't be written are dropped too; the first such
+    error is printed and kept in write_error, and later batches are tried again.
+
+    Events are the names PongSimulation.step() returns ("serve", "strike",
+    "obstacle", "point", "game_over") plus "match_start". Ball speed is the
+    same measure update_ball_speed() keeps in current_ball_speed, taken right
+    after the step.
+
+    :param path: File the events are appended to
+    """
+
+    def __init__(self, path=TELEMETRY_PATH, capacity=BUFFER_EVENTS):
+        self.path = path
+        self.capacity = capacity
+        self.buffer = collections.deque(maxlen=capacity)
+        self.match = None
+        self.recorded = self.written = 0
+        self.write_error = None
+        self.wake = threading.Event()
+        self.closing = False
+        self.writer = threading.Thread(
+            target=self._write_loop, name="telemetry-writer", daemon=True
+        )
+        self.writer.start()
+
+    def start_match(self, simulation):
+        self.match = int(time.time() * 1000)
+        self.buffer.append(
+            (
+                self.match,
+                simulation.frame,
+                "match_start",
+                0,
+                0,
+                0,
+                0,
+                {"time": time.time(), "settings": dict(simulation.settings)},
+            )
+        )
+        self.recorded += 1
+
+    def record(self, simulation, events):
+        """
+        Buffer the events one simulation step returned.
+        """
+        speed = (abs(simulation.ball_dx) + abs(simulation.ball_dy)) / 2
+        for event in events:
+            self.buffer.append(
+                (
+                    self.match,
+                    simulation.frame,
+                    event,
+                    speed,
+                    simulation.strike_count,
+                    simulation.player_score,
+                    simulation.computer_score,
+                    (
+                        {"longest_rally": simulation.longest_rally}
+                        if event == "game_over"
+                        else None
+                    ),
+                )
+            )
+        self.recorded += len(events)
+        if len(self.buffer) * 2 > self.capacity:
+            self.wake.set()
+
+    def dropped(self):
+        return self.recorded - self.written - len(self.buffer)
+
+    def _write_loop(self):
+        while True:
+            self.wake.wait(FLUSH_SECONDS)
+            self.wake.clear()
+            closing = self.closing
+            batch = []
+            while self.buffer:
+                batch.append(self.buffer.popleft())
+            if batch:
+                lines = []
+                for *fields, extra in batch:
+                    event = dict(zip(EVENT_FIELDS, fields))
+                    if extra:
+                        event.update(extra)
+                    lines.append(json.dumps(event) + "\n")
+                try:
+                    with open(self.path, "a") as f:
+                        f.write("".join(lines))
+                    self.written += len(batch)
+                except OSError as e:
+                    # Losing telemetry must never take the game down
+                    if self.write_error is None:
+                        print(f"Could not write telemetry to {self.path}: {e}")
+                    self.write_error = e
+            if closing:
+                break
+
+    def close(self):
+        """
+        Write whatever is still buffered and stop the writer.
+        """
+        self.closing = True
+        self.wake.set()
+        self.writer.join()
+
+
+def read_events(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def aggregate(events):
+    """
+    :return: Dict with the number of matches and points, wins per side, and
+        lists of rally lengths in strikes and seconds and ball speeds at strikes
+    """
+    summary = {
+        "matches": 0,
+        "points": 0,
+        "player_wins": 0,
+        "computer_wins": 0,
+        "rally_strikes": [],
+        "rally_seconds": [],
+        "strike_speeds": [],
+    }
+    serves = {}
+    for event in events:
+        kind, match = event["event"], event["match"]
+        if kind == "serve":
+            serves[match] = event
+        elif kind == "strike":
+            summary["strike_speeds"].append(event["speed"])
+        elif kind == "point":
+            summary["points"] += 1
+            serve = serves.pop(match, None)
+            if serve is not None:
+                summary["rally_strikes"].append(event["strikes"] - serve["strikes"])
+                summary["rally_seconds"].append((event["frame"] - serve["frame"]) / FPS)
+        elif kind == "game_over":
+            summary["matches"] += 1
+            if event["player_score"] > event["computer_score"]:
+                summary["player_wins"] += 1
+            else:
+                summary["computer_wins"] += 1
+    return summary
+
+
+def percentiles(values):
+    values = sorted(values)
+    return {
+        f"p{percentile}": values[min(len(values) - 1, len(values) * percentile // 100)]
+        for percentile in (50, 90, 99)
+    }
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """
+    :return: List of (low, high, count) covering the range of values
+    """
+    low, high = min(values), max(values)
+    width = (high - low) / bins or 1
+    counts = [0] * bins
+    for value in values:
+        counts[min(bins - 1, int((value - low) / width))] += 1
+    return [(low + i * width, low + (i + 1) * width, counts[i]) for i in range(bins)]
+
+
+def print_distribution(title, values, unit):
+    if not values:
+        print(f"{title}: no data")
+        return
+    stats = percentiles(values)
+    print(
+        f"{title}: {len(values)} values, mean {sum(values) / len(values):.1f}, "
+        + ", ".join(f"{name} {value:.1f}" for name, value in stats.items())
+        + f" {unit}"
+    )
+    bins = histogram(values)
+    most = max(count for _, _, count in bins)
+    for low, high, count in bins:
+        bar = "#" * round(count / most * HISTOGRAM_WIDTH)
+        print(f"  {low:8.1f} - {high:8.1f} {count:7} {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize rally lengths and ball speeds from match telemetry"
+    )
+    parser.add_argument(
+        "paths", nargs="*", default=[TELEMETRY_PATH], help="telemetry files"
+    )
+    args = parser.parse_args()
+
+    summary = aggregate(read_events(args.paths))
+    print(
+        f"{summary['matches']} matches ({summary['player_wins']} won by the "
+        f"player, {summary['computer_wins']} by the computer), "
+        f"{summary['points']} points"
+    )
+    print_distribution("Rally length", summary["rally_strikes"], "strikes")
+    print_distribution("Rally duration", summary["rally_seconds"], "s")
+    print_distribution("Ball speed at strikes", summary["strike_speeds"], "px/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+MAX_CACHED_SURFACES = 256
+
+
+class TextCache:
+    """
+    Least-recently-used cache of rendered text surfaces keyed by (text, font, color).
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_SURFACES):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = self.misses = 0
+
+    def render(self, font, text, color):
+        key = (text, font, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+class TextLine:
+    """
+    A line of text built from changing values, such as the in-game score.
+
+    The surface is only re-rendered when the values differ from the previous call,
+    and it is kept out of the shared cache so changing numbers don't evict the
+    static menu text.
+
+    :param font: pygame font used to render the line
+    :param color: Text color
+    :param format_text: Callable turning the values into the displayed string
+    """
+
+    def __init__(self, font, color, format_text):
+        self.font = font
+        self.color = color
+        self.format_text = format_text
+        self.values = None
+        self.surface = None
+
+    def render(self, *values):
+        if values != self.values:
+            self.surface = self.font.render(self.format_text(*values), True, self.color)
+            self.values = values
+        return self.surface
+
+
+# Shared between the game and the options menu
+text_cache = TextCache()
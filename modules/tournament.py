@@ -0,0 +1,263 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from modules import game_options
+from modules.simulation import (
+    PongSimulation,
+    PlayerInput,
+    FPS,
+    MAX_MATCH_FRAMES,
+)
+
+TUNABLE_SETTINGS = [
+    "COMPUTER_SPEED",
+    "COMPUTER_RANDOMNESS",
+    "PADDLE_EROSION",
+    "OBSTACLE",
+    "OBSTACLE_COUNT",
+    "PREDICTIVE_AI",
+    "HUMAN_AI",
+    "COMPUTER_REACTION",
+    "WINNING_POINTS",
+]
+# Settings that shape the match for both paddles rather than the computer AI.
+# Only the home side's apply, so configurations differing in any of them are
+# never paired against each other.
+RULE_SETTINGS = ("OBSTACLE", "OBSTACLE_COUNT", "PADDLE_EROSION", "WINNING_POINTS")
+
+
+def tracker_opponent(simulation):
+    # Follows the ball perfectly at the player's paddle speed
+    paddle, ball = simulation.player_paddle, simulation.ball
+    return PlayerInput(
+        up=ball.centery < paddle.centery - 2,
+        down=ball.centery > paddle.centery + 2,
+        serve=True,
+    )
+
+
+def idle_opponent(simulation):
+    return PlayerInput(serve=True)
+
+
+def random_opponent(simulation):
+    move = random.choice([-1, 0, 1])
+    return PlayerInput(up=move < 0, down=move > 0, serve=True)
+
+
+SCRIPTED_OPPONENTS = {
+    "tracker": tracker_opponent,
+    "idle": idle_opponent,
+    "random": random_opponent,
+}
+
+
+def parse_grid_value(value):
+    if value.lower() in ("true", "on"):
+        return True
+    if value.lower() in ("false", "off"):
+        return False
+    return int(value)
+
+
+def expand_grid(base_settings, grid):
+    """
+    Build every combination of the given setting values.
+
+    :param base_settings: GAME_SETTINGS dict the combinations start from
+    :param grid: Dict mapping setting names to lists of values
+    :return: List of (label, settings) tuples
+    """
+    names = list(grid)
+    configurations = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        settings = dict(base_settings, **dict(zip(names, values)))
+        label = ",".join(f"{name}={value}" for name, value in zip(names, values))
+        configurations.append((label or "default", settings))
+    return configurations
+
+
+def play_match(task):
+    """
+    Play a single match in a worker process.
+
+    The home configuration controls the computer paddle and the match rules. The
+    away side is either another configuration, playing the player paddle with
+    the computer AI, or the name of a scripted opponent.
+    """
+    home_label, home_settings, away_label, away, seed = task
+    # The random opponent still draws from the global generator
+    random.seed(seed)
+    if isinstance(away, str):
+        simulation = PongSimulation(home_settings, seed=seed)
+        opponent = SCRIPTED_OPPONENTS[away]
+    else:
+        simulation = PongSimulation(home_settings, player_settings=away, seed=seed)
+        opponent = idle_opponent
+
+    rally_frames = []
+    serve_frame = None
+    while not simulation.game_over and simulation.frame < MAX_MATCH_FRAMES:
+        events = simulation.step(opponent(simulation))
+        # A point and the next serve can fall in the same step, in that order
+        if "point" in events and serve_frame is not None:
+            rally_frames.append(simulation.frame - serve_frame)
+        if "serve" in events:
+            serve_frame = simulation.frame
+
+    points = simulation.player_score + simulation.computer_score
+    if simulation.computer_score > simulation.player_score:
+        winner = home_label
+    elif simulation.player_score > simulation.computer_score:
+        winner = away_label
+    else:
+        winner = None
+    return {
+        "home": home_label,
+        "away": away_label,
+        "seed": seed,
+        "winner": winner,
+        "home_score": simulation.computer_score,
+        "away_score": simulation.player_score,
+        "strikes": simulation.strike_count,
+        "points": points,
+        "mean_rally_seconds": (
+            sum(rally_frames) / len(rally_frames) / FPS if rally_frames else 0
+        ),
+        "frames": simulation.frame,
+    }
+
+
+def build_tasks(configurations, opponents, matches, seed=0):
+    """
+    Pair every configuration with every other one playing by the same
+    RULE_SETTINGS, on both sides of the court, and with each scripted opponent.
+    """
+    rng = random.Random(seed)
+    pairings = [
+        (home_label, home, away_label, away)
+        for home_label, home in configurations
+        for away_label, away in configurations
+        if home_label != away_label
+        and all(home.get(name) == away.get(name) for name in RULE_SETTINGS)
+    ]
+    pairings += [
+        (home_label, home, name, name)
+        for home_label, home in configurations
+        for name in opponents
+    ]
+    return [
+        (home_label, home, away_label, away, rng.getrandbits(32))
+        for home_label, home, away_label, away in pairings
+        for _ in range(matches)
+    ]
+
+
+def summarize(results):
+    """
+    Aggregate match results into per-entrant win rates and rally statistics.
+    """
+    summary = {}
+    for result in results:
+        for side in ("home", "away"):
+            entrant = summary.setdefault(
+                result[side],
+                {
+                    "matches": 0,
+                    "wins": 0,
+                    "rally_seconds": 0,
+                    "strikes": 0,
+                    "points": 0,
+                },
+            )
+            entrant["matches"] += 1
+            entrant["wins"] += result["winner"] == result[side]
+            entrant["rally_seconds"] += result["mean_rally_seconds"]
+            entrant["strikes"] += result["strikes"]
+            entrant["points"] += result["points"]
+    return {
+        label: {
+            "matches": entrant["matches"],
+            "win_rate": entrant["wins"] / entrant["matches"],
+            "mean_rally_seconds": entrant["rally_seconds"] / entrant["matches"],
+            "strikes_per_point": entrant["strikes"] / max(entrant["points"], 1),
+        }
+        for label, entrant in summary.items()
+    }
+
+
+def run_tournament(tasks, output_path, workers=None):
+    """
+    Play all tasks on a process pool, appending each result to output_path as a
+    JSON line the moment its match finishes.
+    """
+    results = []
+    with open(output_path, "a") as output, multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(play_match, tasks, chunksize=4):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            results.append(result)
+        # pygame's signal handlers keep workers alive through terminate()
+        pool.close()
+        pool.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play grids of GAME_SETTINGS against each other"
+    )
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="SETTING=V1,V2",
+        help=f"values to sweep, one of {', '.join(TUNABLE_SETTINGS)}",
+    )
+    parser.add_argument(
+        "--opponents",
+        default="tracker,idle",
+        help=f"scripted opponents, from {', '.join(SCRIPTED_OPPONENTS)}",
+    )
+    parser.add_argument("--matches", type=int, default=10, help="matches per pairing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="tournament_results.jsonl")
+    args = parser.parse_args()
+
+    grid = {}
+    for entry in args.grid:
+        name, values = entry.split("=", 1)
+        if name not in TUNABLE_SETTINGS:
+            parser.error(f"{name} is not one of {', '.join(TUNABLE_SETTINGS)}")
+        grid[name] = [parse_grid_value(value) for value in values.split(",")]
+    opponents = [name for name in args.opponents.split(",") if name]
+    for name in opponents:
+        if name not in SCRIPTED_OPPONENTS:
+            parser.error(f"unknown opponent {name}")
+
+    configurations = expand_grid(game_options.load_settings()["GAME_SETTINGS"], grid)
+    tasks = build_tasks(configurations, opponents, args.matches, args.seed)
+    start = time.perf_counter()
+    results = run_tournament(tasks, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(results)} matches in {elapsed:.1f}s, results in {args.output}")
+    ranking = sorted(
+        summarize(results).items(), key=lambda item: item[1]["win_rate"], reverse=True
+    )
+    for label, stats in ranking:
+        print(
+            f"{label}: win rate {stats['win_rate']:.2f}, "
+            f"rally {stats['mean_rally_seconds']:.2f}s, "
+            f"strikes/point {stats['strikes_per_point']:.2f} "
+            f"({stats['matches']} matches)"
+        )
+
+
+if __name__ == "__main__":
+    main()
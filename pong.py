@@ -1,299 +1,174 @@
+import argparse
 import pygame
-import random
-import math
-from modules.computer_ai import calculate_computer_move
-from modules import game_options
-from modules.obstacle import Obstacle
-from PIL import Image, ImageSequence
-
-pygame.init()
-pygame.mixer.init()
+import time
+from modules import assets, audio, game_options, settings_store
+from modules.audio import MIXER_BUFFER
+from modules.text_cache import text_cache, TextLine
+from modules.dirty_rects import DirtyRectRenderer
+from modules.display import Display, FrameGovernor
+from modules.scene import Scene, SPLASH_FRAME_MS
+from modules.profiler import FrameProfiler, NULL_PROFILER
+from modules.simulation import (
+    PongSimulation,
+    PlayerInput,
+    run_headless,
+    WIDTH,
+    HEIGHT,
+    FPS,
+    FRAME_MS,
+)
 
 SETTINGS = game_options.load_settings()
-WIDTH, HEIGHT = 800, 600
 WHITE, BLACK = (255, 255, 255), (0, 0, 0)
-BALL_RADIUS, PADDLE_WIDTH, INITIAL_PADDLE_HEIGHT = 10, 10, 100
 FONT_SIZES = {"main": 16, "score": 18, "stats": 14, "instruction": 12}
-PADDLE_SHRINK_RATE = INITIAL_PADDLE_HEIGHT / 60  # Halve in 30 seconds
-COLLISION_COOLDOWN = 100  # milliseconds
-
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption(SETTINGS["LANGUAGE_COPY"]["MENU_TITLE"])
-fonts = {
-    key: pygame.font.Font("fonts/8-bit-wonder.ttf", size)
-    for key, size in FONT_SIZES.items()
-}
-
-strike_sounds = [pygame.mixer.Sound(f"media/strike_{i}.wav") for i in range(1, 4)]
-intro_music = pygame.mixer.Sound("media/intro_music.mp3")
-
-try:
-    trophy_image = pygame.image.load("media/trophy.jpg")
-    trophy_image = pygame.transform.scale(trophy_image, (30, 30))
-except pygame.error:
-    trophy_image = pygame.Surface((30, 30))
-    trophy_image.fill((255, 215, 0))
-
-gif = Image.open("media/splash.gif")
-gif_frames = [
-    pygame.image.fromstring(
-        frame.convert("RGBA").tobytes(), frame.size, "RGBA"
-    ).convert_alpha()
-    for frame in ImageSequence.Iterator(gif)
-]
-new_width = 300
-aspect_ratio = gif.width / gif.height
-gif_frames = [
-    pygame.transform.scale(frame, (new_width, int(new_width / aspect_ratio)))
-    for frame in gif_frames
-]
-
-ball = pygame.Rect(WIDTH // 2, HEIGHT // 2, BALL_RADIUS * 2, BALL_RADIUS * 2)
-player_paddle = pygame.Rect(
-    WIDTH - 20,
-    HEIGHT // 2 - INITIAL_PADDLE_HEIGHT // 2,
-    PADDLE_WIDTH,
-    INITIAL_PADDLE_HEIGHT,
-)
-computer_paddle = pygame.Rect(
-    10, HEIGHT // 2 - INITIAL_PADDLE_HEIGHT // 2, PADDLE_WIDTH, INITIAL_PADDLE_HEIGHT
-)
-obstacle = None
+MAX_STEPS_PER_FRAME = 5  # Drop time rather than spiral when far behind
+OVERLAY_COLOR = (0, 255, 0)
+OVERLAY_REFRESH_FRAMES = 30
+
+display = screen = fonts = audio_engine = None
+score_line = stats_line = None
+
+
+def load_assets(audio_buffer=MIXER_BUFFER, fullscreen=False):
+    global display, screen, fonts, score_line, stats_line, audio_engine
+    audio.pre_init(audio_buffer)
+    pygame.init()
+    pygame.mixer.init()
+    audio_engine = audio.AudioEngine(audio_buffer)
+
+    display = Display(WIDTH, HEIGHT, fullscreen)
+    screen = display.canvas
+    pygame.display.set_caption(SETTINGS["LANGUAGE_COPY"]["MENU_TITLE"])
+    fonts = {key: assets.font(size) for key, size in FONT_SIZES.items()}
+    score_line = TextLine(
+        fonts["score"],
+        WHITE,
+        lambda player_score, computer_score: f"{SETTINGS['LANGUAGE_COPY']['PLAYER_SCORE']}: {player_score}  {SETTINGS['LANGUAGE_COPY']['COMPUTER_SCORE']}: {computer_score}",
+    )
+    stats_line = TextLine(
+        fonts["stats"],
+        WHITE,
+        lambda ball_speed, strike_count: f"{SETTINGS['LANGUAGE_COPY']['BALL_SPEED']}: {ball_speed:.1f}  {SETTINGS['LANGUAGE_COPY']['STRIKES']}: {strike_count}",
+    )
 
 
 def draw_text(text, font_key, color, x, y):
-    surface = fonts[font_key].render(text, True, color)
-    screen.blit(surface, surface.get_rect(center=(x, y)))
-
-
-def reset_game_state():
-    global ball_dx, ball_dy, strike_count, current_ball_speed, player_score, computer_score, longest_rally, game_start_time, last_collision_time
-    ball.center = (WIDTH // 2, HEIGHT // 2)
-    ball_dx = ball_dy = 0
-    strike_count = current_ball_speed = 0
-    player_score = computer_score = longest_rally = 0
-    player_paddle.height = computer_paddle.height = INITIAL_PADDLE_HEIGHT
-    player_paddle.centery = computer_paddle.centery = HEIGHT // 2
-    game_start_time = pygame.time.get_ticks()
-    last_collision_time = 0
-    if SETTINGS["GAME_SETTINGS"]["OBSTACLE"]:
-        global obstacle
-        obstacle = Obstacle(WIDTH, HEIGHT, BALL_RADIUS)
-
-
-def start_ball_movement():
-    global ball_dx, ball_dy, rally_start_time
-    ball_dx = random.choice([-1, 1]) * 5
-    ball_dy = random.choice([-1, 1]) * 5
-    rally_start_time = pygame.time.get_ticks()
-
-
-def move_computer_paddle():
-    move = calculate_computer_move(
-        ball.centery,
-        computer_paddle.centery,
-        computer_paddle.height,
-        HEIGHT,
-        SETTINGS["GAME_SETTINGS"]["COMPUTER_SPEED"],
-        SETTINGS["GAME_SETTINGS"]["COMPUTER_RANDOMNESS"],
-    )
-    computer_paddle.y += move * (SETTINGS["GAME_SETTINGS"]["COMPUTER_SPEED"] / 10)
-    computer_paddle.clamp_ip(screen.get_rect())
-
-
-def update_ball_speed():
-    global ball_dx, ball_dy, current_ball_speed
-    if strike_count % SETTINGS["GAME_SETTINGS"]["BALL_SPEED_TURNS"] == 0:
-        speed_multiplier = 1 + min(
-            SETTINGS["GAME_SETTINGS"]["BALL_SPEED"] / 50,
-            (strike_count // SETTINGS["GAME_SETTINGS"]["BALL_SPEED_TURNS"])
-            * (SETTINGS["GAME_SETTINGS"]["BALL_INCREMENT"] / 100),
-        )
-        ball_dx = abs(ball_dx) / ball_dx * 5 * speed_multiplier
-        ball_dy = abs(ball_dy) / ball_dy * 5 * speed_multiplier
-        current_ball_speed = (abs(ball_dx) + abs(ball_dy)) / 2
+    return draw_surface(text_cache.render(fonts[font_key], text, color), x, y)
 
 
-def show_menu(is_game_over=False, new_record=False):
-    if SETTINGS["GAME_SETTINGS"]["MUSIC_ENABLED"]:
-        intro_music.play(-1)
-    waiting = True
-    gif_frame_index = gif_last_update = 0
-    while waiting:
-        current_time = pygame.time.get_ticks()
-        screen.fill(BLACK)
-        if current_time - gif_last_update > 100:
-            gif_frame_index = (gif_frame_index + 1) % len(gif_frames)
-            gif_last_update = current_time
-        screen.blit(
-            gif_frames[gif_frame_index],
-            ((WIDTH - gif_frames[gif_frame_index].get_width()) // 2, 50),
-        )
+def draw_surface(surface, x, y):
+    return screen.blit(surface, surface.get_rect(center=(x, y)))
+
+
+class MainMenu(Scene):
+    """
+    The splash animation with the start, options and quit choices.
+    """
+
+    def __init__(self, is_game_over, new_record, computer_won):
+        super().__init__(SPLASH_FRAME_MS)
+        self.is_game_over = is_game_over
+        self.new_record = new_record
+        self.computer_won = computer_won
+        self.gif_frames = assets.splash_frames()
+        self.gif_frame_index = 0
 
-        vertical_start = 50 + gif_frames[0].get_height() + 50
-        if is_game_over:
+    def animate(self):
+        self.gif_frame_index = (self.gif_frame_index + 1) % len(self.gif_frames)
+        self.dirty = True
+
+    def draw(self, surface):
+        gif_frame = self.gif_frames[self.gif_frame_index]
+        surface.fill(BLACK)
+        surface.blit(gif_frame, ((WIDTH - gif_frame.get_width()) // 2, 50))
+
+        vertical_start = 50 + self.gif_frames[0].get_height() + 50
+        if self.is_game_over:
             end_message = (
                 SETTINGS["LANGUAGE_COPY"]["COMPUTER_WIN"]
-                if computer_score >= SETTINGS["GAME_SETTINGS"]["WINNING_POINTS"]
+                if self.computer_won
                 else SETTINGS["LANGUAGE_COPY"]["PLAYER_WIN"]
             )
             draw_text(end_message, "main", WHITE, WIDTH // 2, vertical_start)
             vertical_start += 40
-            if new_record:
+            if self.new_record:
                 congrats_text = SETTINGS["LANGUAGE_COPY"]["LONGEST_RALLY_CONGRATS"]
                 text_width, _ = fonts["main"].size(congrats_text)
-                screen.blit(
-                    trophy_image,
+                surface.blit(
+                    assets.trophy_image(),
                     (WIDTH // 2 - text_width // 2 - 40, vertical_start - 15),
                 )
                 draw_text(congrats_text, "main", WHITE, WIDTH // 2, vertical_start)
                 vertical_start += 40
 
-        draw_text(
-            SETTINGS["LANGUAGE_COPY"]["START_GAME"],
-            "main",
-            WHITE,
-            WIDTH // 2,
-            vertical_start,
-        )
-        draw_text(
-            SETTINGS["LANGUAGE_COPY"]["OPTIONS_MENU"],
-            "main",
-            WHITE,
-            WIDTH // 2,
-            vertical_start + 40,
-        )
-        draw_text(
-            SETTINGS["LANGUAGE_COPY"]["QUIT_GAME"],
-            "main",
-            WHITE,
-            WIDTH // 2,
-            vertical_start + 80,
-        )
-
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT or (
-                event.type == pygame.KEYDOWN and event.key == pygame.K_q
-            ):
-                return False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_o:
-                    intro_music.stop()
-                    new_settings = game_options.show_options_menu(screen)
-                    if new_settings:
-                        SETTINGS.update(new_settings)
-                    if SETTINGS["GAME_SETTINGS"]["MUSIC_ENABLED"]:
-                        intro_music.play(-1)
-                else:
-                    waiting = False
-                    intro_music.stop()
-    return True
+        for i, copy_key in enumerate(("START_GAME", "OPTIONS_MENU", "QUIT_GAME")):
+            draw_text(
+                SETTINGS["LANGUAGE_COPY"][copy_key],
+                "main",
+                WHITE,
+                WIDTH // 2,
+                vertical_start + i * 40,
+            )
 
+    def handle_event(self, event):
+        if event.type == pygame.QUIT or (
+            event.type == pygame.KEYDOWN and event.key == pygame.K_q
+        ):
+            self.finish(False)
+        elif event.type == pygame.KEYDOWN:
+            assets.stop_music()
+            if event.key == pygame.K_o:
+                new_settings = game_options.show_options_menu(screen)
+                if new_settings:
+                    SETTINGS.update(new_settings)
+                if SETTINGS["GAME_SETTINGS"]["MUSIC_ENABLED"]:
+                    assets.play_music()
+                self.resume()
+            else:
+                self.finish(True)
+
+
+def show_menu(is_game_over=False, new_record=False, computer_won=False):
+    if SETTINGS["GAME_SETTINGS"]["MUSIC_ENABLED"]:
+        assets.play_music()
+    return MainMenu(is_game_over, new_record, computer_won).run(screen, display.present)
 
-running = True
-clock = pygame.time.Clock()
-game_started = ball_moving = False
-reset_game_state()
 
-while running:
-    if not game_started:
-        game_started = show_menu(
-            player_score > 0 or computer_score > 0,
-            longest_rally > SETTINGS["GAME_STATS"]["LONGEST_RALLY"],
-        )
-        if not game_started:
-            running = False
-        else:
-            reset_game_state()
-            ball_moving = False
+def draw_game(simulation, renderer=None, alpha=1.0, profiler=NULL_PROFILER):
+    profiler.switch("shapes")
+    if renderer:
+        renderer.clear()
     else:
         screen.fill(BLACK)
-        current_time = pygame.time.get_ticks()
-
-        if SETTINGS["GAME_SETTINGS"]["PADDLE_EROSION"]:
-            player_paddle.height = max(
-                INITIAL_PADDLE_HEIGHT
-                - int(PADDLE_SHRINK_RATE * (current_time - game_start_time) // 1000),
-                INITIAL_PADDLE_HEIGHT // 2,
-            )
 
-        if SETTINGS["GAME_SETTINGS"]["OBSTACLE"]:
-            obstacle.draw(screen, WHITE)
-
-        pygame.draw.rect(screen, WHITE, player_paddle)
-        pygame.draw.rect(screen, WHITE, computer_paddle)
-        pygame.draw.ellipse(screen, WHITE, ball)
-
-        draw_text(
-            f"{SETTINGS['LANGUAGE_COPY']['PLAYER_SCORE']}: {player_score}  {SETTINGS['LANGUAGE_COPY']['COMPUTER_SCORE']}: {computer_score}",
-            "score",
-            WHITE,
+    if simulation.obstacles is not None:
+        simulation.obstacles.draw(screen, WHITE)
+
+    ball, player_paddle, computer_paddle = simulation.interpolated_rects(alpha)
+    drawn = [
+        pygame.draw.rect(screen, WHITE, player_paddle),
+        pygame.draw.rect(screen, WHITE, computer_paddle),
+        pygame.draw.ellipse(screen, WHITE, ball),
+    ]
+    if simulation.swarm is not None:
+        drawn += simulation.swarm.draw(screen, WHITE, alpha)
+
+    profiler.switch("text")
+    drawn += [
+        draw_surface(
+            score_line.render(simulation.player_score, simulation.computer_score),
             WIDTH // 2,
             20,
-        )
-        draw_text(
-            f"{SETTINGS['LANGUAGE_COPY']['BALL_SPEED']}: {current_ball_speed:.1f}  {SETTINGS['LANGUAGE_COPY']['STRIKES']}: {strike_count}",
-            "stats",
-            WHITE,
+        ),
+        draw_surface(
+            stats_line.render(simulation.current_ball_speed, simulation.strike_count),
             WIDTH // 2,
             50,
-        )
+        ),
+    ]
 
-        if ball_moving:
-            rally_duration = (current_time - rally_start_time) // 1000
-            longest_rally = max(longest_rally, rally_duration)
-
-            ball.x += ball_dx
-            ball.y += ball_dy
-
-            if SETTINGS["GAME_SETTINGS"]["OBSTACLE"]:
-                collision = obstacle.check_collision(ball)
-                if collision[0]:
-                    if current_time - last_collision_time > COLLISION_COOLDOWN:
-                        ball_dx, ball_dy = obstacle.resolve_collision(
-                            ball, ball_dx, ball_dy
-                        )
-                        random.choice(strike_sounds).play()
-                        last_collision_time = current_time
-
-            if ball.top <= 0 or ball.bottom >= HEIGHT:
-                ball.clamp_ip(screen.get_rect())
-                ball_dy = -ball_dy
-
-            if ball.colliderect(player_paddle) or ball.colliderect(computer_paddle):
-                if current_time - last_collision_time > COLLISION_COOLDOWN:
-                    if ball.colliderect(player_paddle):
-                        ball.right = player_paddle.left
-                    else:
-                        ball.left = computer_paddle.right
-                    ball_dx = -ball_dx
-                    strike_count += 1
-                    random.choice(strike_sounds).play()
-                    update_ball_speed()
-                    last_collision_time = current_time
-
-            if ball.left <= 0 or ball.right >= WIDTH:
-                if ball.left <= 0:
-                    player_score += 1
-                else:
-                    computer_score += 1
-                ball_moving = False
-                ball.center = (WIDTH // 2, HEIGHT // 2)
-                rally_start_time = current_time
-
-            if (
-                player_score >= SETTINGS["GAME_SETTINGS"]["WINNING_POINTS"]
-                or computer_score >= SETTINGS["GAME_SETTINGS"]["WINNING_POINTS"]
-            ):
-                if longest_rally > SETTINGS["GAME_STATS"]["LONGEST_RALLY"]:
-                    SETTINGS["GAME_STATS"]["LONGEST_RALLY"] = longest_rally
-                    game_options.save_settings(SETTINGS)
-                game_started = False
-
-            move_computer_paddle()
-        else:
+    if not simulation.ball_moving:
+        drawn.append(
             draw_text(
                 SETTINGS["LANGUAGE_COPY"]["SERVE_BALL"],
                 "instruction",
@@ -301,6 +176,8 @@ while running:
                 WIDTH // 2,
                 HEIGHT - 50,
             )
+        )
+        drawn.append(
             draw_text(
                 f"{SETTINGS['LANGUAGE_COPY']['QUIT_GAME']}, {SETTINGS['LANGUAGE_COPY']['RESTART_GAME']}",
                 "instruction",
@@ -308,13 +185,89 @@ while running:
                 WIDTH // 2,
                 HEIGHT - 20,
             )
+        )
 
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_UP] and player_paddle.top > 0:
-            player_paddle.y -= 5
-        if keys[pygame.K_DOWN] and player_paddle.bottom < HEIGHT:
-            player_paddle.y += 5
+    if renderer:
+        renderer.add(*drawn)
+
+
+def render_overlay(lines):
+    return [
+        fonts["instruction"].render(line, False, OVERLAY_COLOR, BLACK) for line in lines
+    ]
+
+
+def draw_overlay(surfaces, renderer=None):
+    drawn = [
+        screen.blit(surface, (30, 80 + i * 16)) for i, surface in enumerate(surfaces)
+    ]
+    if renderer:
+        renderer.add(*drawn)
+
+
+def run_game(
+    dirty_rects=False,
+    render_fps=FPS,
+    record_dir=None,
+    profiler=None,
+    governor=None,
+    recorder=None,
+    telemetry=None,
+):
+    if record_dir:
+        from modules.replay import Replay, save_replay
+
+    running = True
+    show_overlay = False
+    overlay = []
+    profiling = profiler is not None
+    if not profiling:
+        profiler = NULL_PROFILER
+    clock = pygame.time.Clock()
+    game_started = False
+    accumulator = 0
+    serve = False
+    new_record = False
+    replay = None
+    simulation = PongSimulation(SETTINGS["GAME_SETTINGS"])
+    renderer = (
+        DirtyRectRenderer(screen, BLACK, display.present) if dirty_rects else None
+    )
+    if governor is not None:
+        render_fps = governor.fps
+        if profiling:
+            profiler.frame_budget_ms = 1000 / render_fps
 
+    while running:
+        if not game_started:
+            game_started = show_menu(
+                simulation.player_score > 0 or simulation.computer_score > 0,
+                new_record,
+                simulation.computer_score
+                >= SETTINGS["GAME_SETTINGS"]["WINNING_POINTS"],
+            )
+            if not game_started:
+                running = False
+            else:
+                if record_dir:
+                    replay = Replay.new(SETTINGS["GAME_SETTINGS"])
+                    simulation = replay.simulation()
+                else:
+                    simulation = PongSimulation(SETTINGS["GAME_SETTINGS"])
+                profiler.instrument(simulation)
+                if telemetry is not None:
+                    telemetry.start_match(simulation)
+                # Decoded before the first hit rather than during it
+                assets.strike_sounds()
+                if renderer:
+                    renderer.invalidate()
+                clock.tick()
+                profiler.discard_frame()
+                accumulator = 0
+                serve = False
+            continue
+
+        restart = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -322,13 +275,508 @@ while running:
                 if event.key == pygame.K_q:
                     running = False
                 elif event.key == pygame.K_r:
-                    reset_game_state()
-                    ball_moving = False
-                elif not ball_moving:
-                    start_ball_movement()
-                    ball_moving = True
+                    restart = True
+                elif event.key == pygame.K_F3 and profiling:
+                    show_overlay = not show_overlay
+                    if renderer:
+                        renderer.invalidate()
+                else:
+                    serve = True
+
+        # Physics runs in fixed FRAME_MS steps however fast frames are drawn
+        keys = pygame.key.get_pressed()
+        events = []
+        steps = 0
+        while accumulator >= FRAME_MS and steps < MAX_STEPS_PER_FRAME:
+            player_input = PlayerInput(
+                up=keys[pygame.K_UP], down=keys[pygame.K_DOWN], serve=serve
+            )
+            if replay is not None:
+                replay.record(player_input)
+            step_start = time.perf_counter()
+            step_events = simulation.step(player_input)
+            # Played straight away rather than after catching up on every step
+            if "strike" in step_events or "obstacle" in step_events:
+                audio_engine.play_strike(step_start)
+            if telemetry is not None and step_events:
+                telemetry.record(simulation, step_events)
+            events += step_events
+            serve = False
+            accumulator -= FRAME_MS
+            steps += 1
+        accumulator = min(accumulator, FRAME_MS)
+
+        if "game_over" in events:
+            # Both are written in the background, so the last frame isn't held up
+            new_record = game_options.update_game_stats(
+                "LONGEST_RALLY", simulation.longest_rally
+            )
+            if new_record:
+                SETTINGS["GAME_STATS"]["LONGEST_RALLY"] = simulation.longest_rally
+            settings_store.get_store().record_match(
+                simulation.player_score,
+                simulation.computer_score,
+                simulation.strike_count,
+                simulation.longest_rally,
+                simulation.time / 1000,
+                SETTINGS["GAME_SETTINGS"],
+            )
+            game_started = False
+        if replay is not None and (not game_started or not running):
+            save_replay(replay, record_dir)
+            replay = None
+        if restart:
+            simulation.reset()
+            if replay is not None:
+                replay.restart()
+            if telemetry is not None:
+                telemetry.start_match(simulation)
+            if renderer:
+                renderer.invalidate()
+
+        draw_game(simulation, renderer, accumulator / FRAME_MS, profiler)
+        if show_overlay:
+            profiler.switch("overlay")
+            # Summarizing every frame would cost more than most phases it measures
+            if len(profiler) % OVERLAY_REFRESH_FRAMES == 0 or not overlay:
+                lines = profiler.overlay_lines() + audio_engine.overlay_lines()
+                if recorder is not None:
+                    lines += recorder.overlay_lines()
+                overlay = render_overlay(lines)
+            draw_overlay(overlay, renderer)
+        profiler.switch("flip")
+        if recorder is not None:
+            recorder.capture(screen)
+        if renderer:
+            renderer.update()
+        else:
+            display.present()
+        profiler.switch("idle")
+        accumulator += clock.tick(render_fps)
+        if governor is not None and governor.record(clock.get_rawtime()):
+            render_fps = governor.fps
+            # Frames only count as dropped against the rate being aimed for
+            if profiling:
+                profiler.frame_budget_ms = 1000 / render_fps
+        profiler.end_frame()
+
+
+def play_replay(replay, dirty_rects=False, render_fps=FPS, speed=1, recorder=None):
+    """
+    Show a recorded match, stepping it speed times faster than it was played.
+    """
+    clock = pygame.time.Clock()
+    simulation = replay.simulation()
+    renderer = (
+        DirtyRectRenderer(screen, BLACK, display.present) if dirty_rects else None
+    )
+    accumulator = 0
+    step = 0
+    while step < len(replay):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (
+                event.type == pygame.KEYDOWN and event.key == pygame.K_q
+            ):
+                return
+
+        events = []
+        while accumulator >= FRAME_MS / speed and step < len(replay):
+            events += replay.play_step(simulation, step)
+            accumulator -= FRAME_MS / speed
+            step += 1
+        accumulator = min(accumulator, FRAME_MS)
+
+        if "strike" in events or "obstacle" in events:
+            audio_engine.play_strike()
+        if renderer and "restart" in events:
+            renderer.invalidate()
+
+        draw_game(simulation, renderer, min(accumulator * speed / FRAME_MS, 1.0))
+        if recorder is not None:
+            recorder.capture(screen)
+        if renderer:
+            renderer.update()
+        else:
+            display.present()
+        accumulator += clock.tick(render_fps)
+
+
+def draw_message(text):
+    screen.fill(BLACK)
+    draw_text(text, "main", WHITE, WIDTH // 2, HEIGHT // 2)
+    display.present()
+
+
+def quit_requested():
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT or (
+            event.type == pygame.KEYDOWN and event.key == pygame.K_q
+        ):
+            return True
+    return False
+
+
+async def wait_for_connection(connect, message):
+    """
+    Keep the window responsive while a session connects.
+
+    :return: False if the player gave up first or the connection failed
+    """
+    import asyncio
+
+    task = asyncio.ensure_future(connect)
+    while not task.done():
+        draw_message(message)
+        if quit_requested():
+            task.cancel()
+            return False
+        await asyncio.sleep(0.05)
+    try:
+        task.result()
+    except OSError as e:
+        # No answer, a host name that won't resolve or a port in use
+        print(f"Could not connect: {e}")
+        draw_message(SETTINGS["LANGUAGE_COPY"]["NETWORK_LOST"])
+        await asyncio.sleep(2)
+        return False
+    return True
+
+
+async def run_network_game(session, dirty_rects=False, render_fps=FPS):
+    """
+    Play a match against a remote player once the session is connected.
+
+    The host plays the right paddle and runs the real game; the client plays the
+    left paddle, which it moves as soon as a key is pressed instead of waiting
+    for the host's reply.
+    """
+    import asyncio
+    from modules.network import HostSession
+
+    simulation = session.simulation
+    hosting = isinstance(session, HostSession)
+    renderer = (
+        DirtyRectRenderer(screen, BLACK, display.present) if dirty_rects else None
+    )
+    accumulator = 0
+    serve = False
+    last_time = time.perf_counter()
+    while not simulation.game_over:
+        if session.timed_out or session.failed:
+            draw_message(SETTINGS["LANGUAGE_COPY"]["NETWORK_LOST"])
+            await asyncio.sleep(2)
+            return
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_q:
+                    return
+                serve = True
+
+        now = time.perf_counter()
+        accumulator += (now - last_time) * 1000
+        last_time = now
+        keys = pygame.key.get_pressed()
+        events = []
+        steps = 0
+        while accumulator >= FRAME_MS and steps < MAX_STEPS_PER_FRAME:
+            events += session.step(
+                PlayerInput(up=keys[pygame.K_UP], down=keys[pygame.K_DOWN], serve=serve)
+            )
+            serve = False
+            accumulator -= FRAME_MS
+            steps += 1
+        accumulator = min(accumulator, FRAME_MS)
+
+        if "strike" in events or "obstacle" in events:
+            audio_engine.play_strike()
+
+        # The client shows the host's states as they arrive rather than blending
+        draw_game(simulation, renderer, accumulator / FRAME_MS if hosting else 1.0)
+        if renderer:
+            renderer.update()
+        else:
+            display.present()
+        # Sleeping in the event loop lets packets be handled the moment they land
+        await asyncio.sleep(max(0, 1 / render_fps - (time.perf_counter() - now)))
+
+    draw_message(SETTINGS["LANGUAGE_COPY"]["NETWORK_GAME_OVER"])
+    if hosting:
+        await session.finish()
+    await asyncio.sleep(2)
+
+
+async def play_network(host, port, conditions=None, dirty_rects=False, render_fps=FPS):
+    """
+    Host a match when host is None, otherwise join the one running on host.
+
+    :return: False if no match was played because the connection failed
+    """
+    from modules.network import HostSession, ClientSession
+
+    if host is None:
+        session = HostSession(SETTINGS["GAME_SETTINGS"], port, conditions)
+        message = SETTINGS["LANGUAGE_COPY"]["NETWORK_WAITING"].format(port=port)
+    else:
+        session = ClientSession(host, port, conditions)
+        message = SETTINGS["LANGUAGE_COPY"]["NETWORK_CONNECTING"].format(host=host)
+    try:
+        if not await wait_for_connection(session.start(), message):
+            return False
+        await run_network_game(session, dirty_rects, render_fps)
+        return True
+    finally:
+        session.close()
+
+
+def start_capture(args):
+    if not args.capture:
+        return None
+    from modules.capture import (
+        FrameRecorder,
+        CAPTURE_FPS,
+        CAPTURE_SCALE,
+        CLIP_SECONDS,
+    )
+
+    return FrameRecorder(
+        args.capture,
+        args.capture_fps or CAPTURE_FPS,
+        args.capture_scale or CAPTURE_SCALE,
+        clip_seconds=args.capture_seconds or CLIP_SECONDS,
+    )
+
+
+def finish_capture(recorder):
+    if recorder is None:
+        return
+    stats = recorder.close()
+    print(
+        f"Captured {stats['encoded']} frames to {recorder.path}, "
+        f"{stats['skipped']} skipped and {stats['dropped']} dropped under load"
+    )
+    if stats["trimmed"]:
+        print(f"Kept the last {stats['encoded'] - stats['trimmed']} frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pong")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="run matches without a display, as fast as possible",
+    )
+    parser.add_argument(
+        "--matches", type=int, default=1, help="number of headless matches to play"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="play headless matches on the vectorized batch simulator",
+    )
+    parser.add_argument(
+        "--dirty-rects",
+        action="store_true",
+        help="only redraw and push the parts of the screen that change",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=FPS,
+        help="frames drawn per second; physics always steps at 60 per second",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        metavar="N",
+        help="print the last N recorded matches and exit",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="save a replay of every match into DIR",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="play back a recorded match; add --headless to fast-forward it",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="playback speed of --replay relative to real time",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="PATH",
+        help="record the game or --replay as a .gif/.webp/.png animation, "
+        "or as PNG frames in a directory",
+    )
+    parser.add_argument(
+        "--capture-fps",
+        type=int,
+        help="frames per second to capture at most",
+    )
+    parser.add_argument(
+        "--capture-scale",
+        type=float,
+        help="size of the capture relative to the screen",
+    )
+    parser.add_argument(
+        "--capture-seconds",
+        type=float,
+        help="how many of the last seconds a .gif/.webp/.png capture keeps "
+        "(default: 15)",
+    )
+    parser.add_argument(
+        "--telemetry",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="append every serve, strike, point and result to FILE "
+        "(default: telemetry.ndjson)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time every phase of each frame; F3 toggles the overlay",
+    )
+    parser.add_argument(
+        "--profile-out",
+        metavar="FILE",
+        help="write per-frame timings to a .csv or .json file as the game runs",
+    )
+    parser.add_argument(
+        "--host",
+        action="store_true",
+        help="wait for a second player to join over the network",
+    )
+    parser.add_argument(
+        "--join",
+        metavar="HOST",
+        help="play against the player hosting on HOST",
+    )
+    parser.add_argument("--port", type=int, help="UDP port for --host/--join")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="simulated one-way network latency in ms, for testing",
+    )
+    parser.add_argument(
+        "--loss",
+        type=float,
+        default=0,
+        help="simulated fraction of lost packets, for testing",
+    )
+    parser.add_argument(
+        "--audio-buffer",
+        type=int,
+        default=MIXER_BUFFER,
+        help="mixer buffer in samples; smaller plays hits sooner but may crackle",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="lower the frame rate when frames run late, raise it again once "
+        "they have time to spare",
+    )
+    parser.add_argument(
+        "--fullscreen", action="store_true", help="scale the game to the whole screen"
+    )
+    parser.add_argument(
+        "--arena",
+        metavar="NAME",
+        help="play among the obstacles of a shipped arena or an arena file",
+    )
+    args = parser.parse_args()
+    if args.arena:
+        SETTINGS["GAME_SETTINGS"]["ARENA"] = args.arena
+        SETTINGS["GAME_SETTINGS"]["OBSTACLE"] = True
+
+    if args.replay:
+        from modules.replay import Replay, fast_forward
+
+        replay = Replay.load(args.replay)
+        if args.headless:
+            for key, value in fast_forward(replay).items():
+                print(f"{key}: {value}")
+            return
+        load_assets(args.audio_buffer, args.fullscreen)
+        recorder = start_capture(args)
+        play_replay(replay, args.dirty_rects, args.fps, args.speed, recorder)
+        finish_capture(recorder)
+        pygame.quit()
+        return
+
+    if args.history:
+        for match in settings_store.get_store().history(args.history):
+            print(
+                f"{match['player_score']}-{match['computer_score']}, "
+                f"{match['strikes']} strikes, "
+                f"longest rally {match['longest_rally']}s, "
+                f"{match['duration']:.0f}s"
+            )
+        return
+
+    if args.headless:
+        if args.batch:
+            from modules.batch_simulation import run_batch
+
+            summary = run_batch(SETTINGS["GAME_SETTINGS"], args.matches)
+        else:
+            summary = run_headless(SETTINGS["GAME_SETTINGS"], args.matches)
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+        return
+
+    load_assets(args.audio_buffer, args.fullscreen)
+    if args.host or args.join:
+        import asyncio
+        from modules.network import NetworkConditions, DEFAULT_PORT
+
+        conditions = NetworkConditions(args.latency, loss=args.loss)
+        if asyncio.run(
+            play_network(
+                args.join,
+                args.port or DEFAULT_PORT,
+                conditions,
+                args.dirty_rects,
+                args.fps,
+            )
+        ):
+            pygame.quit()
+            return
+        # Without a connection, fall back to the menu of a local game
+
+    governor = FrameGovernor(max_fps=args.fps) if args.adaptive else None
+    profiler = None
+    if args.profile or args.profile_out:
+        profiler = FrameProfiler(1000 / args.fps, args.profile_out)
+    recorder = start_capture(args)
+    telemetry = None
+    if args.telemetry is not None:
+        from modules.telemetry import Telemetry, TELEMETRY_PATH
+
+        telemetry = Telemetry(args.telemetry or TELEMETRY_PATH)
+    run_game(
+        args.dirty_rects,
+        args.fps,
+        args.record,
+        profiler,
+        governor,
+        recorder,
+        telemetry,
+    )
+    finish_capture(recorder)
+    if telemetry is not None:
+        telemetry.close()
+    if profiler is not None:
+        profiler.close()
+    pygame.quit()
 
-        pygame.display.flip()
-        clock.tick(60)
 
-pygame.quit()
+if __name__ == "__main__":
+    main()